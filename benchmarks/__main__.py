@@ -0,0 +1,63 @@
+"""
+Offline benchmarks of the runners, the PDF loader, the schemas and the API, against a fake LLM and a fake browser.
+
+    python -m benchmarks                          # everything
+    python -m benchmarks runner api --latency 0.2 # the scenarios matching 'runner' or 'api'
+    python -m benchmarks --json results.json      # keep the results
+    python -m benchmarks --baseline results.json  # exit 1 on a regression against kept results
+"""
+import sys
+import json
+import argparse
+from contextlib import redirect_stdout
+
+from benchmarks.harness import compare, format_table
+from benchmarks.scenarios import Options, SAMPLE_PDF, SCENARIOS, select
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('scenarios', nargs='*', help=f'substrings of the scenarios to run: {", ".join(SCENARIOS)}')
+    parser.add_argument('--iterations', type=int, default=20, help='operations per scenario (x5 / x10 for the fast ones, /5 for the pdf)')
+    parser.add_argument('--concurrency', type=int, default=8, help='operations at once in the concurrent scenarios')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds of a fake LLM call')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random extra seconds of a fake LLM call (seeded)')
+    parser.add_argument('--browser-latency', type=float, default=0.2, help='seconds of a fake page capture')
+    parser.add_argument('--urls', type=int, default=4, help='competitors found by the fake LLM')
+    parser.add_argument('--pdf', default=SAMPLE_PDF, help='pdf of the loader benchmark')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc run of every scenario')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='results of a previous --json run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='relative change counted as a regression')
+    args = parser.parse_args(argv)
+
+    names = select(args.scenarios)
+    if not names:
+        parser.error(f'no scenario matches {args.scenarios}')
+    options = Options(args.iterations, args.concurrency, args.latency, args.jitter, args.browser_latency,
+                      args.urls, args.pdf, not args.no_memory)
+
+    summaries = []
+    for name in names:
+        print(f'running {name}...', file=sys.stderr)
+        # the runners and the jobs print as they go, stdout is kept for the results
+        with redirect_stdout(sys.stderr):
+            summaries.append(SCENARIOS[name](options).summary())
+    print(format_table(summaries))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summaries, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(summaries, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
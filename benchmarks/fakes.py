@@ -0,0 +1,174 @@
+import time
+import random
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Type, Union, get_args, get_origin
+
+import cv2
+import numpy as np
+from pydantic import BaseModel
+from langchain_core.runnables import RunnableLambda
+
+
+def fake_value(annotation: Any, name: str, items: int = 3) -> Any:
+    """Deterministic value of a field annotation: strings, lists, dicts and nested models"""
+    origin = get_origin(annotation)
+    if origin is Union:
+        # Optional[X] is filled as X
+        return fake_value(next(arg for arg in get_args(annotation) if arg is not type(None)), name, items)
+    if origin in (list, List):
+        return [fake_value(get_args(annotation)[0], f'{name} {i + 1}', items) for i in range(items)]
+    if origin in (dict, Dict):
+        return {f'{name} {i + 1}': fake_value(get_args(annotation)[1], f'{name} {i + 1}', items) for i in range(items)}
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return fake_response(annotation, items)
+    if annotation is int:
+        return len(name)
+    if annotation is float:
+        return float(len(name))
+    if annotation is bool:
+        return True
+    return f'{name} filled by the fake model'
+
+
+def fake_response(schema: Type[BaseModel], items: int = 3, urls: Optional[List[str]] = None) -> BaseModel:
+    values = {name: fake_value(field.annotation, name, items) for name, field in schema.model_fields.items()}
+    # the runners go on with the urls (e.g. the competitors of CompanyResearchRunner)
+    if 'url_list' in values and urls is not None:
+        values['url_list'] = list(urls)
+    return schema(**values)
+
+
+class FakeChatModel:
+    """
+    Deterministic stand-in for a chat model, no network involved, shared by the benchmarks and the unit tests.
+    with_structured_output returns a runnable which waits `latency` seconds (or latency(schema, messages),
+    plus a seeded random `jitter`) and builds the schema with respond(schema, messages), fake_response by default.
+    invoke sleeps the thread, ainvoke sleeps on the loop.
+    Calls (schema, messages) and the peak number of calls in flight are recorded.
+    """
+
+    def __init__(self, respond: Optional[Callable[[Type[BaseModel], Any], BaseModel]] = None,
+                 latency: Union[float, Callable[[Type[BaseModel], Any], float]] = 0.05, jitter: float = 0.0,
+                 items: int = 3, urls: Optional[List[str]] = None, seed: int = 0):
+        self.respond = respond or (lambda schema, messages: fake_response(schema, items, urls))
+        self.latency = latency
+        self.jitter = jitter
+        self.model_name = 'fake-model'
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _start(self, schema: Type[BaseModel], messages) -> float:
+        latency = self.latency(schema, messages) if callable(self.latency) else self.latency
+        with self._lock:
+            self.calls.append((schema, messages))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            return latency + self._random.uniform(0, self.jitter)
+
+    def _done(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _invoke(self, schema: Type[BaseModel], messages) -> BaseModel:
+        latency = self._start(schema, messages)
+        try:
+            time.sleep(latency)
+            return self.respond(schema, messages)
+        finally:
+            self._done()
+
+    async def _ainvoke(self, schema: Type[BaseModel], messages) -> BaseModel:
+        latency = self._start(schema, messages)
+        try:
+            await asyncio.sleep(latency)
+            return self.respond(schema, messages)
+        finally:
+            self._done()
+
+    def with_structured_output(self, schema: Type[BaseModel]):
+        return RunnableLambda(lambda messages: self._invoke(schema, messages),
+                              afunc=lambda messages: self._ainvoke(schema, messages))
+
+
+def fake_screenshot(width: int = 1280, height: int = 4000, seed: int = 0) -> bytes:
+    """Png of a full page screenshot: flat bands like a web page with some noise, so it compresses like one"""
+    rng = np.random.default_rng(seed)
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    for top in range(0, height, 200):
+        image[top: top + 200] = rng.integers(0, 256, 3, dtype=np.uint8)
+    image[rng.random((height, width)) < 0.02] = 0
+    ok, buffer = cv2.imencode('.png', image)
+    if not ok:
+        raise ValueError('Could not encode the fake screenshot')
+    return buffer.tobytes()
+
+
+class FakeBrowserPool:
+    """
+    Stand-in for core.browser.BrowserPool: every capture waits `latency` seconds in a tab
+    (at most max_tabs at once) and returns the same fake screenshot, encoded once.
+    """
+
+    def __init__(self, max_tabs: int = 4, page_timeout: float = 30, latency: float = 0.2,
+                 screenshot: Optional[bytes] = None, **kwargs):
+        self.max_tabs = max_tabs
+        self.page_timeout = page_timeout
+        self.latency = latency
+        self.screenshot = screenshot if screenshot is not None else fake_screenshot()
+        self._tabs = None
+
+    async def start(self):
+        if self._tabs is None:
+            self._tabs = asyncio.Semaphore(self.max_tabs)
+        return self
+
+    def stop(self):
+        self._tabs = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.stop()
+
+    async def capture(self, url: str) -> Optional[bytes]:
+        await self.start()
+        async with self._tabs:
+            await asyncio.sleep(self.latency)
+            return self.screenshot
+
+    async def capture_all(self, urls: List[str]) -> List[Optional[bytes]]:
+        return await asyncio.gather(*(self.capture(url) for url in urls))
+
+
+@contextmanager
+def fake_browser(latency: float = 0.2, screenshot: Optional[bytes] = None):
+    """CompanyResearchRunner captures the competitors' sites with FakeBrowserPool inside the block"""
+    from runners.company_research import runner
+
+    screenshot = screenshot if screenshot is not None else fake_screenshot()
+    with patched(runner, BrowserPool=lambda **kwargs: FakeBrowserPool(latency=latency, screenshot=screenshot, **kwargs)):
+        yield
+
+
+@contextmanager
+def patched(target: Any, **attributes):
+    """Set attributes of a module / object inside the block, the old values are put back after"""
+    missing = object()
+    originals = {name: getattr(target, name, missing) for name in attributes}
+    for name, value in attributes.items():
+        setattr(target, name, value)
+    try:
+        yield
+    finally:
+        for name, value in originals.items():
+            if value is missing:
+                delattr(target, name)
+            else:
+                setattr(target, name, value)
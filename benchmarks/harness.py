@@ -0,0 +1,149 @@
+import time
+import math
+import asyncio
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile, q in [0, 100]"""
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+class BenchResult:
+    """Latencies (seconds) of the operations of a benchmark, its wall time and the peak memory of one operation"""
+
+    def __init__(self, name: str, latencies: List[float], wall: float, concurrency: int, peak_bytes: Optional[int] = None):
+        self.name = name
+        self.latencies = latencies
+        self.wall = wall
+        self.concurrency = concurrency
+        self.peak_bytes = peak_bytes
+
+    @property
+    def throughput(self) -> float:
+        """Operations per second, all the concurrent ones included"""
+        return len(self.latencies) / self.wall if self.wall else float('nan')
+
+    def summary(self) -> Dict[str, Any]:
+        summary = {
+            'name': self.name,
+            'ops': len(self.latencies),
+            'concurrency': self.concurrency,
+            'mean_ms': 1000 * sum(self.latencies) / len(self.latencies) if self.latencies else float('nan'),
+            **{f'p{q}_ms': 1000 * percentile(self.latencies, q) for q in PERCENTILES},
+            'max_ms': 1000 * max(self.latencies) if self.latencies else float('nan'),
+            'throughput': self.throughput,
+        }
+        summary['peak_mb'] = self.peak_bytes / 1024 / 1024 if self.peak_bytes is not None else None
+        return summary
+
+
+def _timed(fn: Callable[[], Any]) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+async def _atimed(fn: Callable[[], Awaitable[Any]]) -> float:
+    start = time.perf_counter()
+    await fn()
+    return time.perf_counter() - start
+
+
+def peak_memory(fn: Callable[[], Any]) -> int:
+    """Peak of the python allocations made while fn runs, in bytes"""
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] - base
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+
+def bench(name: str, fn: Callable[[], Any], iterations: int = 20, concurrency: int = 1, warmup: int = 1,
+          memory: bool = True) -> BenchResult:
+    """
+    Run fn `iterations` times, `concurrency` of them at once on threads.
+    tracemalloc slows everything down, so the peak memory is measured by one more run of its own.
+    """
+    for _ in range(warmup):
+        fn()
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        latencies = [_timed(fn) for _ in range(iterations)]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(lambda _: _timed(fn), range(iterations)))
+    wall = time.perf_counter() - start
+
+    return BenchResult(name, latencies, wall, concurrency, peak_memory(fn) if memory else None)
+
+
+def abench(name: str, fn: Callable[[], Awaitable[Any]], iterations: int = 20, concurrency: int = 1, warmup: int = 1,
+           memory: bool = True) -> BenchResult:
+    """bench for coroutines: `concurrency` of them at once on one event loop"""
+
+    async def main():
+        for _ in range(warmup):
+            await fn()
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with semaphore:
+                return await _atimed(fn)
+
+        start = time.perf_counter()
+        latencies = list(await asyncio.gather(*(one() for _ in range(iterations))))
+        return latencies, time.perf_counter() - start
+
+    latencies, wall = asyncio.run(main())
+    return BenchResult(name, latencies, wall, concurrency, peak_memory(lambda: asyncio.run(fn())) if memory else None)
+
+
+def format_table(summaries: List[Dict[str, Any]]) -> str:
+    columns = ['name', 'ops', 'concurrency', 'mean_ms', *[f'p{q}_ms' for q in PERCENTILES], 'max_ms', 'throughput', 'peak_mb']
+    rows = [[_format(summary.get(column)) for column in columns] for summary in summaries]
+    widths = [max(len(column), *(len(row[i]) for row in rows)) for i, column in enumerate(columns)]
+    lines = ['  '.join(column.ljust(width) for column, width in zip(columns, widths))]
+    lines += ['  '.join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows]
+    return '\n'.join(lines)
+
+
+def _format(value: Any) -> str:
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return f'{value:.2f}'
+    return str(value)
+
+
+def compare(summaries: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float = 0.2) -> List[str]:
+    """Regressions against a baseline run: p50 latency or peak memory up, or throughput down, by more than tolerance"""
+    previous = {summary['name']: summary for summary in baseline}
+    regressions = []
+    for summary in summaries:
+        old = previous.get(summary['name'])
+        if old is None:
+            continue
+        for key, higher_is_worse in (('p50_ms', True), ('peak_mb', True), ('throughput', False)):
+            new_value, old_value = summary.get(key), old.get(key)
+            if not new_value or not old_value:
+                continue
+            change = (new_value - old_value) / old_value
+            if (change if higher_is_worse else -change) > tolerance:
+                regressions.append(f"{summary['name']}: {key} {old_value:.2f} -> {new_value:.2f} ({change:+.0%})")
+    return regressions
@@ -0,0 +1,213 @@
+import time
+import tempfile
+import itertools
+from pathlib import Path
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Dict, List
+
+from benchmarks.fakes import FakeChatModel, fake_browser, fake_response, fake_screenshot, patched
+from benchmarks.harness import BenchResult, abench, bench
+
+SAMPLE_PDF = str(Path(__file__).parent.parent / 'tests' / 'fixtures' / 'sample.pdf')
+
+PROMPTS = {'system_prompt': 'Research {company_name} with the document', 'no_pdf_system_prompt': 'Research {company_name}'}
+
+# board schema as the plugin sends it to /send_job
+BOARD_SCHEMA = {
+    'Values': {'type': 'Sticker', 'description': 'Find values of {company_name}'},
+    'Use_cases': {'type': 'Stickers Column', 'description': 'Find the use cases of {company_name}'},
+    'General': {'type': 'Table', 'reference_field': 'Company', 'reference_items': ['xAI', 'Anthropic', 'OpenAI'],
+                'columns': {'USP': 'Find USP', 'Values': 'Find Values', 'Revenue': 'Find Revenue'}},
+    'url_list': {'type': 'Stickers Column', 'description': 'Find the competitors of {company_name}'},
+}
+
+
+class Options:
+    """Knobs of a benchmark run, see python -m benchmarks --help"""
+
+    def __init__(self, iterations: int = 20, concurrency: int = 8, latency: float = 0.05, jitter: float = 0.0,
+                 browser_latency: float = 0.2, urls: int = 4, pdf: str = SAMPLE_PDF, memory: bool = True):
+        self.iterations = iterations
+        self.concurrency = concurrency
+        self.latency = latency
+        self.jitter = jitter
+        self.browser_latency = browser_latency
+        self.urls = [f'competitor-{i + 1}.example' for i in range(urls)]
+        self.pdf = pdf
+        self.memory = memory
+
+    def model(self) -> FakeChatModel:
+        return FakeChatModel(latency=self.latency, jitter=self.jitter, urls=self.urls)
+
+
+def make_runner(model, runner_class=None, **kwargs):
+    from core.base_runner import BaseRunner
+    from runners.company_research.models import MarketResearch
+
+    return (runner_class or BaseRunner)(model, MarketResearch, PROMPTS, lambda path: '',
+                                        {'company_name': 'BPH'}, dump_results=False, **kwargs)
+
+
+# ============================================================================
+# RUNNERS
+# ============================================================================
+
+def runner_run(options: Options) -> BenchResult:
+    """BaseRunner.run end to end, one structured call"""
+    model = options.model()
+    return bench('runner.run', lambda: make_runner(model).run(), options.iterations, memory=options.memory)
+
+
+def runner_run_field_groups(options: Options) -> BenchResult:
+    """BaseRunner.run with the schema split in 3 concurrent calls"""
+    model = options.model()
+    return bench('runner.run[field_groups=3]', lambda: make_runner(model, field_groups=3).run(),
+                 options.iterations, memory=options.memory)
+
+
+def runner_arun_concurrent(options: Options) -> BenchResult:
+    """Many BaseRunner.arun on one loop, like the jobs of the server"""
+    model = options.model()
+    return abench('runner.arun', lambda: make_runner(model, field_groups=3).arun(), options.iterations,
+                  options.concurrency, memory=options.memory)
+
+
+def company_research_runner(options: Options):
+    from runners.company_research.runner import CompanyResearchRunner
+    from runners.company_research.models import MarketResearch
+
+    runner = make_runner(options.model(), CompanyResearchRunner, on_messages=lambda messages: None)
+    runner.llm_response = fake_response(MarketResearch, urls=options.urls)
+    return runner
+
+
+def hook_after(options: Options) -> BenchResult:
+    """CompanyResearchRunner.hook_after: competitor tables (LLM) and screenshots (browser, tiles) of the urls"""
+    screenshot = fake_screenshot()
+    with fake_browser(options.browser_latency, screenshot):
+        return bench('company_research.hook_after', lambda: company_research_runner(options).hook_after(),
+                     options.iterations, memory=options.memory)
+
+
+def ahook_after(options: Options) -> BenchResult:
+    """CompanyResearchRunner.ahook_after, the async path of the server jobs"""
+    screenshot = fake_screenshot()
+    with fake_browser(options.browser_latency, screenshot):
+        return abench('company_research.ahook_after', lambda: company_research_runner(options).ahook_after(),
+                      options.iterations, memory=options.memory)
+
+
+# ============================================================================
+# PDF AND SCHEMAS
+# ============================================================================
+
+def pdf_plumber(options: Options) -> BenchResult:
+    """get_pdf_plumber_message of the pdf, no cache involved"""
+    from core.loaders import get_pdf_plumber_message
+
+    # seconds per call for a real document
+    return bench('pdf.get_pdf_plumber_message', lambda: get_pdf_plumber_message(options.pdf),
+                 max(options.iterations // 5, 1), memory=options.memory)
+
+
+def restore_schema_cold(options: Options) -> BenchResult:
+    """restore_pydantic_schema of a schema never seen: the model is built"""
+    from server.main import restore_pydantic_schema
+
+    names = (f'ResponseSchema{i}' for i in itertools.count())
+    return bench('schema.restore[cold]', lambda: restore_pydantic_schema(BOARD_SCHEMA, next(names)),
+                 options.iterations * 10, memory=options.memory)
+
+
+def restore_schema_warm(options: Options) -> BenchResult:
+    """restore_pydantic_schema of the same schema again: served from the memo"""
+    from server.main import restore_pydantic_schema
+
+    return bench('schema.restore[warm]', lambda: restore_pydantic_schema(BOARD_SCHEMA),
+                 options.iterations * 10, memory=options.memory)
+
+
+# ============================================================================
+# API
+# ============================================================================
+
+@contextmanager
+def api_client(options: Options):
+    """TestClient of the app on fresh state in a temporary directory, jobs use the fake model and browser"""
+    from fastapi.testclient import TestClient
+    import server.main as server
+    from core.blobs import BlobStore
+    from core.dumps import DumpWriter
+    from server.jobs import InMemoryJobStore
+    from server.queues import LocalMessageQueue
+
+    model = options.model()
+    with ExitStack() as stack:
+        tmp = Path(stack.enter_context(tempfile.TemporaryDirectory()))
+        stack.enter_context(patched(server, blob_store=BlobStore(str(tmp / 'blobs')),
+                                    queues=LocalMessageQueue(spill_dir=str(tmp / 'spill')),
+                                    jobs=InMemoryJobStore(), dump_writer=DumpWriter(str(tmp / 'dumps'))))
+        stack.enter_context(patched(server.client_pool, get_chat_model=lambda *args: model))
+        stack.enter_context(fake_browser(options.browser_latency))
+        yield stack.enter_context(TestClient(server.app))
+
+
+def push_batch_poll(options: Options) -> BenchResult:
+    """POST /push_batch of 50 messages then GET /poll of them"""
+    batch = [{'type': 'addSticker', 'topicTitle': 'General', 'content': f'sticker {i}'} for i in range(50)]
+
+    def cycle(client):
+        client.post('/push_batch', json=batch).raise_for_status()
+        assert len(client.get('/poll', params={'limit': 50}).json()) == 50
+
+    with api_client(options) as client:
+        return bench('api.push_batch+poll', lambda: cycle(client), options.iterations * 5, memory=options.memory)
+
+
+def status(options: Options) -> BenchResult:
+    """GET /status"""
+    with api_client(options) as client:
+        return bench('api.status', lambda: client.get('/status').raise_for_status(), options.iterations * 5,
+                     memory=options.memory)
+
+
+def send_job(options: Options) -> BenchResult:
+    """POST /send_job then GET /get_results until the job is completed, `concurrency` clients at once"""
+    request = {
+        'schema': BOARD_SCHEMA, 'runner': 'company_research', 'prompt': 'Research {company_name}',
+        'pipeline_vars': {'company_name': 'BPH'},
+        'llm_config': {'model_name': 'fake', 'api_key': 'fake', 'model_provider_url': 'http://fake', 'temperature': '0'},
+    }
+
+    def job(client):
+        job_id = client.post('/send_job', json=request).json()['job_id']
+        while True:
+            result = client.get(f'/get_results/{job_id}').json()
+            if result['status'] in ('completed', 'failed'):
+                assert result['status'] == 'completed', result['error']
+                return
+            time.sleep(0.01)
+
+    with api_client(options) as client:
+        return bench('api.send_job', lambda: job(client), options.iterations, options.concurrency,
+                     memory=options.memory)
+
+
+SCENARIOS: Dict[str, Callable[[Options], BenchResult]] = {
+    'runner.run': runner_run,
+    'runner.run[field_groups=3]': runner_run_field_groups,
+    'runner.arun': runner_arun_concurrent,
+    'company_research.hook_after': hook_after,
+    'company_research.ahook_after': ahook_after,
+    'pdf.get_pdf_plumber_message': pdf_plumber,
+    'schema.restore[cold]': restore_schema_cold,
+    'schema.restore[warm]': restore_schema_warm,
+    'api.push_batch+poll': push_batch_poll,
+    'api.status': status,
+    'api.send_job': send_job,
+}
+
+
+def select(patterns: List[str]) -> List[str]:
+    """Names of the scenarios containing any of the patterns, all of them by default"""
+    return [name for name in SCENARIOS if not patterns or any(pattern in name for pattern in patterns)]
@@ -1,22 +1,59 @@
-import os
-import json
-import time
-import requests
+import copy
+import math
+import asyncio
+import threading
 from types import ModuleType
-from datetime import datetime
-from typing import Dict, Optional, Callable, Union, List
-from langchain.schema import SystemMessage, HumanMessage
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import BaseModel, create_model
+from typing import Dict, Optional, Callable, Union, List, Tuple, Type, Iterable
+from langchain.schema import SystemMessage, HumanMessage, BaseMessage
 from langchain_core.language_models.chat_models import BaseChatModel
 
+from core.cache import LRUCache
+from core.clients import client_pool
+from core.sinks import HttpSink
+from core.dumps import DumpWriter, new_run_id, dump_writer as default_dump_writer
+from core.loaders import take_chars
+from core.llm_cache import ResponseCache
+from core.retrieval import BM25Index, chunk_text
 from core.models import TableRequest, StickerRequest, ColumnOfStickersRequest
 from runners.company_research.models import MarketResearch
 
+# with_structured_output converts the schema to a json schema / tool on every call,
+# the runnables are kept per (model, schema) and reused by every run of the same model.
+# Those of the pooled models live in client_pool, so an evicted model (and its connections) can go away,
+# the models built elsewhere (tests, benchmarks, custom models) are kept here
+structured_runnables = LRUCache(256)
+
+# the parts of split_schema per (schema, field groups), new classes every run would miss the caches keyed by schema
+schema_parts = LRUCache(128)
+
+
+def get_structured_runnable(model: BaseChatModel, schema: Type[BaseModel]):
+    runnable = client_pool.structured_runnable(model, schema)
+    if runnable is not None:
+        return runnable
+
+    key = (id(model), schema)
+    cached = structured_runnables.get(key)
+    # the model is kept with its runnable, so a recycled id() of a dead model can't match
+    if cached is None or cached[0] is not model:
+        cached = (model, model.with_structured_output(schema))
+        structured_runnables.put(key, cached)
+    return cached[1]
+
+
 # may be the TemplateMethod is a wrong pattern here as there is one subclasses with a lot of different logic in the hooks
 class BaseRunner():
 
     def __init__(self, model: BaseChatModel, response_schema: Optional[MarketResearch], prompts: Union[ModuleType, Dict, str],
-                pdf_loader: Callable[[str], str], pipeline_vars: Dict = None, pdf_path: str = None,
-                dump_results: bool = True):
+                pdf_loader: Callable[[str], Union[str, Iterable[str]]], pipeline_vars: Dict = None, pdf_path: str = None,
+                dump_results: bool = True, max_concurrency: int = 8,
+                on_messages: Optional[Callable[[List[Dict]], None]] = None,
+                field_groups: Optional[Union[int, List[List[str]]]] = None,
+                max_pdf_chars: Optional[int] = None, retrieval_top_k: Optional[int] = None,
+                response_cache: Optional[ResponseCache] = None, run_id: Optional[str] = None,
+                dump_writer: Optional[DumpWriter] = None):
 
         self.model = model
         self.prompts = prompts
@@ -28,6 +65,30 @@ class BaseRunner():
         self.messages_to_figma = []
         self.llm_response = None
         self.dump_results = dump_results
+        # results are dumped in the background, in a file named after the run id (the job id for server jobs)
+        self.run_id = run_id or new_run_id()
+        self.dump_writer = dump_writer or default_dump_writer
+        self.max_concurrency = max_concurrency
+
+        # called with every batch of Figma messages as soon as it is ready, so the board fills while the run goes on
+        # (a function or one of the core.sinks: QueueSink in the server process, HttpSink to a server running apart)
+        self.on_messages = on_messages
+        self._emit_lock = threading.Lock()
+        self._http_sink = None
+
+        # split the response schema in groups of fields generated concurrently: a number of groups or lists of field names
+        self.field_groups = field_groups
+
+        # budget of document text in the prompt. lazy loaders (e.g. iter_pdf_paragraphs) stop extracting once it is spent
+        self.max_pdf_chars = max_pdf_chars
+
+        # put only the top k chunks of the document for every field description in the prompts, instead of all of it
+        self.retrieval_top_k = retrieval_top_k
+        self.pdf_text = ''
+        self.pdf_index = None
+
+        # structured calls already made with the same model, schema and messages are served from there
+        self.response_cache = response_cache
 
     @staticmethod
     def to_llm_message(cls, **kwargs) -> str:
@@ -38,6 +99,45 @@ class BaseRunner():
                 lines.append(f"{name}: {desc.format(**kwargs)}")
         return "\n".join(lines)
 
+    @staticmethod
+    def split_schema(schema: Type[BaseModel], field_groups: Union[int, List[List[str]]]) -> List[Type[BaseModel]]:
+        """
+        Split a schema into sub-models holding groups of its fields.
+        An int splits the fields in that many contiguous groups, lists of field names are used as they are
+        and the fields not listed go to one more group. The parts are built once per schema and groups.
+        """
+        groups = field_groups if isinstance(field_groups, int) else tuple(tuple(group) for group in field_groups)
+        return list(schema_parts.get_or_create((schema, groups), lambda: BaseRunner._split_schema(schema, groups)))
+
+    @staticmethod
+    def _split_schema(schema: Type[BaseModel], field_groups: Union[int, Tuple[Tuple[str, ...], ...]]) -> List[Type[BaseModel]]:
+        names = list(schema.model_fields)
+
+        if isinstance(field_groups, int):
+            size = math.ceil(len(names) / max(field_groups, 1))
+            groups = [names[i: i + size] for i in range(0, len(names), size)]
+        else:
+            groups = [list(group) for group in field_groups]
+            grouped = {name for group in groups for name in group}
+            unknown = grouped - set(names)
+            if unknown:
+                raise ValueError(f'Unknown fields in field_groups: {sorted(unknown)}')
+            rest = [name for name in names if name not in grouped]
+            if rest:
+                groups.append(rest)
+
+        return [
+            create_model(f'{schema.__name__}Part{i}',
+                         **{name: (schema.model_fields[name].annotation, copy.copy(schema.model_fields[name])) for name in group})
+            for i, group in enumerate(groups) if group
+        ]
+
+    @staticmethod
+    def merge_responses(schema: Type[BaseModel], responses: List[BaseModel]) -> BaseModel:
+        """Compose the full response from the responses of split_schema parts"""
+        # only the fields set by the LLM, so exclude_unset in to_figma_messages behaves like for a single call
+        return schema(**{name: getattr(response, name) for response in responses for name in response.model_fields_set})
+
     @staticmethod
     def get_prompt(prompts: Union[ModuleType, Dict, str], pdf_path: str):
 
@@ -87,15 +187,59 @@ class BaseRunner():
 
         return figma_objects
 
-    def push_to_queue(self, messages: List[Dict]):
+    def pdf_context(self, schema: Type[BaseModel], **format_vars) -> str:
+        """Document text for a prompt filling schema: all of it, or the chunks relevant to its fields with retrieval on"""
+        if self.pdf_index is None:
+            return self.pdf_text
+
+        queries = [field.description.format(**format_vars) for field in schema.model_fields.values() if field.description]
+        return self.pdf_index.select(queries, self.retrieval_top_k)
+
+    def invoke_structured(self, schema: Type[BaseModel], messages: List[BaseMessage]) -> BaseModel:
+        runnable = get_structured_runnable(self.model, schema)
+        if self.response_cache is None:
+            return runnable.invoke(messages)
+        return self.response_cache.invoke(self.model, schema, messages, lambda: runnable.invoke(messages))
+
+    async def ainvoke_structured(self, schema: Type[BaseModel], messages: List[BaseMessage]) -> BaseModel:
+        runnable = get_structured_runnable(self.model, schema)
+        if self.response_cache is None:
+            return await runnable.ainvoke(messages)
+        return await self.response_cache.ainvoke(self.model, schema, messages, lambda: runnable.ainvoke(messages))
+
+    def structured_batch(self, requests: List[Tuple[Type[BaseModel], List[BaseMessage]]]) -> List[BaseModel]:
+        """Run independent structured calls concurrently, results keep the order of requests"""
+        if self.max_concurrency <= 1 or len(requests) <= 1:
+            return [self.invoke_structured(schema, messages) for schema, messages in requests]
 
-        for m in messages:
-            _ = requests.post(
-                "http://localhost:8000/push",
-                json=m.model_dump()
-            )
+        # calls are network bound so threads are enough, the pool size caps requests in flight to the provider
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(requests))) as executor:
+            return list(executor.map(lambda request: self.invoke_structured(*request), requests))
 
-        time.sleep(1)
+    async def astructured_batch(self, requests: List[Tuple[Type[BaseModel], List[BaseMessage]]]) -> List[BaseModel]:
+        """structured_batch on the event loop, the semaphore caps requests in flight to the provider"""
+        semaphore = asyncio.Semaphore(max(self.max_concurrency, 1))
+
+        async def invoke(schema: Type[BaseModel], messages: List[BaseMessage]) -> BaseModel:
+            async with semaphore:
+                return await self.ainvoke_structured(schema, messages)
+
+        return list(await asyncio.gather(*(invoke(schema, messages) for schema, messages in requests)))
+
+    def push_to_queue(self, messages: List[Dict]):
+        """Send messages to the queue of a server running apart, one /push_batch request"""
+        if self._http_sink is None:
+            self._http_sink = HttpSink()
+        self._http_sink(messages)
+
+    def emit(self, messages: List[Dict]):
+        """Hand ready messages to on_messages right away, hooks may call it for partial results"""
+        if not messages:
+            return
+        with self._emit_lock:
+            self.messages_to_figma += messages
+            if self.on_messages:
+                self.on_messages(messages)
 
     def hook_before(self):
         return []
@@ -103,33 +247,71 @@ class BaseRunner():
     def hook_after(self):
         return []
 
-    def run(self):
+    async def ahook_before(self):
+        # runners without async hooks keep working in arun, their hooks just hold a thread
+        return await asyncio.to_thread(self.hook_before)
 
-        self.messages_to_figma += self.hook_before()
+    async def ahook_after(self):
+        return await asyncio.to_thread(self.hook_after)
 
+    def load_pdf(self):
         if self.pdf_path:
-            pdf_text = self.pdf_loader(self.pdf_path)
-        else:
-            pdf_text = ''
+            self.pdf_text = take_chars(self.pdf_loader(self.pdf_path), self.max_pdf_chars)
 
-        system_prompt = self.get_prompt(self.prompts, self.pdf_path)
+        if self.retrieval_top_k and self.pdf_text:
+            self.pdf_index = BM25Index(chunk_text(self.pdf_text))
 
-        schema_description = self.to_llm_message(self.response_schema, **self.pipeline_vars)
-
-        messages = [
+    def build_messages(self, schema: Type[BaseModel]) -> List[BaseMessage]:
+        system_prompt = self.get_prompt(self.prompts, self.pdf_path)
+        schema_description = self.to_llm_message(schema, **self.pipeline_vars)
+        return [
             SystemMessage(content=system_prompt.format(**self.pipeline_vars)),
-            HumanMessage(content=('\n'.join((pdf_text, schema_description))).strip())
+            HumanMessage(content=('\n'.join((self.pdf_context(schema, **self.pipeline_vars), schema_description))).strip())
         ]
 
-        self.llm_response = self.model.with_structured_output(self.response_schema).invoke(messages)
-        self.messages_to_figma += self.to_figma_messages(self.llm_response)
+    def dump(self):
+        return self.dump_writer.submit(self.run_id, self.messages_to_figma)
+
+    def run(self):
+
+        self.emit(self.hook_before())
+
+        self.load_pdf()
+
+        if self.field_groups:
+            # several shorter generations in parallel instead of one long json, every part sees the same document
+            parts = self.split_schema(self.response_schema, self.field_groups)
+            responses = self.structured_batch([(part, self.build_messages(part)) for part in parts])
+            self.llm_response = self.merge_responses(self.response_schema, responses)
+        else:
+            self.llm_response = self.invoke_structured(self.response_schema, self.build_messages(self.response_schema))
+        self.emit(self.to_figma_messages(self.llm_response))
+
+        self.emit(self.hook_after())
+
+        if self.dump_results:
+            self.dump()
+
+        return self.messages_to_figma
+
+    async def arun(self):
+        """run() for an event loop: LLM calls are awaited, PDF extraction goes to a thread"""
+
+        self.emit(await self.ahook_before())
+
+        await asyncio.to_thread(self.load_pdf)
+
+        if self.field_groups:
+            parts = self.split_schema(self.response_schema, self.field_groups)
+            responses = await self.astructured_batch([(part, self.build_messages(part)) for part in parts])
+            self.llm_response = self.merge_responses(self.response_schema, responses)
+        else:
+            self.llm_response = await self.ainvoke_structured(self.response_schema, self.build_messages(self.response_schema))
+        self.emit(self.to_figma_messages(self.llm_response))
 
-        self.messages_to_figma += self.hook_after()
+        self.emit(await self.ahook_after())
 
         if self.dump_results:
-            if not os.path.isdir('llm_responses'):
-                os.mkdir('llm_responses')
-            with open(f'llm_responses/to-figma-messages-{datetime.now().strftime("%Y-%m-%d-%H-%M-%S")}.json', 'w') as f:
-                json.dump(self.messages_to_figma, f, indent=2)
+            self.dump()
 
         return self.messages_to_figma
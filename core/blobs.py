@@ -0,0 +1,86 @@
+import os
+import re
+import base64
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+BLOB_URL_PREFIX = '/blobs/'
+
+_DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+class BlobStore:
+    """
+    Content-addressed storage for binary payloads (screenshots tiles).
+    A blob is stored once under its sha256 and never changes, so it can be cached forever by the clients.
+    """
+
+    def __init__(self, root: str = 'blobs'):
+        self.root = Path(root)
+
+    @staticmethod
+    def is_digest(digest: str) -> bool:
+        return bool(_DIGEST_RE.match(digest))
+
+    def path(self, digest: str) -> Path:
+        if not self.is_digest(digest):
+            raise ValueError(f'Not a sha256 digest: {digest}')
+        return self.root / digest
+
+    def put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+
+        if not path.exists():
+            self.root.mkdir(parents=True, exist_ok=True)
+            # write aside and rename so a reader never sees a half written blob,
+            # threads of the server may store the same tile at once
+            tmp_path = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+
+        return digest
+
+    def get(self, digest: str) -> Optional[bytes]:
+        try:
+            return self.path(digest).read_bytes()
+        except (ValueError, FileNotFoundError):
+            return None
+
+    def __contains__(self, digest: str) -> bool:
+        return self.is_digest(digest) and self.path(digest).exists()
+
+
+def blob_url(digest: str) -> str:
+    return f'{BLOB_URL_PREFIX}{digest}'
+
+
+def guess_media_type(data: bytes) -> str:
+    if data.startswith(b'\x89PNG'):
+        return 'image/png'
+    return 'image/jpeg'
+
+
+def offload_images(message: Dict, store: BlobStore) -> Dict:
+    """Move base64 payloads of an addImages message to the store, the message keeps /blobs/<sha256> references"""
+    if message.get('type') != 'addImages' or (message.get('encoding') or 'base64') != 'base64':
+        return message
+
+    refs = [blob_url(store.put(base64.b64decode(image))) for image in message.get('content') or []]
+    return {**message, 'content': refs, 'encoding': 'blob'}
+
+
+def inline_images(message: Dict, store: BlobStore) -> Dict:
+    """Inverse of offload_images: /blobs/<sha256> references found in the store become base64 payloads again"""
+    if message.get('type') != 'addImages' or message.get('encoding') != 'blob':
+        return message
+
+    images = []
+    for ref in message.get('content') or []:
+        data = store.get(ref[len(BLOB_URL_PREFIX):]) if ref.startswith(BLOB_URL_PREFIX) else None
+        if data is None:  # not ours, left as it is
+            return message
+        images.append(base64.b64encode(data).decode())
+    return {**message, 'content': images, 'encoding': 'base64'}
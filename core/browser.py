@@ -0,0 +1,80 @@
+import base64
+import asyncio
+import nodriver as uc
+from typing import List, Optional
+
+
+class BrowserPool:
+    """
+    One headless browser shared by several tabs.
+    Pages are captured concurrently (at most max_tabs at once), every url has its own timeout
+    so a hanging site doesn't block the rest of the batch.
+    """
+
+    def __init__(self, max_tabs: int = 4, page_timeout: float = 30, settle_time: float = 1,
+                 consent_timeout: float = 3, headless: bool = True):
+
+        self.max_tabs = max_tabs
+        self.page_timeout = page_timeout
+        self.settle_time = settle_time
+        self.consent_timeout = consent_timeout
+        self.headless = headless
+
+        self._browser = None
+        self._tabs = None
+
+    async def start(self):
+        if self._browser is None:
+            self._browser = await uc.start(headless=self.headless)
+            self._tabs = asyncio.Semaphore(self.max_tabs)
+        return self._browser
+
+    def stop(self):
+        if self._browser is not None:
+            self._browser.stop()
+            self._browser = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.stop()
+
+    async def _accept_cookies(self, page):
+        # not every site has a consent banner, find raises when nothing shows up in time
+        try:
+            button = await page.find('accept', timeout=self.consent_timeout)
+        except asyncio.TimeoutError:
+            return
+        if button:
+            await button.click()
+
+    async def _capture(self, url: str) -> bytes:
+        page = await self._browser.get(url, new_tab=True)
+        try:
+            await page.fullscreen()
+            await self._accept_cookies(page)
+            await asyncio.sleep(self.settle_time)
+            # ask CDP for the screenshot directly, save_screenshot would round-trip it through a file
+            data = await page.send(uc.cdp.page.capture_screenshot(format_='png', capture_beyond_viewport=True))
+        finally:
+            await page.close()
+
+        if not data:
+            raise RuntimeError('Empty screenshot, the page has probably not finished loading')
+        return base64.b64decode(data)
+
+    async def capture(self, url: str) -> Optional[bytes]:
+        """Full page png screenshot of url, returns None if the page failed or timed out"""
+        await self.start()
+        async with self._tabs:
+            try:
+                return await asyncio.wait_for(self._capture(url), self.page_timeout)
+            except Exception as e:
+                print(f'Failed to capture {url}: {e!r}')
+                return None
+
+    async def capture_all(self, urls: List[str]) -> List[Optional[bytes]]:
+        """Capture all the urls at once, results keep the order of urls"""
+        return await asyncio.gather(*(self.capture(url) for url in urls))
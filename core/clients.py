@@ -0,0 +1,171 @@
+import time
+import asyncio
+import hashlib
+import threading
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import openai
+from langchain_openai import ChatOpenAI
+
+# http2 needs the h2 package (pip install httpx[http2]), plain keep-alive http/1.1 otherwise
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+
+def api_key_hash(api_key: str) -> str:
+    # keys never end up in the registry (or its stats) as is
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+def _close_async_client(client: httpx.AsyncClient):
+    try:
+        asyncio.get_running_loop().create_task(client.aclose())
+    except RuntimeError:  # no loop in this thread
+        try:
+            asyncio.run(client.aclose())
+        except Exception:
+            pass
+
+
+class ClientPool:
+    """
+    Chat models shared by every job using the same (model_name, model_provider_url, api key, temperature).
+    Models of the same provider url share one http client, so jobs reuse its keep-alive connections
+    instead of paying connection setup and the TLS handshake again. Models unused for idle_timeout
+    seconds are dropped from the pool, their http clients closed once no model using them is still
+    referenced: a job holding an evicted model keeps its connections until it lets go of the model.
+    The structured output runnables of a pooled model are kept in its entry and dropped with it,
+    they hold the model so no cache outside the pool may keep them.
+    """
+
+    def __init__(self, idle_timeout: float = 300.0, max_connections: int = 100,
+                 max_keepalive_connections: int = 20, keepalive_expiry: float = 60.0):
+        self.idle_timeout = idle_timeout
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive_connections,
+                                   keepalive_expiry=keepalive_expiry)
+
+        # key -> [model, last used, {schema: structured output runnable}]
+        self._models: Dict[Tuple[str, str, str, float], list] = {}
+        # id of a pooled model -> its key
+        self._keys: Dict[int, Tuple[str, str, str, float]] = {}
+        # provider url -> (sync client, async client)
+        self._http: Dict[str, Tuple[httpx.Client, httpx.AsyncClient]] = {}
+        # provider url -> models handed out and still referenced somewhere, evicted or not
+        self._live: Dict[str, List[weakref.ref]] = {}
+        self._lock = threading.Lock()
+
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+
+    def get_chat_model(self, model_name: str, api_key: str, base_url: Optional[str],
+                       temperature: float) -> ChatOpenAI:
+        key = (model_name, base_url or '', api_key_hash(api_key), float(temperature))
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+
+            entry = self._models.get(key)
+            if entry is not None:
+                entry[1] = now
+                self.reused += 1
+                return entry[0]
+
+            http_client, http_async_client = self._http_clients(key[1])
+            model = ChatOpenAI(
+                model=model_name,
+                openai_api_key=api_key,
+                openai_api_base=base_url,
+                temperature=temperature,
+                http_client=http_client,
+                http_async_client=http_async_client,
+            )
+            self._models[key] = [model, now, {}]
+            self._keys[id(model)] = key
+            self._live.setdefault(key[1], []).append(weakref.ref(model))
+            self.created += 1
+            return model
+
+    def _http_clients(self, base_url: str) -> Tuple[httpx.Client, httpx.AsyncClient]:
+        if base_url not in self._http:
+            # the openai default clients, they keep the sdk timeouts and redirects settings
+            self._http[base_url] = (
+                openai.DefaultHttpxClient(http2=HTTP2, limits=self.limits),
+                openai.DefaultAsyncHttpxClient(http2=HTTP2, limits=self.limits),
+            )
+        return self._http[base_url]
+
+    def _evict_idle(self, now: float):
+        for key in [key for key, (_, last_used, _) in self._models.items() if now - last_used > self.idle_timeout]:
+            del self._keys[id(self._models.pop(key)[0])]
+            self.evicted += 1
+
+        # evicted models may still be in use by a job, their clients stay open as long as they are referenced
+        for base_url, refs in self._live.items():
+            refs[:] = [ref for ref in refs if ref() is not None]
+        used_urls = {key[1] for key in self._models} | {url for url, refs in self._live.items() if refs}
+        for base_url in [url for url in self._http if url not in used_urls]:
+            self._close_http(base_url)
+
+    def _close_http(self, base_url: str):
+        self._live.pop(base_url, None)
+        http_client, http_async_client = self._http.pop(base_url)
+        http_client.close()
+        _close_async_client(http_async_client)
+
+    def structured_runnable(self, model: ChatOpenAI, schema) -> Optional[Any]:
+        """
+        model.with_structured_output(schema), built once per pooled model. A model evicted but still in use
+        gets a new runnable each time, caching it would keep the model alive. None for models not from this pool.
+        """
+        with self._lock:
+            key = self._keys.get(id(model))
+            if key is not None and self._models[key][0] is model:
+                self._models[key][1] = time.monotonic()
+                runnables = self._models[key][2]
+                if schema not in runnables:
+                    runnables[schema] = model.with_structured_output(schema)
+                return runnables[schema]
+            if not any(ref() is model for refs in self._live.values() for ref in refs):
+                return None
+        return model.with_structured_output(schema)
+
+    def evict_idle(self):
+        with self._lock:
+            self._evict_idle(time.monotonic())
+
+    def close(self):
+        with self._lock:
+            self._models.clear()
+            self._keys.clear()
+            for base_url in list(self._http):
+                self._close_http(base_url)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            connections = 0
+            for http_client, _ in self._http.values():
+                # httpx keeps the connection pool on its (private) transport
+                pool = getattr(getattr(http_client, '_transport', None), '_pool', None)
+                connections += len(getattr(pool, 'connections', []))
+
+            return {
+                'models': len(self._models),
+                'live_models': sum(ref() is not None for refs in self._live.values() for ref in refs),
+                'http_clients': len(self._http),
+                'open_connections': connections,
+                'http2': HTTP2,
+                'created': self.created,
+                'reused': self.reused,
+                'evicted': self.evicted,
+            }
+
+
+# shared by the server jobs and the command line runs
+client_pool = ClientPool()
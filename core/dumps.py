@@ -0,0 +1,129 @@
+import os
+import gzip
+import json
+import time
+import uuid
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+from core.blobs import BlobStore, BLOB_URL_PREFIX, offload_images
+
+DUMP_SUFFIXES = ('.jsonl', '.jsonl.gz')
+
+
+def new_run_id() -> str:
+    return uuid.uuid4().hex
+
+
+def is_dump(path: Path) -> bool:
+    return path.is_file() and path.name.endswith(DUMP_SUFFIXES)
+
+
+def open_dump(path: Path, mode: str = 'rt', compressed: Optional[bool] = None):
+    if compressed if compressed is not None else path.name.endswith('.gz'):
+        return gzip.open(path, mode, encoding='utf-8') if 't' in mode else gzip.open(path, mode)
+    return open(path, mode, encoding='utf-8') if 't' in mode else open(path, mode)
+
+
+def iter_dump(path: Path) -> Iterator[Dict]:
+    """Messages of a dump, one json per line"""
+    with open_dump(Path(path)) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class DumpWriter:
+    """
+    Writes the messages of the runs off the request path, on a single background thread.
+    One compact JSONL file per run (gzipped by default) named after the time and the run / job id,
+    images go to a content-addressed store in dump_dir/blobs and the dump keeps /blobs/<sha256> references.
+    Dumps above max_files or older than max_age seconds are removed, with the blobs only they used.
+    """
+
+    def __init__(self, dump_dir: str = 'llm_responses', compress: bool = True, offload_images: bool = True,
+                 max_files: Optional[int] = 100, max_age: Optional[float] = None):
+        self.dump_dir = Path(dump_dir)
+        self.compress = compress
+        self.offload_images = offload_images
+        self.max_files = max_files
+        self.max_age = max_age
+        self.blob_store = BlobStore(str(self.dump_dir / 'blobs'))
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='dump-writer')
+
+    def dump_path(self, run_id: str) -> Path:
+        suffix = '.jsonl.gz' if self.compress else '.jsonl'
+        return self.dump_dir / f'to-figma-messages-{datetime.now().strftime("%Y-%m-%d-%H-%M-%S")}-{run_id}{suffix}'
+
+    def submit(self, run_id: str, messages: List[Dict]) -> Future:
+        """Queue the dump of the messages, returns right away"""
+        return self._executor.submit(self.write, self.dump_path(run_id), list(messages))
+
+    def write(self, path: Path, messages: List[Dict]) -> Path:
+        if self.offload_images:
+            messages = [offload_images(message, self.blob_store) for message in messages]
+
+        self.dump_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f'{path.name}.tmp')
+        with open_dump(tmp_path, 'wb', compressed=self.compress) as f:
+            for message in messages:
+                f.write(json.dumps(message, separators=(',', ':')).encode())
+                f.write(b'\n')
+        os.replace(tmp_path, path)
+
+        if self.offload_images:
+            self._touch_blobs(messages)
+        self.apply_retention()
+        return path
+
+    def _touch_blobs(self, messages: List[Dict]):
+        # blobs are shared between dumps, touched after the dump is written their mtime is never older than
+        # the last dump using them
+        for message in messages:
+            if message.get('encoding') != 'blob':
+                continue
+            for ref in message.get('content') or []:
+                digest = ref[len(BLOB_URL_PREFIX):] if ref.startswith(BLOB_URL_PREFIX) else None
+                # references to another store (e.g. the server's) are left alone
+                if digest in self.blob_store:
+                    os.utime(self.blob_store.path(digest))
+
+    def dumps(self) -> List[Path]:
+        """Dumps of the directory, oldest first"""
+        if not self.dump_dir.is_dir():
+            return []
+        return sorted((path for path in self.dump_dir.iterdir() if is_dump(path)), key=lambda path: (path.stat().st_mtime, path.name))
+
+    def apply_retention(self):
+        dumps = self.dumps()
+        now = time.time()
+        expired = [path for path in dumps if self.max_age is not None and now - path.stat().st_mtime > self.max_age]
+        if self.max_files is not None and len(dumps) - len(expired) > self.max_files:
+            kept = [path for path in dumps if path not in expired]
+            expired += kept[:len(kept) - self.max_files]
+
+        if not expired:
+            return
+        for path in expired:
+            path.unlink(missing_ok=True)
+
+        # blobs not touched since the oldest remaining dump was written are used by removed dumps only
+        remaining = self.dumps()
+        oldest = remaining[0].stat().st_mtime if remaining else now
+        if self.blob_store.root.is_dir():
+            for blob in self.blob_store.root.iterdir():
+                if blob.stat().st_mtime < oldest:
+                    blob.unlink(missing_ok=True)
+
+    def flush(self, timeout: Optional[float] = None):
+        """Wait for the dumps queued so far"""
+        self._executor.submit(lambda: None).result(timeout)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+# used by the runners which don't get their own writer
+dump_writer = DumpWriter()
@@ -0,0 +1,64 @@
+import cv2
+import base64
+import asyncio
+import numpy as np
+from typing import List, Optional
+from concurrent.futures import Executor
+
+
+def decode_image(data: bytes) -> np.ndarray:
+    """Decode encoded image bytes (png, jpeg, ...) straight from memory"""
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError('Could not decode image')
+    return image
+
+
+def tile_image(image: np.ndarray, tile_height: int = 720) -> List[np.ndarray]:
+    """Split an image into horizontal tiles. Tiles are views on the image, nothing is copied"""
+    return [image[top: top + tile_height] for top in range(0, image.shape[0], tile_height)]
+
+
+def encode_jpeg(image: np.ndarray, jpeg_quality: int = 95) -> bytes:
+    ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+    if not ok:
+        raise ValueError('Could not encode image')
+    return buffer.tobytes()
+
+
+def screenshot_to_tiles(data: bytes, tile_height: int = 720, jpeg_quality: int = 95,
+                        executor: Optional[Executor] = None) -> List[str]:
+    """
+    Cut a screenshot into jpeg tiles ready to be sent to Figma.
+
+    Args:
+        data: Encoded screenshot bytes
+        tile_height: Height of a tile in px
+        jpeg_quality: Jpeg quality of the tiles, 0-100
+        executor: Optional pool to encode the tiles in. cv2 releases the GIL so threads are enough
+
+    Returns:
+        List of base64 encoded jpeg tiles, top to bottom
+    """
+    tiles = tile_image(decode_image(data), tile_height)
+
+    if executor is None:
+        encoded = [encode_jpeg(tile, jpeg_quality) for tile in tiles]
+    else:
+        encoded = executor.map(encode_jpeg, tiles, [jpeg_quality] * len(tiles))
+
+    return [base64.b64encode(tile).decode('utf-8') for tile in encoded]
+
+
+async def ascreenshot_to_tiles(data: bytes, tile_height: int = 720, jpeg_quality: int = 95,
+                               executor: Optional[Executor] = None) -> List[str]:
+    """
+    screenshot_to_tiles for a running loop: the screenshot is decoded in the executor (None for the default one)
+    and every tile is encoded there as a task of its own, so the tiles of one page are encoded in parallel.
+    The tasks are submitted from the loop, never from a worker waiting on its own pool.
+    """
+    loop = asyncio.get_running_loop()
+    image = await loop.run_in_executor(executor, decode_image, data)
+    encoded = await asyncio.gather(*(loop.run_in_executor(executor, encode_jpeg, tile, jpeg_quality)
+                                     for tile in tile_image(image, tile_height)))
+    return [base64.b64encode(tile).decode('utf-8') for tile in encoded]
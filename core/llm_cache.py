@@ -0,0 +1,163 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+from pydantic_core import to_json
+from langchain_core.messages import BaseMessage
+
+from core.cache import LRUCache
+
+# 'readwrite' serves hits and stores the misses, 'replay' never calls the model and raises on a miss
+CACHE_MODES = ('readwrite', 'replay')
+
+
+class CacheMiss(LookupError):
+    """Raised in replay mode when a call has no cached response"""
+
+
+_schema_hashes = LRUCache(256)
+
+
+def schema_hash(schema: Type[BaseModel]) -> str:
+    return _schema_hashes.get_or_create(schema, lambda: hashlib.sha256(
+        json.dumps(schema.model_json_schema(), sort_keys=True).encode()).hexdigest())
+
+
+def messages_hash(messages: List[BaseMessage]) -> str:
+    return hashlib.sha256(to_json([(message.type, message.content) for message in messages])).hexdigest()
+
+
+def model_id(model) -> str:
+    # ChatOpenAI has model_name, other chat models mostly model
+    return str(getattr(model, 'model_name', None) or getattr(model, 'model', None) or type(model).__name__)
+
+
+class ResponseCache:
+    """
+    SQLite cache of structured LLM responses keyed by model, temperature, messages and response schema.
+    Entries older than ttl seconds are ignored, least recently used ones are evicted above max_bytes.
+    """
+
+    def __init__(self, path: str = '.cache/llm_responses.db', mode: str = 'readwrite',
+                 ttl: Optional[float] = None, max_bytes: int = 64 * 1024 * 1024):
+        if mode not in CACHE_MODES:
+            raise ValueError(f'Unknown cache mode {mode!r}, expected one of {CACHE_MODES}')
+        self.path = path
+        self.mode = mode
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                used_at REAL NOT NULL,
+                size INTEGER NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_used ON responses (used_at);
+        """)
+
+    def _execute(self, sql: str, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    @staticmethod
+    def key(model, schema: Type[BaseModel], messages: List[BaseMessage]) -> str:
+        parts = [model_id(model), str(getattr(model, 'temperature', None)), schema_hash(schema), messages_hash(messages)]
+        return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+    def get(self, key: str, schema: Type[BaseModel]) -> Optional[BaseModel]:
+        row = self._execute("SELECT created_at, data FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        created_at, data = row
+        now = time.time()
+        if self.ttl is not None and now - created_at > self.ttl:
+            self._execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+
+        self._execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+        # validated from the fields the LLM set only, so exclude_unset still behaves like on a fresh response
+        return schema.model_validate(json.loads(data))
+
+    def put(self, key: str, response: BaseModel):
+        # getattr instead of model_dump: fields with exclude=True (e.g. url_list) are part of the response too
+        data = to_json({name: getattr(response, name) for name in response.model_fields_set}).decode()
+        now = time.time()
+        with self._lock:
+            self._execute(
+                "INSERT OR REPLACE INTO responses (key, created_at, used_at, size, data) VALUES (?, ?, ?, ?, ?)",
+                (key, now, now, len(data), data),
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._execute("SELECT key, size FROM responses ORDER BY used_at").fetchall():
+            self._execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def _lookup(self, model, schema: Type[BaseModel], messages: List[BaseMessage]) -> Tuple[str, Optional[BaseModel]]:
+        key = self.key(model, schema, messages)
+        response = self.get(key, schema)
+        if response is not None:
+            self.hits += 1
+            return key, response
+
+        self.misses += 1
+        if self.mode == 'replay':
+            raise CacheMiss(f'No cached response for {schema.__name__} with {model_id(model)} (key {key[:12]})')
+        return key, None
+
+    def invoke(self, model, schema: Type[BaseModel], messages: List[BaseMessage],
+               call: Callable[[], BaseModel]) -> BaseModel:
+        """Cached response of the call, call() runs on a miss (outside of replay mode)"""
+        key, response = self._lookup(model, schema, messages)
+        if response is None:
+            response = call()
+            self.put(key, response)
+        return response
+
+    async def ainvoke(self, model, schema: Type[BaseModel], messages: List[BaseMessage],
+                      call: Callable[[], Awaitable[BaseModel]]) -> BaseModel:
+        """invoke() for async calls, the SQLite lookups are short enough to stay on the loop"""
+        key, response = self._lookup(model, schema, messages)
+        if response is None:
+            response = await call()
+            self.put(key, response)
+        return response
+
+    def __len__(self) -> int:
+        return self._execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def clear(self):
+        self._execute("DELETE FROM responses")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def make_response_cache(mode: Optional[str], path: str = '.cache/llm_responses.db', ttl: Optional[float] = None,
+                        max_bytes: int = 64 * 1024 * 1024) -> Optional[ResponseCache]:
+    """The response cache configured by the settings, None when caching is off"""
+    if not mode:
+        return None
+    return ResponseCache(path, mode=mode, ttl=ttl, max_bytes=max_bytes)
@@ -1,7 +1,28 @@
 import re
 import os
+import json
+import hashlib
+import math
+import threading
+import functools
 import pdfplumber
+import multiprocessing
 from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from concurrent.futures import ProcessPoolExecutor
+
+# bump when the extraction output changes, cached texts of older versions are ignored
+LOADER_VERSION = 1
+
+# below this many pages per process the serial extraction is faster: a spawned process re-imports the
+# caller's __main__ (the whole server, ~3s) before it extracts anything, pdfplumber does ~4 pages a second
+MIN_PAGES_PER_WORKER = 50
+
+# compiled once, applied to every line / paragraph
+_NUMBERED_RE = re.compile(r'^\d+\.')
+_SPACES_RE = re.compile(r'[ \t]+')
+_HYPHEN_RE = re.compile(r'([a-z])-\s+([a-z])')
+_BULLETS_RE = re.compile(r'[•●○◦]')
 
 def resolve_path(path_str: str) -> str:
     """
@@ -13,52 +34,270 @@ def resolve_path(path_str: str) -> str:
 
     return str(path)
 
-def get_pdf_plumber_message(pdf_path: str) -> str:
+def _page_paragraphs(text: str) -> List[str]:
+    """Paragraphs of one page, pages don't depend on each other"""
     paragraphs = []
-    with pdfplumber.open(resolve_path(pdf_path)) as pdf:
-        for page in pdf.pages:
+    # Split into lines
+    lines = text.split('\n')
+    current_paragraph = []
+    for i, line in enumerate(lines):
+        line = line.strip()
+        # Skip empty lines
+        if not line:
+            if current_paragraph:
+                # Join paragraph pieces
+                paragraph_text = ' '.join(current_paragraph)
+                paragraphs.append(paragraph_text)
+                current_paragraph = []
+            continue
+        # Check if this looks like a header (short, uppercase, ends with :, or numbered)
+        if (len(line) < 40 and (line.isupper() or line.endswith(':') or _NUMBERED_RE.match(line))):
+            # Save current paragraph if exists
+            if current_paragraph:
+                paragraph_text = ' '.join(current_paragraph)
+                paragraphs.append(paragraph_text)
+                current_paragraph = []
+            # Add the header as its own paragraph
+            paragraphs.append(line)
+        else:
+            # Add to current paragraph, joining single words properly
+            if len(line.split()) <= 2 and len(line) < 15 and current_paragraph:
+                # Join with the last element in current_paragraph
+                current_paragraph[-1] = current_paragraph[-1] + ' ' + line
+            else:
+                current_paragraph.append(line)
+    # Save any remaining paragraph
+    if current_paragraph:
+        paragraph_text = ' '.join(current_paragraph)
+        paragraphs.append(paragraph_text)
+    return paragraphs
+
+
+def _iter_pages(pdf_path: str, start: int = 0, stop: Optional[int] = None) -> Iterator[List[str]]:
+    """Raw paragraphs of pages[start:stop], one list per page with text"""
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages[start:stop]:
             text = page.extract_text(layout=True)  # Use layout mode for better text extraction
+            # drop the parsed objects of the page, they are not needed anymore
+            page.close()
             if text:
-                # Split into lines
-                lines = text.split('\n')
-                current_paragraph = []
-                for i, line in enumerate(lines):
-                    line = line.strip()
-                    # Skip empty lines
-                    if not line:
-                        if current_paragraph:
-                            # Join paragraph pieces
-                            paragraph_text = ' '.join(current_paragraph)
-                            paragraphs.append(paragraph_text)
-                            current_paragraph = []
-                        continue
-                    # Check if this looks like a header (short, uppercase, ends with :, or numbered)
-                    if (len(line) < 40 and (line.isupper() or line.endswith(':') or re.match(r'^\d+\.', line))):
-                        # Save current paragraph if exists
-                        if current_paragraph:
-                            paragraph_text = ' '.join(current_paragraph)
-                            paragraphs.append(paragraph_text)
-                            current_paragraph = []
-                        # Add the header as its own paragraph
-                        paragraphs.append(line)
-                    else:
-                        # Add to current paragraph, joining single words properly
-                        if len(line.split()) <= 2 and len(line) < 15 and current_paragraph:
-                            # Join with the last element in current_paragraph
-                            current_paragraph[-1] = current_paragraph[-1] + ' ' + line
-                        else:
-                            current_paragraph.append(line)
-                # Save any remaining paragraph
-                if current_paragraph:
-                    paragraph_text = ' '.join(current_paragraph)
-                    paragraphs.append(paragraph_text)
+                yield _page_paragraphs(text)
+
+
+def _extract_pages(pdf_path: str, start: int = 0, stop: Optional[int] = None) -> List[str]:
+    """Paragraphs of pages[start:stop], module level so it can run in a worker process"""
+    return [paragraph for paragraphs in _iter_pages(pdf_path, start, stop) for paragraph in paragraphs]
+
+
+def _iter_pages_parallel(pdf_path: str, n_pages: int, workers: int) -> Iterator[List[str]]:
+    # a few shards per worker, pages are not equally heavy
+    shard = max(1, math.ceil(n_pages / (workers * 4)))
+    ranges = [(start, min(start + shard, n_pages)) for start in range(0, n_pages, shard)]
+
+    # spawn: the server calls loaders from threads, forking a threaded process is not safe
+    executor = ProcessPoolExecutor(max_workers=min(workers, len(ranges)), mp_context=multiprocessing.get_context('spawn'))
+    try:
+        # shards come back in page order
+        yield from executor.map(_extract_pages, [pdf_path] * len(ranges), *zip(*ranges))
+    finally:
+        # the consumer may stop early, the shards not started yet are dropped
+        executor.shutdown(cancel_futures=True)
+
+
+def iter_pdf_pages(pdf_path: str, workers: Optional[int] = 1) -> Iterator[List[str]]:
+    """
+    Raw paragraphs of a PDF, lazily, one list per page (per shard of pages with several workers).
+    workers > 1 splits the pages between that many processes (None: one per CPU).
+    """
+    pdf_path = resolve_path(pdf_path)
+    workers = workers or os.cpu_count() or 1
+
+    if workers > 1:
+        with pdfplumber.open(pdf_path) as pdf:
+            n_pages = len(pdf.pages)
+        # starting processes costs more than a few pages
+        if n_pages >= MIN_PAGES_PER_WORKER * 2:
+            return _iter_pages_parallel(pdf_path, n_pages, min(workers, n_pages // MIN_PAGES_PER_WORKER))
+
+    return _iter_pages(pdf_path)
+
+
+def _fix_hyphens(text: str) -> Tuple[str, bool]:
+    """
+    Join hyphenated word breaks of a paragraph.
+    Also tells if the paragraph ends with a break ("word-") the next paragraph may continue.
+    """
+    last_end = 0
+    for match in _HYPHEN_RE.finditer(text):
+        last_end = match.end()
+    open_tail = len(text) - 2 >= last_end and text.endswith('-') and 'a' <= text[-2] <= 'z'
+    return _HYPHEN_RE.sub(r'\1\2', text), open_tail
+
+
+def normalize_paragraphs(paragraphs: Iterable[str]) -> Iterator[str]:
+    """
+    Normalize paragraphs one at a time.
+    The result joined with double newlines is the same as normalizing the whole joined document at once:
+    a word broken between two paragraphs ("infor-" / "mation") is joined and they come out as one paragraph.
+    """
+    pending, open_tail = None, False
+
+    for paragraph in paragraphs:
+        paragraph = _SPACES_RE.sub(' ', paragraph)
+
+        if pending is not None and open_tail and 'a' <= paragraph[:1] <= 'z':
+            # "x-\n\ny" is one match of the whole document regex: both letters are consumed
+            rest, open_tail = _fix_hyphens(paragraph[1:])
+            pending = pending[:-1] + paragraph[0] + rest
+            continue
+
+        if pending is not None:
+            yield _BULLETS_RE.sub('•', pending)
+        pending, open_tail = _fix_hyphens(paragraph)
+
+    if pending is not None:
+        yield _BULLETS_RE.sub('•', pending)
+
+
+def iter_pdf_paragraphs(pdf_path: str, workers: Optional[int] = 1) -> Iterator[str]:
+    """Normalized paragraphs of a PDF, extracted page by page as they are consumed"""
+    return normalize_paragraphs(paragraph for paragraphs in iter_pdf_pages(pdf_path, workers) for paragraph in paragraphs)
+
+
+def take_chars(paragraphs: Union[str, Iterable[str]], max_chars: Optional[int] = None) -> str:
+    """
+    Join paragraphs until max_chars, the rest of a lazy loader is never extracted.
+    A plain text is just truncated.
+    """
+    if isinstance(paragraphs, str):
+        return paragraphs if max_chars is None else paragraphs[:max_chars]
+
+    taken, size = [], 0
+    try:
+        for paragraph in paragraphs:
+            if max_chars is not None and size + len(paragraph) > max_chars:
+                if not taken:
+                    taken.append(paragraph[:max_chars])
+                break
+            taken.append(paragraph)
+            size += len(paragraph) + 2  # the separator
+    finally:
+        if hasattr(paragraphs, 'close'):
+            paragraphs.close()
+
+    return '\n\n'.join(taken).strip()
+
+
+def get_pdf_plumber_message(pdf_path: str, workers: Optional[int] = 1) -> str:
+    """
+    Extract the text of a PDF as paragraphs.
+    workers > 1 splits the pages between that many processes (None: one per CPU), the output is the same as serial.
+    """
     # Join paragraphs with double newlines
-    text = '\n\n'.join(paragraphs)
-    text = re.sub(r'[ \t]+', ' ', text)
-    # Fix hyphenated word breaks
-    text = re.sub(r'([a-z])-\s+([a-z])', r'\1\2', text)
-    # Normalize bullet points
-    text = re.sub(r'[•●○◦]', '•', text)
-    # Clean up multiple newlines (more than 2)
-    text = re.sub(r'\n{3,}', '\n\n', text)
-    return text.strip()
\ No newline at end of file
+    return '\n\n'.join(iter_pdf_paragraphs(pdf_path, workers)).strip()
+
+
+def get_parallel_pdf_plumber_message(pdf_path: str) -> str:
+    """get_pdf_plumber_message with the pages split between the CPUs, serial below MIN_PAGES_PER_WORKER * 2 pages"""
+    return get_pdf_plumber_message(pdf_path, workers=None)
+
+
+class PdfTextCache:
+    """
+    On-disk cache of extracted PDF texts keyed by the file content hash, the loader and LOADER_VERSION.
+    The (mtime, size) of already hashed files is remembered, so an unchanged file is not even read again.
+    Least recently used texts are evicted when the cache grows above max_bytes.
+    """
+
+    def __init__(self, cache_dir: str = '.cache/pdf_text', max_bytes: int = 256 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stat_index: Optional[Dict[str, list]] = None
+
+    @property
+    def _index_path(self) -> Path:
+        return self.cache_dir / 'index.json'
+
+    def _load_index(self) -> Dict[str, list]:
+        if self._stat_index is None:
+            try:
+                self._stat_index = json.loads(self._index_path.read_text())
+            except (FileNotFoundError, ValueError):
+                self._stat_index = {}
+        return self._stat_index
+
+    def _write(self, path: Path, text: str):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        tmp_path.write_text(text, encoding='utf-8')
+        os.replace(tmp_path, path)
+
+    def file_hash(self, pdf_path: str) -> str:
+        path = resolve_path(pdf_path)
+        stat = os.stat(path)
+
+        with self._lock:
+            index = self._load_index()
+            entry = index.get(path)
+            # cheap pre-check: same mtime and size, same content
+            if entry and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+                return entry[2]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        digest = digest.hexdigest()
+
+        with self._lock:
+            index = self._load_index()
+            index[path] = [stat.st_mtime_ns, stat.st_size, digest]
+            self._write(self._index_path, json.dumps(index))
+        return digest
+
+    def _entry_path(self, pdf_path: str, loader_name: str) -> Path:
+        return self.cache_dir / f'{self.file_hash(pdf_path)}-{loader_name}-v{LOADER_VERSION}.txt'
+
+    def get(self, pdf_path: str, loader_name: str) -> Optional[str]:
+        path = self._entry_path(pdf_path, loader_name)
+        try:
+            text = path.read_text(encoding='utf-8')
+        except FileNotFoundError:
+            return None
+        os.utime(path)  # mtime is the recency of the entry
+        return text
+
+    def put(self, pdf_path: str, loader_name: str, text: str):
+        self._write(self._entry_path(pdf_path, loader_name), text)
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used texts until the cache fits in max_bytes"""
+        with self._lock:
+            entries = [(entry.stat(), entry) for entry in self.cache_dir.glob('*.txt')]
+            total = sum(stat.st_size for stat, _ in entries)
+            for stat, entry in sorted(entries, key=lambda e: e[0].st_mtime_ns):
+                if total <= self.max_bytes:
+                    break
+                entry.unlink(missing_ok=True)
+                total -= stat.st_size
+
+    def cached(self, loader: Callable[..., str], name: Optional[str] = None) -> Callable[..., str]:
+        """Wrap a loader so the text of a document is extracted once, loaders with the same output may share a name"""
+        name = name or loader.__name__
+
+        @functools.wraps(loader)
+        def cached_loader(pdf_path: str, *args, **kwargs) -> str:
+            text = self.get(pdf_path, name)
+            if text is None:
+                text = loader(pdf_path, *args, **kwargs)
+                self.put(pdf_path, name, text)
+            return text
+
+        return cached_loader
+
+
+pdf_text_cache = PdfTextCache()
+
+get_cached_pdf_plumber_message = pdf_text_cache.cached(get_parallel_pdf_plumber_message, name='pdf_plumber')
@@ -45,8 +45,9 @@ class ColumnOfStickersRequest(BaseModel):
 
 class ImagesRequest(BaseModel):
     topicTitle: str
-    content: List[str] # list of b64 ims. but raw bytes will be more efficient
+    content: List[str] # list of b64 ims or /blobs/<sha256> refs to the server blob store
     spacing: Optional[int] = 20
+    encoding: str = 'base64' # 'base64' or 'blob'
 
     type: str = "addImages"
 
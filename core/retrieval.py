@@ -0,0 +1,67 @@
+import re
+import math
+from collections import Counter
+from typing import Iterable, List
+
+_TOKEN_RE = re.compile(r'\w+')
+
+# words every field description and every page has, they only add noise to the scores
+STOPWORDS = frozenset('''
+a an and are as at be by do does for from has have how in is it its of on or that the their them they this to
+was what when where which who why will with you your
+'''.split())
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+def chunk_text(text: str, max_chars: int = 1000) -> List[str]:
+    """Group consecutive paragraphs (separated by blank lines) into chunks of about max_chars"""
+    chunks, current, size = [], [], 0
+    for paragraph in text.split('\n\n'):
+        if current and size + len(paragraph) > max_chars:
+            chunks.append('\n\n'.join(current))
+            current, size = [], 0
+        current.append(paragraph)
+        size += len(paragraph) + 2
+    if current:
+        chunks.append('\n\n'.join(current))
+    return chunks
+
+
+class BM25Index:
+    """Okapi BM25 over text chunks, built locally in memory"""
+
+    def __init__(self, chunks: List[str], k1: float = 1.5, b: float = 0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+
+        self._term_freqs = [Counter(tokenize(chunk)) for chunk in chunks]
+        self._lengths = [sum(tf.values()) for tf in self._term_freqs]
+        self._avg_length = (sum(self._lengths) / len(chunks)) if chunks else 0
+
+        doc_freqs = Counter(term for tf in self._term_freqs for term in tf)
+        n = len(chunks)
+        self._idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freqs.items()}
+
+    def scores(self, query: str) -> List[float]:
+        terms = [term for term in set(tokenize(query)) if term in self._idf]
+        scores = []
+        for tf, length in zip(self._term_freqs, self._lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / (self._avg_length or 1))
+            scores.append(sum(self._idf[term] * tf[term] * (self.k1 + 1) / (tf[term] + norm)
+                              for term in terms if term in tf))
+        return scores
+
+    def top_k(self, query: str, k: int) -> List[int]:
+        """Indices of the k best chunks for the query, best first. Chunks sharing no term are left out"""
+        scores = self.scores(query)
+        ranked = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        return [i for i in ranked[:k] if scores[i] > 0]
+
+    def select(self, queries: Iterable[str], k: int) -> str:
+        """The k best chunks of every query together, in document order"""
+        selected = sorted({i for query in queries for i in self.top_k(query, k)})
+        return '\n\n'.join(self.chunks[i] for i in selected)
@@ -1,4 +1,4 @@
-from typing import Any, Type, Dict
+from typing import Any, Type, Dict, List, Optional, Union
 
 from pydantic import (
     BaseModel,
@@ -19,8 +19,51 @@ class Settings(BaseSettings):
     prompts: ImportString #[Type[str]] = Field(description='Prompts for LLM inference')
     pipeline_vars: Dict # = Field(description='Prompts for LLM inference')
     response_schema: ImportString[Type[BaseModel]] = Field(description='Response schema for structured LLM return')
-    pdf_loader: ImportString[Callable[[Any], Any]] = Field(description='PDF text loader')
+    pdf_loader: ImportString[Callable[[Any], Any]] = Field(description='PDF text loader, returns the text or an iterator of paragraphs')
     pdf_path: str = Field(description='Path to the PDF (if we have one)')
     runner: ImportString[Type[Any]] = Field(description='Pipeline runner class to use')
+    max_concurrency: int = Field(8, description='Max number of LLM calls a runner sends to the provider at once')
+    field_groups: Optional[Union[int, List[List[str]]]] = Field(None, description='Generate the response schema in that many parallel groups of fields (or explicit lists of field names)')
+    max_pdf_chars: Optional[int] = Field(None, description='Max number of characters of the PDF text put in the prompt')
+    retrieval_top_k: Optional[int] = Field(None, description='Put only the k most relevant chunks of the PDF per schema field in the prompts')
+    queue_url: Optional[str] = Field(None, description='Server the runner sends its messages to when run on its own (e.g. http://localhost:8000)')
+    llm_cache: Optional[str] = Field(None, description="Cache structured LLM calls: 'readwrite', or 'replay' to run offline from the cache only")
+    llm_cache_path: str = Field('.cache/llm_responses.db', description='SQLite file of the LLM response cache')
+    llm_cache_ttl: Optional[float] = Field(None, description='Seconds a cached LLM response is served, forever if not set')
+    llm_cache_max_bytes: int = Field(64 * 1024 * 1024, description='Least recently used LLM responses are evicted above this size')
+    dump_dir: str = Field('llm_responses', description='Directory of the dumps of the results (dump_results)')
+    dump_compress: bool = Field(True, description='Gzip the dumps of the results')
+    dump_max_files: Optional[int] = Field(100, description='Oldest dumps of results are removed above this number')
+    dump_max_age: Optional[float] = Field(None, description='Seconds a dump of results is kept, forever if not set')
 
-    model_config = SettingsConfigDict(env_file='.env')
+    model_config = SettingsConfigDict(env_file='.env', extra='ignore')
+
+
+class ServerSettings(BaseSettings):
+    image_transport: str = Field('base64', description="How images reach the plugin: 'base64' inline or 'blob' references to /blobs")
+    blob_dir: str = Field('blobs', description='Directory of the content-addressed blob store')
+    job_store: str = Field('memory', description="Jobs backend: 'memory', or 'sqlite' / 'redis' to share the jobs between server processes")
+    job_db_path: str = Field('jobs.db', description='SQLite file of the jobs when job_store is sqlite')
+    job_ttl: Optional[float] = Field(None, description='Seconds a completed / failed job is kept, forever if not set')
+    workers: int = Field(1, description='Server processes of python -m server.main, above 1 the jobs and the channels must be shared (sqlite or redis)')
+    job_workers: int = Field(8, description='Number of jobs processed at the same time, they all share the server loop')
+    max_pending_jobs: int = Field(100, description='Jobs waiting for a worker above this are rejected with 429')
+    queue_backend: str = Field('memory', description="Message channels backend: 'memory', or 'sqlite' / 'redis' to share them between server processes")
+    queue_db_path: str = Field('queue.db', description='SQLite file of the message channels when queue_backend is sqlite')
+    redis_url: str = Field('redis://localhost:6379/0', description='Redis server of the redis backends')
+    state_poll_interval: float = Field(1.0, description='Seconds between the checks of the shared jobs / channels for changes made by other server processes')
+    queue_max_memory: int = Field(1000, description='Messages of a channel kept in memory, the rest waits in a spill file')
+    queue_spill_dir: str = Field('.cache/queue_spill', description='Directory of the spill files of the message channels')
+    queue_max_messages: Optional[int] = Field(None, description='Pushes above this number of messages in a channel get a 429, unbounded if not set')
+    replay_path: Optional[str] = Field(None, description='Dump or directory of dumps replayed through /poll and /peek')
+    llm_client_idle_timeout: float = Field(300, description='Seconds a pooled LLM client (and its connections) is kept without jobs using it')
+    llm_cache: Optional[str] = Field(None, description="Cache structured LLM calls: 'readwrite', or 'replay' to run offline from the cache only")
+    llm_cache_path: str = Field('.cache/llm_responses.db', description='SQLite file of the LLM response cache')
+    llm_cache_ttl: Optional[float] = Field(None, description='Seconds a cached LLM response is served, forever if not set')
+    llm_cache_max_bytes: int = Field(64 * 1024 * 1024, description='Least recently used LLM responses are evicted above this size')
+    dump_dir: str = Field('llm_responses', description='Directory of the dumps of the results (dump_results)')
+    dump_compress: bool = Field(True, description='Gzip the dumps of the results')
+    dump_max_files: Optional[int] = Field(100, description='Oldest dumps of results are removed above this number')
+    dump_max_age: Optional[float] = Field(None, description='Seconds a dump of results is kept, forever if not set')
+
+    model_config = SettingsConfigDict(env_file='.env', env_prefix='server_', extra='ignore')
@@ -0,0 +1,58 @@
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+
+class MessageSink:
+    """
+    Destination of the Figma messages of a runner, pass it as on_messages.
+    Called with every batch of ready messages (already dumped dicts).
+    """
+
+    def __call__(self, messages: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class QueueSink(MessageSink):
+    """Runner and server in the same process: messages go straight into the /poll queue, no HTTP involved"""
+
+    def __init__(self, enqueue: Optional[Callable[..., None]] = None, channel: Optional[str] = None):
+        if enqueue is None:
+            # imported here, the server is only needed when the sink is
+            from server.main import enqueue_messages as enqueue
+        self.enqueue = partial(enqueue, channel=channel) if channel else enqueue
+
+    def __call__(self, messages: List[Dict[str, Any]]):
+        self.enqueue(messages)
+
+
+class HttpSink(MessageSink):
+    """Server running apart: every batch is one POST to /push_batch on a keep-alive session"""
+
+    def __init__(self, url: str = 'http://localhost:8000', max_batch_size: int = 100, timeout: float = 30,
+                 session: Optional[requests.Session] = None, channel: Optional[str] = None):
+        self.url = url.rstrip('/') + '/push_batch'
+        self.params = {'channel': channel} if channel else None
+        self.max_batch_size = max_batch_size
+        self.timeout = timeout
+        self.session = session or requests.Session()
+
+    def __call__(self, messages: List[Dict[str, Any]]):
+        # tables and tiles can be big, very large batches are split to keep the requests bounded
+        for i in range(0, len(messages), self.max_batch_size):
+            response = self.session.post(self.url, json=messages[i: i + self.max_batch_size], params=self.params,
+                                         timeout=self.timeout)
+            response.raise_for_status()
+
+    def close(self):
+        self.session.close()
@@ -1,17 +1,14 @@
-from langchain_openai import ChatOpenAI
-
-from server.main import start_server
+from server.main import start_server, enqueue_messages
+from core.sinks import QueueSink
+from core.dumps import DumpWriter
+from core.clients import client_pool
+from core.llm_cache import make_response_cache
 from core.settings import Settings
 
 if __name__ == "__main__":
     settings = Settings()
 
-    model = ChatOpenAI(
-        model=settings.model,
-        openai_api_key=settings.api_key,
-        openai_api_base=settings.api_url,
-        temperature=settings.temperature
-    )
+    model = client_pool.get_chat_model(settings.model, settings.api_key, settings.api_url, settings.temperature)
 
     response_schema = settings.response_schema
 
@@ -21,11 +18,21 @@ if __name__ == "__main__":
     pipeline_vars = settings.pipeline_vars if hasattr(settings, 'pipeline_vars') else {}
 
 
-    runner = settings.runner(model, response_schema, prompts, pdf_loader, pipeline_vars, pdf_path)
+    # the server goes first, so the plugin gets every message as soon as the runner produces it
+    _, thread = start_server(host="0.0.0.0", port=8000)
 
-    messages = runner.run()
+    runner = settings.runner(model, response_schema, prompts, pdf_loader, pipeline_vars, pdf_path,
+                             max_concurrency=settings.max_concurrency,
+                             field_groups=settings.field_groups,
+                             max_pdf_chars=settings.max_pdf_chars,
+                             retrieval_top_k=settings.retrieval_top_k,
+                             response_cache=make_response_cache(settings.llm_cache, settings.llm_cache_path,
+                                                                settings.llm_cache_ttl, settings.llm_cache_max_bytes),
+                             dump_writer=DumpWriter(settings.dump_dir, settings.dump_compress,
+                                                    max_files=settings.dump_max_files, max_age=settings.dump_max_age),
+                             on_messages=QueueSink(enqueue_messages))
 
-    _, thread = start_server(host="0.0.0.0", port=8000, messages=messages)
+    runner.run()
 
     try:
         thread.join()
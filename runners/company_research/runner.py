@@ -1,100 +1,139 @@
-import os
-import cv2
-import time
-import base64
+import asyncio
 import nodriver as uc
-from io import BytesIO
-from typing import List
+from typing import Callable, Dict, List, Optional
+from pydantic import BaseModel
+from concurrent.futures import Executor, ThreadPoolExecutor
 from langchain.schema import SystemMessage, HumanMessage
 
+from core.browser import BrowserPool
+from core.images import ascreenshot_to_tiles
 from core.base_runner import BaseRunner
 from core.models import ImagesRequest
 from runners.company_research.models import Competitor_table, Products_reviews, Competitor, Reviews
 
 class CompanyResearchRunner(BaseRunner):
 
+    # tiles of the competitors' screenshots sent to the board
+    screenshot_tile_height = 720
+    screenshot_jpeg_quality = 95
+
+    # schema of a row -> table holding the rows of all the competitors
+    schemas_to_fill = {Competitor: Competitor_table, Reviews: Products_reviews}
+
     def __call__(self, *args, **kwds):
         return super().__call__(*args, **kwds)
 
     @staticmethod
-    def get_competitors_sites(url_list: List[str]):
-
-        async def main(url: str):
-
-            browser = await uc.start(headless=True)
-
-            page = await browser.get(url)
-            await page.fullscreen()
-            first = await page.find('accept')
-
-            if first:
-                await first.click()
-
-            time.sleep(1)
-            # here we have to deal with saving in the fs because of the nodriver implementation
-            await page.save_screenshot(filename='temp.png', full_page=True)
+    async def aget_competitors_sites(url_list: List[str], max_tabs: int = 4, page_timeout: float = 30,
+                                     tile_height: int = 720, jpeg_quality: int = 95,
+                                     on_site: Optional[Callable[[Dict], None]] = None,
+                                     executor: Optional[Executor] = None):
+        """Screenshots of the sites as ImagesRequest messages, on_site gets each of them once it is ready"""
+        async def capture_and_tile(pool: BrowserPool, i: int, url: str):
+            screenshot = await pool.capture(url)
+            if screenshot is None:
+                return None
+            # decoding and encoding the tiles is CPU work, it goes to the executor while the other tabs are still loading
+            tiles = await ascreenshot_to_tiles(screenshot, tile_height, jpeg_quality, executor)
+            message = ImagesRequest(topicTitle=f'Competitor {i+1}', content=tiles).model_dump()
+            if on_site:
+                on_site(message)
+            return message
+
+        # one browser for the whole batch, sites are loaded in parallel tabs
+        async with BrowserPool(max_tabs=max_tabs, page_timeout=page_timeout) as pool:
+            messages = await asyncio.gather(*(capture_and_tile(pool, i, url) for i, url in enumerate(url_list)))
+
+        return [message for message in messages if message is not None] # will already contain objects send to figma
 
-        return_image_list = [] # will already contain objects send to figma
-        for i, url in enumerate(url_list):
-            uc.loop().run_until_complete(main(url))
-            site_screenshot = cv2.imread('temp.png')
-
-            crops = []
-            for j in range(0, site_screenshot.shape[0] // 720 + 1):
-                tile = site_screenshot[j*720: j*720 + 720, :, :]
-                _, buffer = cv2.imencode('.jpg', tile)
-                io_buf = BytesIO(buffer)
-                img_str = base64.b64encode(io_buf.getvalue()).decode("utf-8").strip('"')
-                crops.append(img_str)
-
-            return_image_list.append(ImagesRequest(topicTitle=f'Competitor {i+1}', content=crops).model_dump())
-
-        os.remove('temp.png')
-
-        return return_image_list
-
-    def fill_tables(self, url_list: List[str]):
-        to_figma_messages = []
-        schemas_to_fill = {Competitor: Competitor_table, Reviews: Products_reviews}
-        for schema, container in schemas_to_fill.items():
-            filled_schemas = {}
+    @staticmethod
+    def get_competitors_sites(url_list: List[str], max_tabs: int = 4, page_timeout: float = 30,
+                              tile_height: int = 720, jpeg_quality: int = 95,
+                              on_site: Optional[Callable[[Dict], None]] = None):
+        """Blocking aget_competitors_sites on the nodriver loop"""
+        with ThreadPoolExecutor() as executor:
+            return uc.loop().run_until_complete(CompanyResearchRunner.aget_competitors_sites(
+                url_list, max_tabs, page_timeout, tile_height, jpeg_quality, on_site, executor))
+
+    def table_requests(self, url_list: List[str]):
+        # run in separate invokes for every single dict to low hallucionations
+        # all the (schema, url) pairs are independent so they go to the provider at once
+        requests = []
+        for schema in self.schemas_to_fill:
             for url in url_list:
-                # run in separate invokes for every single dict to low hallucionations
-                structured_model = self.model.with_structured_output(schema)
                 schema_description = self.to_llm_message(schema, **{'company_name': url})
-                response = structured_model.invoke([
+                # with retrieval on, the parts of the document about this competitor come along
+                context = self.pdf_context(schema, company_name=url) if self.pdf_index is not None else ''
+                requests.append((schema, [
                     SystemMessage(content="You are a helpful assistant that extracts structured data."),
-                    HumanMessage(content=f"Use search to fill the schema: {schema_description}")
-                ])
-                filled_schemas[url] = response.model_dump() # and below sort so the target company will be the first in the tables
+                    HumanMessage(content=('\n'.join((context, f"Use search to fill the schema: {schema_description}"))).strip())
+                ]))
+        return requests
+
+    def tables_from_responses(self, url_list: List[str], responses: List[BaseModel]):
+        to_figma_messages = []
+        responses = iter(responses)
+
+        for schema, container in self.schemas_to_fill.items():
+            # batch results keep the order of requests, so rows keep the url_list order
+            filled_schemas = {url: next(responses).model_dump() for url in url_list}
+            # and below sort so the target company will be the first in the tables
             to_figma_messages.extend(self.to_figma_messages(container(**{container.__name__: filled_schemas}), {container.__name__: self.pipeline_vars['company_name']}))
 
         return to_figma_messages
 
+    def fill_tables(self, url_list: List[str]):
+        return self.tables_from_responses(url_list, self.structured_batch(self.table_requests(url_list)))
+
+    async def afill_tables(self, url_list: List[str]):
+        return self.tables_from_responses(url_list, await self.astructured_batch(self.table_requests(url_list)))
 
     def hook_after(self):
 
         if hasattr(self.llm_response, 'url_list'):
             url_list = self.llm_response.url_list
-            saved_sites_messages = self.get_competitors_sites(url_list)
-            table_messages = self.fill_tables(url_list)
-            return table_messages + saved_sites_messages
+            # browser work doesn't depend on the tables, so it overlaps with the fill_tables LLM calls
+            # every table and screenshot goes to the board as soon as it is ready
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                saved_sites_future = executor.submit(self.get_competitors_sites, url_list,
+                                                     tile_height=self.screenshot_tile_height,
+                                                     jpeg_quality=self.screenshot_jpeg_quality,
+                                                     on_site=lambda message: self.emit([message]))
+                self.emit(self.fill_tables(url_list))
+                saved_sites_future.result()
+
+        return []
+
+    async def ahook_after(self):
+
+        if hasattr(self.llm_response, 'url_list'):
+            url_list = self.llm_response.url_list
+
+            async def tables():
+                self.emit(await self.afill_tables(url_list))
+
+            # the browser and the LLM calls share the running loop, tiles are cut and encoded in the default executor
+            await asyncio.gather(
+                self.aget_competitors_sites(url_list,
+                                            tile_height=self.screenshot_tile_height,
+                                            jpeg_quality=self.screenshot_jpeg_quality,
+                                            on_site=lambda message: self.emit([message])),
+                tables(),
+            )
 
         return []
 
 
 if __name__ == "__main__":
-    from langchain_openai import ChatOpenAI
+    from core.sinks import HttpSink
+    from core.dumps import DumpWriter
+    from core.clients import client_pool
+    from core.llm_cache import make_response_cache
     from core.settings import Settings
 
     settings = Settings()
 
-    model = ChatOpenAI(
-        model=settings.model,
-        openai_api_key=settings.api_key,
-        openai_api_base=settings.api_url,
-        temperature=settings.temperature
-    )
+    model = client_pool.get_chat_model(settings.model, settings.api_key, settings.api_url, settings.temperature)
 
     response_schema = settings.response_schema
 
@@ -104,7 +143,16 @@ if __name__ == "__main__":
     pipeline_vars = settings.pipeline_vars if hasattr(settings, 'pipeline_vars') else {}
 
 
-    runner = settings.runner(model, response_schema, prompts, pdf_loader, pipeline_vars, pdf_path)
+    runner = settings.runner(model, response_schema, prompts, pdf_loader, pipeline_vars, pdf_path,
+                             max_concurrency=settings.max_concurrency,
+                             field_groups=settings.field_groups,
+                             max_pdf_chars=settings.max_pdf_chars,
+                             retrieval_top_k=settings.retrieval_top_k,
+                             response_cache=make_response_cache(settings.llm_cache, settings.llm_cache_path,
+                                                                settings.llm_cache_ttl, settings.llm_cache_max_bytes),
+                             dump_writer=DumpWriter(settings.dump_dir, settings.dump_compress,
+                                                    max_files=settings.dump_max_files, max_age=settings.dump_max_age),
+                             on_messages=HttpSink(settings.queue_url) if settings.queue_url else None)
 
     messages = runner.run()
 
@@ -0,0 +1,65 @@
+import json
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class EventBroker:
+    """
+    Fan-out of server events (new messages, job status changes) to the waiting clients.
+    publish() may be called from any thread (job workers), subscribers are asyncio queues of the server loop.
+    Events published for a job only reach the subscribers of that job, the others reach everyone.
+    """
+
+    def __init__(self):
+        self._subscribers: List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue, Optional[str]]] = []
+        self._lock = threading.Lock()
+
+    def publish(self, event: Dict[str, Any], job_id: Optional[str] = None):
+        with self._lock:
+            subscribers = [s for s in self._subscribers if job_id is None or s[2] == job_id]
+
+        for subscriber in subscribers:
+            loop, queue, _ = subscriber
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:  # the loop of the subscriber is closed
+                self._unsubscribe(subscriber)
+
+    @contextmanager
+    def subscribe(self, job_id: Optional[str] = None) -> Iterator[asyncio.Queue]:
+        """
+        Receive every event published while inside the block, and those of the job if job_id is given.
+        Must be used from a running loop
+        """
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(), job_id)
+        with self._lock:
+            self._subscribers.append(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            self._unsubscribe(subscriber)
+
+    def _unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+
+async def next_event(queue: asyncio.Queue, timeout: Optional[float]) -> Optional[Dict[str, Any]]:
+    """Next event of a subscription, None on timeout"""
+    try:
+        return await asyncio.wait_for(queue.get(), timeout)
+    except asyncio.TimeoutError:
+        return None
+
+
+def sse(data: Any, event: Optional[str] = None) -> str:
+    """Format a Server-Sent Event"""
+    lines = [f'event: {event}'] if event else []
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+SSE_KEEP_ALIVE = ': keep-alive\n\n'
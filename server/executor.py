@@ -0,0 +1,168 @@
+import os
+import time
+import uuid
+import bisect
+import asyncio
+import itertools
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from server.jobs import JobStore, JobStatus
+
+
+class QueueFull(Exception):
+    """Raised when the pending queue of the executor is full"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f'Too many pending jobs, retry in {retry_after}s')
+        self.retry_after = retry_after
+
+
+class JobExecutor:
+    """
+    Runs jobs as asyncio tasks on the server loop, `workers` of them at the same time.
+    Jobs await their network calls (LLM, browser) so they don't hold a thread each, CPU bound
+    stages are offloaded by the jobs themselves.
+    Pending jobs wait in a bounded queue: higher priority first, first come first served within a priority.
+    All the methods must be called from the loop the workers run on (the async endpoints),
+    submit / cancel / position are coroutines so the store backed executor can run its store calls off the loop.
+    """
+
+    def __init__(self, run: Callable[[str], Awaitable[None]], workers: int = 2, max_pending: int = 100):
+        self.run = run
+        self.workers = workers
+        self.max_pending = max_pending
+
+        # sorted by (-priority, seq), the head runs next
+        self._pending: List[Tuple[int, int, str]] = []
+        self._keys: Dict[str, Tuple[int, int, str]] = {}
+        self._seq = itertools.count()
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+        self.running = 0
+        # moving average of a job duration, used to tell the clients when to come back
+        self.avg_duration = 60.0
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        # workers of a closed loop (e.g. a previous test client) are gone with it
+        if self._tasks and self._loop is loop:
+            return
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._tasks = [loop.create_task(self._work(), name=f'job-worker-{i}') for i in range(self.workers)]
+        if self._pending:
+            self._wakeup.set()
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def submit(self, job_id: str, priority: int = 0) -> int:
+        """Queue a job, returns its 1-based position in the queue"""
+        self.start()
+        if len(self._pending) >= self.max_pending:
+            raise QueueFull(self.retry_after())
+
+        key = (-priority, next(self._seq), job_id)
+        bisect.insort(self._pending, key)
+        self._keys[job_id] = key
+        self._wakeup.set()
+        return bisect.bisect_left(self._pending, key) + 1
+
+    async def cancel(self, job_id: str) -> bool:
+        """Remove a job which hasn't started yet"""
+        key = self._keys.pop(job_id, None)
+        if key is None:
+            return False
+        del self._pending[bisect.bisect_left(self._pending, key)]
+        return True
+
+    async def position(self, job_id: str) -> Optional[int]:
+        """1-based position of a pending job, None if the job is not waiting"""
+        key = self._keys.get(job_id)
+        if key is None:
+            return None
+        return bisect.bisect_left(self._pending, key) + 1
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def retry_after(self) -> int:
+        """Rough estimate in seconds of when a slot in the queue frees up"""
+        return max(1, int(self.avg_duration / max(self.workers, 1)))
+
+    async def _work(self):
+        while True:
+            # nothing awaits between the check and the pop, so two workers never take the same job
+            while not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            _, _, job_id = self._pending.pop(0)
+            del self._keys[job_id]
+            await self._run(job_id)
+
+    async def _run(self, job_id: str):
+        self.running += 1
+
+        start = time.monotonic()
+        try:
+            await self.run(job_id)
+        except Exception as e:
+            print(f'Job {job_id} crashed the worker: {e!r}')
+        finally:
+            self.running -= 1
+            self.avg_duration = 0.8 * self.avg_duration + 0.2 * (time.monotonic() - start)
+
+
+class StoreJobExecutor(JobExecutor):
+    """
+    Workers claim the pending jobs straight from a shared JobStore (SQLite file, Redis), so a job sent to
+    any server process runs on whichever process has a free worker, and no job runs twice.
+    A submit wakes up the workers of this process, the jobs sent to the other processes are found by
+    polling the store every poll_interval seconds.
+    The store calls block (sqlite3 waiting for a lock held by another process, a redis round trip),
+    they run in threads so the server loop keeps serving the other requests meanwhile.
+    """
+
+    def __init__(self, run: Callable[[str], Awaitable[None]], jobs: JobStore, workers: int = 2,
+                 max_pending: int = 100, poll_interval: float = 1.0):
+        super().__init__(run, workers, max_pending)
+        self.jobs = jobs
+        self.poll_interval = poll_interval
+        self.worker_id = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+
+    async def submit(self, job_id: str, priority: int = 0) -> Optional[int]:
+        """Wake up the workers for a job already created pending in the store, returns its position"""
+        self.start()
+        # the job itself is counted
+        if await asyncio.to_thread(self.jobs.count, JobStatus.PENDING) > self.max_pending:
+            raise QueueFull(self.retry_after())
+        self._wakeup.set()
+        return await asyncio.to_thread(self.jobs.position, job_id)
+
+    async def cancel(self, job_id: str) -> bool:
+        return await asyncio.to_thread(lambda: self.jobs.position(job_id) is not None and self.jobs.delete(job_id))
+
+    async def position(self, job_id: str) -> Optional[int]:
+        return await asyncio.to_thread(self.jobs.position, job_id)
+
+    @property
+    def pending(self) -> int:
+        return self.jobs.count(JobStatus.PENDING)
+
+    async def _work(self):
+        while True:
+            job = await asyncio.to_thread(self.jobs.claim, self.worker_id)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job["job_id"])
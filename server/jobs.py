@@ -0,0 +1,430 @@
+import json
+import bisect
+import sqlite3
+import threading
+from enum import Enum
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+
+
+class JobStatus(str, Enum):
+    PENDING = "pending"
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+FINISHED_STATUSES = (JobStatus.COMPLETED, JobStatus.FAILED)
+
+
+class JobStore:
+    """
+    Registry of the server jobs. A job is a plain dict with at least
+    job_id, status, created_at and completed_at (iso formatted strings), and an optional integer priority.
+    """
+
+    def create(self, job: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def update(self, job_id: str, **fields) -> bool:
+        """Update fields of a job, returns False if the job doesn't exist (e.g. deleted while processing)"""
+        raise NotImplementedError
+
+    def append_results(self, job_id: str, messages: List[Dict[str, Any]]) -> bool:
+        """
+        Append messages to the results of a job (which start empty if None) without rewriting the previous ones,
+        returns False if the job doesn't exist
+        """
+        raise NotImplementedError
+
+    def delete(self, job_id: str) -> bool:
+        raise NotImplementedError
+
+    def list(self, status: Optional[JobStatus] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Jobs sorted by creation time, newest first"""
+        raise NotImplementedError
+
+    def count(self, status: Optional[JobStatus] = None) -> int:
+        raise NotImplementedError
+
+    def clear(self, status: Optional[JobStatus] = None) -> int:
+        raise NotImplementedError
+
+    def evict_expired(self, ttl: float) -> int:
+        """Delete completed and failed jobs finished more than ttl seconds ago, returns the number of deleted jobs"""
+        raise NotImplementedError
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """
+        Move the next pending job (highest priority, oldest first) to processing and return it,
+        None if nothing waits. Atomic: two workers, even in different processes, never get the same job.
+        """
+        raise NotImplementedError
+
+    def position(self, job_id: str) -> Optional[int]:
+        """1-based position of a pending job in the claim order, None if the job is not waiting"""
+        raise NotImplementedError
+
+    def __contains__(self, job_id: str) -> bool:
+        return self.get(job_id) is not None
+
+    def __len__(self) -> int:
+        return self.count()
+
+
+class InMemoryJobStore(JobStore):
+    """
+    Process local store, lost on restart.
+    Every status keeps its own index of (created_at, job_id) sorted by creation time, updated on each
+    state transition, so counting is O(1) and listing the newest N jobs of a status is O(N).
+    The finished jobs are also indexed by (completed_at, job_id), eviction pops the expired ones from its front.
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        # None indexes all the jobs
+        self._index: Dict[Optional[JobStatus], List[Tuple[str, str]]] = {None: [], **{status: [] for status in JobStatus}}
+        self._finished: List[Tuple[str, str]] = []
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _key(job: Dict[str, Any]) -> Tuple[str, str]:
+        return job["created_at"], job["job_id"]
+
+    @staticmethod
+    def _finished_key(job: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+        if JobStatus(job["status"]) in FINISHED_STATUSES and job.get("completed_at"):
+            return job["completed_at"], job["job_id"]
+        return None
+
+    def _index_add(self, status: Optional[JobStatus], key: Tuple[str, str]):
+        self._insort(self._index[status], key)
+
+    def _index_remove(self, status: Optional[JobStatus], key: Tuple[str, str]):
+        self._remove(self._index[status], key)
+
+    @staticmethod
+    def _insort(index: List[Tuple[str, str]], key: Tuple[str, str]):
+        # jobs are created (and finished) in time order, so this is an append in practice
+        if not index or index[-1] <= key:
+            index.append(key)
+        else:
+            bisect.insort(index, key)
+
+    @staticmethod
+    def _remove(index: List[Tuple[str, str]], key: Tuple[str, str]):
+        i = bisect.bisect_left(index, key)
+        if i < len(index) and index[i] == key:
+            del index[i]
+
+    def create(self, job):
+        with self._lock:
+            if job["job_id"] in self._jobs:
+                self.delete(job["job_id"])
+            self._jobs[job["job_id"]] = job
+            key = self._key(job)
+            self._index_add(None, key)
+            self._index_add(JobStatus(job["status"]), key)
+            if finished := self._finished_key(job):
+                self._insort(self._finished, finished)
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+
+            old_status = JobStatus(job["status"])
+            old_finished = self._finished_key(job)
+            job.update(fields)
+            new_status = JobStatus(job["status"])
+
+            if new_status != old_status:
+                key = self._key(job)
+                self._index_remove(old_status, key)
+                self._index_add(new_status, key)
+            if (new_finished := self._finished_key(job)) != old_finished:
+                if old_finished:
+                    self._remove(self._finished, old_finished)
+                if new_finished:
+                    self._insort(self._finished, new_finished)
+            return True
+
+    def append_results(self, job_id, messages):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            if job.get("results") is None:
+                job["results"] = []
+            job["results"].extend(messages)
+            return True
+
+    def delete(self, job_id):
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is None:
+                return False
+            key = self._key(job)
+            self._index_remove(None, key)
+            self._index_remove(JobStatus(job["status"]), key)
+            if finished := self._finished_key(job):
+                self._remove(self._finished, finished)
+            return True
+
+    def list(self, status=None, limit=50):
+        with self._lock:
+            index = self._index[JobStatus(status) if status else None]
+            newest = index[:-limit - 1:-1] if limit > 0 else []
+            return [self._jobs[job_id] for _, job_id in newest]
+
+    def count(self, status=None):
+        return len(self._index[JobStatus(status) if status else None])
+
+    def clear(self, status=None):
+        with self._lock:
+            if status is None:
+                count = len(self._jobs)
+                self._jobs.clear()
+                for index in self._index.values():
+                    index.clear()
+                self._finished.clear()
+                return count
+
+            status = JobStatus(status)
+            deleted = self._index[status]
+            self._index[status] = []
+            for _, job_id in deleted:
+                del self._jobs[job_id]
+            deleted_ids = {job_id for _, job_id in deleted}
+            self._index[None] = [key for key in self._index[None] if key[1] not in deleted_ids]
+            if status in FINISHED_STATUSES:
+                self._finished = [key for key in self._finished if key[1] not in deleted_ids]
+            return len(deleted)
+
+    def evict_expired(self, ttl):
+        deadline = (datetime.now() - timedelta(seconds=ttl)).isoformat()
+        deleted = 0
+        with self._lock:
+            # only the expired jobs are looked at, they are the oldest finished ones
+            while self._finished and self._finished[0][0] < deadline:
+                self.delete(self._finished[0][1])
+                deleted += 1
+        return deleted
+
+    def _claim_order(self) -> List[Tuple[int, str, str]]:
+        return sorted((-self._jobs[job_id].get("priority", 0), created_at, job_id)
+                      for created_at, job_id in self._index[JobStatus.PENDING])
+
+    def claim(self, worker):
+        with self._lock:
+            order = self._claim_order()
+            if not order:
+                return None
+            job_id = order[0][2]
+            self.update(job_id, status=JobStatus.PROCESSING, worker=worker)
+            return self._jobs[job_id]
+
+    def position(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != JobStatus.PENDING:
+                return None
+            return bisect.bisect_left(self._claim_order(), (-job.get("priority", 0), job["created_at"], job_id)) + 1
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Jobs persisted in SQLite (WAL mode), survive restarts.
+    status, priority, created_at and completed_at are kept in indexed columns next to the json of the job,
+    so status filtered listing, counting, claiming and eviction don't scan the table.
+    Appended results go to a table of their own, read back with the job, until an update sets the results.
+    Several server processes can share the file: updates and claims run in write transactions.
+    """
+
+    def __init__(self, path: str = 'jobs.db'):
+        self.path = path
+        self._lock = threading.RLock()
+        # a busy database (another process writing) is waited for up to 30s
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                completed_at TEXT,
+                data TEXT NOT NULL
+            );
+        """)
+        # databases of older versions don't have the priority column
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "priority" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+        self._conn.executescript("""
+            CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+            CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created_at);
+            CREATE INDEX IF NOT EXISTS jobs_status_completed ON jobs (status, completed_at);
+            CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority DESC, created_at, job_id);
+            CREATE TABLE IF NOT EXISTS job_results (
+                seq INTEGER PRIMARY KEY,
+                job_id TEXT NOT NULL REFERENCES jobs (job_id) ON DELETE CASCADE,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS job_results_job ON job_results (job_id, seq);
+        """)
+
+    @staticmethod
+    def _status(status) -> Optional[str]:
+        return JobStatus(status).value if status is not None else None
+
+    def _execute(self, sql: str, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction, taken before reading so no other process changes the rows in between"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def create(self, job):
+        self._execute(
+            "INSERT INTO jobs (job_id, status, priority, created_at, completed_at, data) VALUES (?, ?, ?, ?, ?, ?)",
+            (job["job_id"], self._status(job["status"]), job.get("priority", 0), job["created_at"],
+             job.get("completed_at"), json.dumps(job)),
+        )
+
+    def _load(self, rows) -> List[Dict[str, Any]]:
+        """Jobs of data rows, with their appended results"""
+        jobs = {job["job_id"]: job for job in (json.loads(row[0]) for row in rows)}
+        if jobs:
+            appended = self._execute(
+                "SELECT job_id, data FROM job_results WHERE job_id IN (SELECT value FROM json_each(?)) ORDER BY seq",
+                (json.dumps(list(jobs)),),
+            )
+            for job_id, data in appended.fetchall():
+                job = jobs[job_id]
+                if job.get("results") is None:
+                    job["results"] = []
+                job["results"].append(json.loads(data))
+        return list(jobs.values())
+
+    def get(self, job_id):
+        with self._lock:
+            jobs = self._load(self._execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchall())
+        return jobs[0] if jobs else None
+
+    def update(self, job_id, **fields):
+        with self._transaction():
+            row = self._execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return False
+            job = json.loads(row[0])
+            job.update(fields)
+            self._execute(
+                "UPDATE jobs SET status = ?, completed_at = ?, data = ? WHERE job_id = ?",
+                (self._status(job["status"]), job.get("completed_at"), json.dumps(job), job_id),
+            )
+            if "results" in fields:
+                self._execute("DELETE FROM job_results WHERE job_id = ?", (job_id,))
+            return True
+
+    def append_results(self, job_id, messages):
+        with self._transaction():
+            if self._execute("SELECT 1 FROM jobs WHERE job_id = ?", (job_id,)).fetchone() is None:
+                return False
+            self._conn.executemany("INSERT INTO job_results (job_id, data) VALUES (?, ?)",
+                                   [(job_id, json.dumps(message)) for message in messages])
+            return True
+
+    def delete(self, job_id):
+        return self._execute("DELETE FROM jobs WHERE job_id = ?", (job_id,)).rowcount > 0
+
+    def list(self, status=None, limit=50):
+        with self._lock:
+            if status:
+                rows = self._execute(
+                    "SELECT data FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?",
+                    (self._status(status), limit),
+                )
+            else:
+                rows = self._execute("SELECT data FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+            return self._load(rows.fetchall())
+
+    def count(self, status=None):
+        if status:
+            row = self._execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (self._status(status),)).fetchone()
+        else:
+            row = self._execute("SELECT COUNT(*) FROM jobs").fetchone()
+        return row[0]
+
+    def clear(self, status=None):
+        if status:
+            return self._execute("DELETE FROM jobs WHERE status = ?", (self._status(status),)).rowcount
+        return self._execute("DELETE FROM jobs").rowcount
+
+    def evict_expired(self, ttl):
+        deadline = (datetime.now() - timedelta(seconds=ttl)).isoformat()
+        deleted = 0
+        for status in FINISHED_STATUSES:
+            deleted += self._execute(
+                "DELETE FROM jobs WHERE status = ? AND completed_at < ?", (status.value, deadline)
+            ).rowcount
+        return deleted
+
+    def claim(self, worker):
+        # a single statement, the pending job is taken by exactly one of the concurrent claims
+        row = self._execute(
+            """
+            UPDATE jobs SET status = ?, data = json_set(data, '$.status', ?, '$.worker', ?)
+            WHERE job_id = (
+                SELECT job_id FROM jobs WHERE status = ? ORDER BY priority DESC, created_at, job_id LIMIT 1
+            )
+            RETURNING data
+            """,
+            (JobStatus.PROCESSING.value, JobStatus.PROCESSING.value, worker, JobStatus.PENDING.value),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def position(self, job_id):
+        with self._lock:
+            row = self._execute("SELECT status, priority, created_at FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None or row[0] != JobStatus.PENDING.value:
+                return None
+            _, priority, created_at = row
+            ahead = self._execute(
+                """
+                SELECT COUNT(*) FROM jobs WHERE status = ? AND (
+                    priority > ? OR (priority = ? AND (created_at < ? OR (created_at = ? AND job_id < ?)))
+                )
+                """,
+                (JobStatus.PENDING.value, priority, priority, created_at, created_at, job_id),
+            ).fetchone()[0]
+            return ahead + 1
+
+
+def make_job_store(backend: str = 'memory', path: str = 'jobs.db', redis_url: str = 'redis://localhost:6379/0') -> JobStore:
+    if backend == 'memory':
+        return InMemoryJobStore()
+    if backend == 'sqlite':
+        return SQLiteJobStore(path)
+    if backend == 'redis':
+        from server.redis_backend import RedisJobStore, redis_client
+        return RedisJobStore(redis_client(redis_url))
+    raise ValueError(f'Unknown job store backend: {backend}')
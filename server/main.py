@@ -1,18 +1,44 @@
+import json
 import uuid
+import asyncio
+import hashlib
 import traceback
-from enum import Enum
-from collections import deque
 from datetime import datetime
-from langchain_openai import ChatOpenAI
-from typing import Any, List, Optional, Dict, Type
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, List, Optional, Dict, Type, Union
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, create_model, Field
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-
-from core.loaders import get_pdf_plumber_message
+from pydantic import BaseModel, TypeAdapter, ValidationError, create_model, Field
+from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+
+from core.cache import LRUCache
+from core.clients import client_pool
+from core.llm_cache import make_response_cache
+from core.dumps import DumpWriter
+from core.settings import ServerSettings
+from core.loaders import get_cached_pdf_plumber_message
+from core.blobs import BlobStore, offload_images, inline_images, guess_media_type, blob_url
+from server.jobs import JobStatus, FINISHED_STATUSES, make_job_store
+from server.events import EventBroker, next_event, sse, SSE_KEEP_ALIVE
+from server.executor import JobExecutor, StoreJobExecutor, QueueFull
+from server.replay import ReplayQueue, dump_blob_store
+from server.queues import ChannelFull, DEFAULT_CHANNEL, make_message_queue
 from runners.company_research.runner import CompanyResearchRunner
 
-app = FastAPI()
+settings = ServerSettings()
+client_pool.idle_timeout = settings.llm_client_idle_timeout
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # with a shared job store every process claims jobs, not only the ones which received some
+    executor.start()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS for Figma plugin
 app.add_middleware(
@@ -23,24 +49,64 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory queue for /poll, /push, /peek
-message_queue = deque(maxlen=1000)
+# Channels of messages for /poll, /push, /peek: in memory by default (a channel above queue_max_memory
+# messages spills to disk), in SQLite or Redis to be shared by several server processes
+queues = make_message_queue(settings.queue_backend, settings.queue_max_memory, settings.queue_spill_dir,
+                            settings.queue_max_messages, settings.queue_db_path, settings.redis_url)
+
+# Storage for jobs, in-memory by default, SQLite to survive restarts, SQLite or Redis to be shared
+jobs = make_job_store(settings.job_store, settings.job_db_path, settings.redis_url)
+
+# Jobs run on dedicated workers. The pending ones wait in a bounded priority queue of this process,
+# or with a shared job store in the store itself, claimed by the workers of every process
+if settings.job_store == 'memory':
+    executor = JobExecutor(lambda job_id: process_job(job_id), workers=settings.job_workers,
+                           max_pending=settings.max_pending_jobs)
+else:
+    executor = StoreJobExecutor(lambda job_id: process_job(job_id), jobs, workers=settings.job_workers,
+                                max_pending=settings.max_pending_jobs, poll_interval=settings.state_poll_interval)
+
+# The events of the other processes don't reach this one: with shared state the waits re-check it regularly
+shared_state = settings.queue_backend != 'memory' or settings.job_store != 'memory'
+
+# Wakes up long polls and SSE streams on new messages and job status changes
+events = EventBroker()
+
+# Upper bound of a long poll and the interval of SSE keep-alive comments
+MAX_POLL_WAIT = 60
+KEEP_ALIVE_INTERVAL = 15
+
+# Opt-in cache of the structured LLM calls of the jobs (SERVER_LLM_CACHE)
+response_cache = make_response_cache(settings.llm_cache, settings.llm_cache_path,
+                                     settings.llm_cache_ttl, settings.llm_cache_max_bytes)
+
+# Results of the jobs are dumped in the background, one file per job
+dump_writer = DumpWriter(settings.dump_dir, settings.dump_compress,
+                         max_files=settings.dump_max_files, max_age=settings.dump_max_age)
+
+# Response models built by restore_pydantic_schema, every new class stays in memory so they are bounded
+SCHEMA_CACHE_SIZE = 128
+schema_cache = LRUCache(SCHEMA_CACHE_SIZE)
+
+# Screenshots behind /blobs when image_transport is 'blob'
+blob_store = BlobStore(settings.blob_dir)
+
+# Images of the dumps being replayed (see replay_dumps), also served by /blobs
+replay_blob_store: Optional[BlobStore] = None
+
+# Messages of a stream are drained by batches, a replayed queue may be huge
+STREAM_BATCH_SIZE = 100
 
-# In-memory storage for jobs
-jobs: Dict[str, Dict[str, Any]] = {}
+
+def wait_interval(timeout: float) -> float:
+    """How long to wait for an event before checking the state again"""
+    return min(timeout, settings.state_poll_interval) if shared_state else timeout
 
 
 runners_facade = {
     'company_research': CompanyResearchRunner,
 }
 
-class JobStatus(str, Enum):
-    PENDING = "pending"
-    PROCESSING = "processing"
-    COMPLETED = "completed"
-    FAILED = "failed"
-
-
 class Message(BaseModel):
     type: str
     topicTitle: str
@@ -53,6 +119,11 @@ class Message(BaseModel):
     font: Optional[str] = None
     size: Optional[int] = None
     spacing: Optional[int] = None
+    encoding: Optional[str] = None
+
+
+message_batch_adapter = TypeAdapter(List[Message])
+messages_adapter = TypeAdapter(List[Dict[str, Any]])
 
 
 class JobRequest(BaseModel):
@@ -63,6 +134,10 @@ class JobRequest(BaseModel):
     runner: Optional[str] = None
     pipeline_vars: Optional[Dict[str, str]] = None
     llm_config: Dict[str, str]
+    priority: int = 0  # higher runs first
+    field_groups: Optional[Union[int, List[List[str]]]] = None  # see BaseRunner.split_schema
+    retrieval_top_k: Optional[int] = None  # only the relevant chunks of the PDF in the prompts
+    channel: Optional[str] = None  # the messages of the job are queued in this channel too (e.g. the board id)
 
 
 class JobResponse(BaseModel):
@@ -70,6 +145,7 @@ class JobResponse(BaseModel):
     job_id: str
     status: JobStatus
     message: str
+    queue_position: Optional[int] = None
 
 
 class JobResultResponse(BaseModel):
@@ -80,83 +156,267 @@ class JobResultResponse(BaseModel):
     error: Optional[str] = None
     created_at: str
     completed_at: Optional[str] = None
+    queue_position: Optional[int] = None  # 1-based position among the pending jobs
+
+
+async def in_store(func, *args, **kwargs):
+    """
+    Call the job store. The SQLite and Redis stores block (a SQLite file locked by another process
+    is waited for up to 30s), they are called from a thread so the loop keeps serving the other requests.
+    """
+    if settings.job_store == 'memory':
+        return func(*args, **kwargs)
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+
+async def in_queue(func, *args, **kwargs):
+    """Call the message channels, from a thread with the SQLite and Redis backends like in_store"""
+    if settings.queue_backend == 'memory':
+        return func(*args, **kwargs)
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+
+async def evict_expired_jobs():
+    """Drop finished jobs older than job_ttl, if set"""
+    if settings.job_ttl is not None:
+        await in_store(jobs.evict_expired, settings.job_ttl)
+
+
+def ingest_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Prepare a message for the queue / job results: images become blob references if enabled"""
+    if settings.image_transport == 'blob':
+        return offload_images(message, blob_store)
+    return message
+
+
+def enqueue_messages(messages: List[Dict[str, Any]], channel: str = DEFAULT_CHANNEL) -> int:
+    """Queue messages in a channel, the waiting clients are woken up once per batch. Returns the size of the channel"""
+    if not messages:
+        return queues.size(channel)
+    size = queues.push(channel, [ingest_message(m) for m in messages])
+    events.publish({"type": "message", "channel": channel})
+    return size
+
+
+def drain_queue(limit: int, channel: str = DEFAULT_CHANNEL) -> List[Dict[str, Any]]:
+    return queues.take(channel, max(limit, 0))[1]
+
+
+def json_response(messages: List[Dict[str, Any]]) -> Response:
+    # serialized by pydantic-core in one pass instead of the jsonable_encoder walk of a returned list
+    return Response(messages_adapter.dump_json(messages), media_type="application/json")
+
+
+def update_job(job_id: str, **fields) -> bool:
+    """Update a job and notify the subscribers when its status changes"""
+    updated = jobs.update(job_id, **fields)
+    if updated and "status" in fields:
+        events.publish({"type": "status", "job_id": job_id, "status": JobStatus(fields["status"]).value})
+    return updated
 
 
 # ============================================================================
 # EXISTING ENDPOINTS (unchanged)
 # ============================================================================
 
+async def push_to_channel(messages: List[Dict[str, Any]], channel: str) -> int:
+    try:
+        return await in_queue(enqueue_messages, messages, channel)
+    except ChannelFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
 @app.post("/push")
-async def push_message(message: Message):
+async def push_message(message: Message, channel: str = DEFAULT_CHANNEL):
     """Your app pushes messages here"""
-    message_queue.append(message.model_dump())
-    return {"status": "ok", "queue_size": len(message_queue)}
+    size = await push_to_channel([message.model_dump()], channel)
+    return {"status": "ok", "queue_size": size}
+
+
+@app.post("/push_batch")
+async def push_messages(request: Request, channel: str = DEFAULT_CHANNEL):
+    """Push a JSON array of messages in one request, validated in a single pass"""
+    try:
+        messages = message_batch_adapter.validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+
+    size = await push_to_channel([message.model_dump() for message in messages], channel)
+    return {"status": "ok", "count": len(messages), "queue_size": size}
 
 
 @app.get("/poll")
-async def poll_messages(limit: int = 50) -> List[dict]:
-    """Figma plugin polls messages here"""
-    messages = []
-    for _ in range(min(limit, len(message_queue))):
-        if message_queue:
-            messages.append(message_queue.popleft())
-    return messages
+async def poll_messages(limit: int = 50, wait: float = 0, channel: str = DEFAULT_CHANNEL,
+                        lease: Optional[float] = None) -> Response:
+    """
+    Figma plugin polls messages here.
+    With wait > 0 an empty queue holds the request up to wait seconds until a message arrives (long poll).
+    With lease (seconds) the messages come with an X-Lease-Id header and are delivered again
+    unless POST /ack confirms them in time.
+    """
+    if wait > 0 and not await in_queue(queues.size, channel):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + min(wait, MAX_POLL_WAIT)
+        with events.subscribe() as subscription:
+            # checked after subscribing so a message pushed in between is not missed
+            while not await in_queue(queues.size, channel):
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                await next_event(subscription, wait_interval(remaining))
+
+    lease_id, messages = await in_queue(queues.take, channel, max(limit, 0), lease)
+    response = json_response(messages)
+    if lease_id:
+        response.headers["X-Lease-Id"] = lease_id
+    return response
+
+
+@app.post("/ack")
+async def ack_messages(lease_id: str, channel: str = DEFAULT_CHANNEL):
+    """Confirm the delivery of the messages of a /poll lease"""
+    if not await in_queue(queues.ack, channel, lease_id):
+        raise HTTPException(status_code=404, detail="Lease not found or expired")
+    return {"status": "ok"}
+
+
+@app.get("/stream")
+async def stream_messages(channel: str = DEFAULT_CHANNEL):
+    """Server-Sent Events alternative to /poll: queued messages are pushed to the client as they arrive"""
+
+    async def event_stream():
+        loop = asyncio.get_running_loop()
+        with events.subscribe() as subscription:
+            last_sent = loop.time()
+            while True:
+                while messages := await in_queue(drain_queue, STREAM_BATCH_SIZE, channel):
+                    for message in messages:
+                        yield sse(message, event="message")
+                    last_sent = loop.time()
+                idle = loop.time() - last_sent
+                if await next_event(subscription, wait_interval(max(KEEP_ALIVE_INTERVAL - idle, 0))) is None \
+                        and loop.time() - last_sent >= KEEP_ALIVE_INTERVAL:
+                    yield SSE_KEEP_ALIVE
+                    last_sent = loop.time()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 
 @app.get("/peek")
-async def peek_queue(limit: int = 10) -> List[dict]:
+async def peek_queue(limit: int = 10, channel: str = DEFAULT_CHANNEL) -> Response:
     """Check queue without removing messages"""
-    return list(message_queue)[:limit]
+    return json_response(await in_queue(queues.peek, channel, max(limit, 0)))
+
+
+def job_counts() -> Dict[str, int]:
+    return {
+        "active_jobs": len(jobs),
+        "queued_jobs": executor.pending,
+        "running_jobs": executor.running,
+        "pending_jobs": jobs.count(JobStatus.PENDING),
+        "processing_jobs": jobs.count(JobStatus.PROCESSING),
+    }
 
 
 @app.get("/status")
 async def get_status():
     """Check queue status"""
     return {
-        "queue_size": len(message_queue),
-        "max_size": message_queue.maxlen,
-        "active_jobs": len(jobs),
-        "pending_jobs": len([j for j in jobs.values() if j["status"] == JobStatus.PENDING]),
-        "processing_jobs": len([j for j in jobs.values() if j["status"] == JobStatus.PROCESSING]),
+        "queue_size": await in_queue(queues.size),
+        "max_size": settings.queue_max_messages,
+        "channels": await in_queue(queues.channels),
+        **await in_store(job_counts),
+        "llm_clients": client_pool.stats(),
     }
 
 
 @app.delete("/clear")
-async def clear_queue():
-    """Clear all messages"""
-    message_queue.clear()
+async def clear_queue(channel: Optional[str] = None):
+    """Clear all messages, of one channel or of all of them"""
+    await in_queue(queues.clear, channel)
     return {"status": "cleared"}
 
 
+# ============================================================================
+# BLOB ENDPOINTS
+# ============================================================================
+
+@app.get("/blobs/{digest}")
+async def get_blob(digest: str, request: Request):
+    """Serve an image by its sha256, the content never changes so clients may cache it forever"""
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+
+    store = blob_store
+    if digest not in store and replay_blob_store is not None:
+        store = replay_blob_store
+    if digest not in store:
+        raise HTTPException(status_code=404, detail="Blob not found")
+
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    data = store.get(digest)
+    return Response(content=data, media_type=guess_media_type(data), headers=headers)
+
+
+@app.post("/blobs")
+async def put_blob(request: Request):
+    """Upload raw image bytes, returns the reference to put in ImagesRequest.content"""
+    digest = blob_store.put(await request.body())
+    return {"digest": digest, "url": blob_url(digest)}
+
+
 # ============================================================================
 # NEW JOB MANAGEMENT ENDPOINTS
 # ============================================================================
 
 @app.post("/send_job", response_model=JobResponse)
-async def send_job(job_request: JobRequest, background_tasks: BackgroundTasks):
+async def send_job(job_request: JobRequest):
     """
     Submit a new job for processing.
     Returns job_id immediately and processes in background.
+    Answers 429 with Retry-After when too many jobs are already waiting.
     """
+    await evict_expired_jobs()
+
     job_id = str(uuid.uuid4())
 
-    jobs[job_id] = {
+    await in_store(jobs.create, {
         "job_id": job_id,
         "status": JobStatus.PENDING,
+        "priority": job_request.priority,
         "request": job_request.model_dump(),
         "results": None,
         "error": None,
         "created_at": datetime.now().isoformat(),
         "completed_at": None,
-    }
+    })
 
     # Schedule background processing
-    background_tasks.add_task(process_job, job_id)
+    try:
+        position = await executor.submit(job_id, job_request.priority)
+    except QueueFull as e:
+        await in_store(jobs.delete, job_id)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
 
     return JobResponse(
         job_id=job_id,
         status=JobStatus.PENDING,
-        message="Job submitted successfully"
+        message="Job submitted successfully",
+        queue_position=position,
+    )
+
+
+async def job_result(job: Dict[str, Any]) -> JobResultResponse:
+    return JobResultResponse(
+        job_id=job["job_id"],
+        status=job["status"],
+        results=job["results"],
+        error=job["error"],
+        created_at=job["created_at"],
+        completed_at=job["completed_at"],
+        queue_position=await executor.position(job["job_id"]),
     )
 
 
@@ -166,57 +426,90 @@ async def get_results(job_id: str):
     Poll for job results by job_id.
     Returns pending status if not complete, or results when done.
     """
-    if job_id not in jobs:
+    job = await in_store(jobs.get, job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    job = jobs[job_id]
+    return await job_result(job)
 
-    return JobResultResponse(
-        job_id=job["job_id"],
-        status=job["status"],
-        results=job["results"],
-        error=job["error"],
-        created_at=job["created_at"],
-        completed_at=job["completed_at"],
-    )
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Server-Sent Events of a job: a `status` event with the JobResultResponse on every status change
+    and a `messages` event with the new Figma messages whenever the runner produces some.
+    The stream ends once the job is completed / failed (the last event holds the results) or deleted.
+    """
+    if await in_store(jobs.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        loop = asyncio.get_running_loop()
+        with events.subscribe(job_id) as subscription:
+            status = None
+            last_sent = loop.time()
+            while True:
+                job = await in_store(jobs.get, job_id)
+                if job is None:
+                    yield sse({"job_id": job_id}, event="deleted")
+                    return
+
+                if job["status"] != status:
+                    status = job["status"]
+                    yield sse((await job_result(job)).model_dump(mode="json"), event="status")
+                    last_sent = loop.time()
+                    if status in FINISHED_STATUSES:
+                        return
+
+                # wait for a change of this job, other events are skipped. A job run by another process
+                # sends no events here, with shared state it is reloaded at every wait interval
+                while True:
+                    idle = loop.time() - last_sent
+                    event = await next_event(subscription, wait_interval(max(KEEP_ALIVE_INTERVAL - idle, 0)))
+                    if event is None:
+                        if loop.time() - last_sent >= KEEP_ALIVE_INTERVAL:
+                            yield SSE_KEEP_ALIVE
+                            last_sent = loop.time()
+                        if shared_state:
+                            break
+                    elif event["type"] == "messages":
+                        yield sse(event["messages"], event="messages")
+                        last_sent = loop.time()
+                    elif event["type"] in ("status", "deleted") and event.get("job_id") in (job_id, None):
+                        break
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 
 @app.get("/list_jobs")
 async def list_jobs(status: Optional[JobStatus] = None, limit: int = 50):
     """List all jobs, optionally filtered by status"""
-    job_list = list(jobs.values())
-
-    if status:
-        job_list = [j for j in job_list if j["status"] == status]
-
-    # Sort by creation time, newest first
-    job_list.sort(key=lambda x: x["created_at"], reverse=True)
+    await evict_expired_jobs()
 
-    return job_list[:limit]
+    # Sorted by creation time, newest first
+    return await in_store(jobs.list, status, limit)
 
 
 @app.delete("/delete_job/{job_id}")
 async def delete_job(job_id: str):
     """Delete a job from the system"""
-    if job_id not in jobs:
+    if not await in_store(jobs.delete, job_id):
         raise HTTPException(status_code=404, detail="Job not found")
+    await executor.cancel(job_id)
+    events.publish({"type": "deleted", "job_id": job_id})
 
-    del jobs[job_id]
     return {"status": "deleted", "job_id": job_id}
 
 
 @app.delete("/clear_jobs")
 async def clear_jobs(status: Optional[JobStatus] = None):
     """Clear jobs, optionally filtered by status"""
-    if status:
-        jobs_to_delete = [job_id for job_id, job in jobs.items() if job["status"] == status]
-        for job_id in jobs_to_delete:
-            del jobs[job_id]
-        return {"status": "cleared", "deleted_count": len(jobs_to_delete)}
-    else:
-        count = len(jobs)
-        jobs.clear()
-        return {"status": "cleared", "deleted_count": count}
+    if status in (None, JobStatus.PENDING):
+        for job in await in_store(lambda: jobs.list(JobStatus.PENDING, limit=jobs.count(JobStatus.PENDING))):
+            await executor.cancel(job["job_id"])
+    deleted_count = await in_store(jobs.clear, status)
+    events.publish({"type": "deleted", "job_id": None})
+    return {"status": "cleared", "deleted_count": deleted_count}
 
 
 # ============================================================================
@@ -230,6 +523,8 @@ def restore_pydantic_schema(
 ) -> Type[BaseModel]:
     """
     Compose a Pydantic model from a dictionary schema.
+    Plugin users send the same board schema again and again, so models are memoized
+    by a hash of the canonical json of the schema (LRU bounded, see SCHEMA_CACHE_SIZE).
 
     Args:
         schema_dict: Dictionary containing the schema definition
@@ -257,6 +552,19 @@ def restore_pydantic_schema(
             }
         }
     """
+    if additional_fields:
+        # arbitrary field definitions, not worth hashing
+        return _build_pydantic_schema(schema_dict, model_name, additional_fields)
+
+    key = hashlib.sha256(json.dumps([schema_dict, model_name], sort_keys=True).encode()).hexdigest()
+    return schema_cache.get_or_create(key, lambda: _build_pydantic_schema(schema_dict, model_name))
+
+
+def _build_pydantic_schema(
+    schema_dict: Dict[str, Any],
+    model_name: str,
+    additional_fields: Optional[Dict[str, Any]] = None
+) -> Type[BaseModel]:
 
     type_mapping = {
         'Sticker': str,
@@ -299,21 +607,32 @@ def restore_pydantic_schema(
 
 
 
-def process_job(job_id: str):
+async def process_job(job_id: str):
     """
     Background task to process a job.
-    This is where the model inference happens.
+    This is where the model inference happens, on the server loop: LLM calls and the browser are awaited,
+    the runner offloads the CPU bound stages (PDF extraction, image tiles) to threads.
+    The updates of the job are written by a thread of its own: in order, and off the loop with a blocking store.
     """
+    job = await in_store(jobs.get, job_id)
+    if job is None:  # deleted while waiting
+        return
+
+    writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='job-writer')
+
+    async def save(**fields):
+        await asyncio.wrap_future(writer.submit(update_job, job_id, **fields))
+
     try:
-        jobs[job_id]["status"] = JobStatus.PROCESSING
-        request_data = jobs[job_id]["request"]
+        await save(status=JobStatus.PROCESSING)
+        request_data = job["request"]
 
         llm_config = request_data.get("llm_config", {})
-        model = ChatOpenAI(
-            model=llm_config["model_name"],
-            openai_api_key=llm_config["api_key"],
-            openai_api_base=llm_config["model_provider_url"],
-            temperature=llm_config["temperature"],
+        model = client_pool.get_chat_model(
+            llm_config["model_name"],
+            llm_config["api_key"],
+            llm_config["model_provider_url"],
+            llm_config["temperature"],
         )
 
         response_schema = request_data["schema"]
@@ -325,20 +644,53 @@ def process_job(job_id: str):
 
         runner = runners_facade[request_data['runner']]
 
+        # partial results are visible in /get_results and /jobs/{job_id}/events while the job goes on
+        results = []
+        dropped = 0
+
+        def queue_results(channel: str, ingested: List[Dict[str, Any]]):
+            nonlocal dropped
+            try:
+                queues.push(channel, ingested)
+            except ChannelFull as e:
+                # the LLM work is done, the messages stay in the results of the job
+                dropped += len(ingested)
+                print(f"Job {job_id}: {e}, {len(ingested)} messages not queued")
+                update_job(job_id, dropped_messages=dropped)
+                return
+            events.publish({"type": "message", "channel": channel})
+
+        def publish_results(messages: List[Dict[str, Any]]):
+            ingested = [ingest_message(m) for m in messages]
+            results.extend(ingested)
+            # not waited for, the runner goes on while it's written and queued. Only the new batch is written
+            writer.submit(jobs.append_results, job_id, ingested)
+            events.publish({"type": "messages", "job_id": job_id, "messages": ingested}, job_id=job_id)
+            if request_data.get("channel"):
+                writer.submit(queue_results, request_data["channel"], ingested)
+
         runner = runner(
             model,
             response_schema,
             prompts,
-            get_pdf_plumber_message,
+            get_cached_pdf_plumber_message,
             pipeline_vars,
-            pdf_path
+            pdf_path,
+            on_messages=publish_results,
+            field_groups=request_data.get("field_groups"),
+            retrieval_top_k=request_data.get("retrieval_top_k"),
+            response_cache=response_cache,
+            run_id=job_id,
+            dump_writer=dump_writer,
         )
 
-        messages = runner.run()
+        messages = await runner.arun()
 
-        jobs[job_id]["results"] = messages
-        jobs[job_id]["status"] = JobStatus.COMPLETED
-        jobs[job_id]["completed_at"] = datetime.now().isoformat()
+        await save(
+            results=results if results else [ingest_message(m) for m in messages],
+            status=JobStatus.COMPLETED,
+            completed_at=datetime.now().isoformat(),
+        )
 
         print('\n\n\n COMPLETED')
 
@@ -348,17 +700,43 @@ def process_job(job_id: str):
         print(f"Full traceback for job {job_id}:")
         print(error_traceback)
 
-        jobs[job_id]["status"] = JobStatus.FAILED
-        jobs[job_id]["error"] = error_traceback  # Store full traceback instead of just str(e)
-        jobs[job_id]["completed_at"] = datetime.now().isoformat()
+        await save(
+            status=JobStatus.FAILED,
+            error=error_traceback,  # Store full traceback instead of just str(e)
+            completed_at=datetime.now().isoformat(),
+        )
+
+    finally:
+        writer.shutdown(wait=False)
 
 
-def start_server(host="0.0.0.0", port=8000, messages=[]):
-    """Start FastAPI server in background thread"""
+def replay_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Images of a replayed message: inline base64 as the plugin expects by default, blob references otherwise"""
+    if settings.image_transport == 'blob':
+        return offload_images(message, blob_store)
+    return inline_images(message, replay_blob_store)
+
+
+def replay_dumps(path: str):
+    """Serve the messages of a dump (or a directory of dumps) through /poll and /peek, read from disk on demand"""
+    global replay_blob_store
+    replay_blob_store = dump_blob_store(path)
+    queues.replay(DEFAULT_CHANNEL, ReplayQueue.open(path, transform=replay_message))
+
+
+if settings.replay_path:
+    replay_dumps(settings.replay_path)
+
+
+def start_server(host="0.0.0.0", port=8000, messages=[], replay: Optional[str] = None):
+    """Start FastAPI server in background thread, with the messages or the dumps at replay path in the queue"""
     import uvicorn
     import threading
-    global message_queue
-    message_queue = deque(messages, maxlen=1000)
+    if replay:
+        replay_dumps(replay)
+    else:
+        queues.clear()
+        enqueue_messages(messages)
     config = uvicorn.Config(app, host=host, port=port, log_level="info")
     server = uvicorn.Server(config)
 
@@ -367,16 +745,27 @@ def start_server(host="0.0.0.0", port=8000, messages=[]):
     return server, thread
 
 
-if __name__ == "__main__":
-    import json
+def serve(host="0.0.0.0", port=8080, workers: Optional[int] = None):
+    """
+    Run the server in the foreground with `workers` processes (settings.workers by default).
+    Each worker imports this module with the same settings, so above one worker the jobs and the channels
+    must live in a shared backend (SERVER_JOB_STORE and SERVER_QUEUE_BACKEND sqlite or redis).
+    """
     import uvicorn
+    workers = workers or settings.workers
+    if workers == 1:
+        uvicorn.run(app, host=host, port=port)
+        return
+    if settings.job_store == 'memory' or settings.queue_backend == 'memory':
+        raise ValueError('Several workers need a shared job store and queue backend (sqlite or redis)')
+    uvicorn.run("server.main:app", host=host, port=port, workers=workers)
 
-    try:
-        message_queue = deque(
-            json.load(open('to-figma-messages-2025-10-13-08-14-22.json', 'r')),
-            maxlen=1000
-        )
-    except FileNotFoundError:
-        message_queue = deque(maxlen=1000)
 
-    uvicorn.run(app, host="0.0.0.0", port=8080)
\ No newline at end of file
+if __name__ == "__main__":
+    import sys
+
+    # python -m server.main [dump or directory of dumps to replay]
+    if len(sys.argv) > 1:
+        replay_dumps(sys.argv[1])
+
+    serve()
\ No newline at end of file
@@ -0,0 +1,368 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from itertools import islice
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_CHANNEL = 'default'
+
+
+class ChannelFull(Exception):
+    """Raised when a push would take a channel above its limit"""
+
+    def __init__(self, channel: str, retry_after: int = 1):
+        super().__init__(f'Channel {channel!r} is full, retry in {retry_after}s')
+        self.channel = channel
+        self.retry_after = retry_after
+
+
+class MessageQueue:
+    """
+    Queues of Figma messages behind /push, /poll and /peek, one FIFO per named channel (a board, a job...).
+    take() without a lease removes the messages for good, with a lease they come back in front of the channel
+    unless acked before the lease expires.
+    """
+
+    def push(self, channel: str, messages: List[Dict[str, Any]]) -> int:
+        """Append messages to a channel, returns the size of the channel"""
+        raise NotImplementedError
+
+    def take(self, channel: str, limit: int, lease: Optional[float] = None) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        """Up to limit messages from the head of a channel, with the id of their lease if lease (seconds) is given"""
+        raise NotImplementedError
+
+    def ack(self, channel: str, lease_id: str) -> bool:
+        """Confirm the delivery of leased messages, False if the lease is unknown or expired"""
+        raise NotImplementedError
+
+    def peek(self, channel: str, limit: int) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def size(self, channel: Optional[str] = None) -> int:
+        """Messages waiting in a channel (in all of them by default), leased ones excluded"""
+        raise NotImplementedError
+
+    def channels(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+    def clear(self, channel: Optional[str] = None) -> None:
+        raise NotImplementedError
+
+    def replay(self, channel: str, source) -> None:
+        """Serve a ReplayQueue (or any deque-like source) in front of a channel"""
+        raise NotImplementedError(f'{type(self).__name__} cannot replay dumps, use the memory queue backend')
+
+    def __len__(self) -> int:
+        return self.size()
+
+
+class SpillFile:
+    """Append-only JSONL file holding the overflow of a channel, read back from the head"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.count = 0
+        self._offset = 0
+
+    def append(self, messages: List[Dict[str, Any]]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'ab') as f:
+            f.writelines(json.dumps(message, separators=(',', ':')).encode() + b'\n' for message in messages)
+        self.count += len(messages)
+
+    def _lines(self) -> Iterator[Tuple[int, bytes]]:
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            for line in f:
+                yield len(line), line
+
+    def read(self, n: int) -> List[Dict[str, Any]]:
+        """Remove and return the n oldest messages"""
+        if not self.count or n <= 0:
+            return []
+        messages = []
+        for size, line in islice(self._lines(), n):
+            self._offset += size
+            messages.append(json.loads(line))
+        self.count -= len(messages)
+        if not self.count:
+            self.clear()
+        return messages
+
+    def peek(self, n: int) -> List[Dict[str, Any]]:
+        if not self.count or n <= 0:
+            return []
+        return [json.loads(line) for _, line in islice(self._lines(), n)]
+
+    def clear(self):
+        self.path.unlink(missing_ok=True)
+        self.count = 0
+        self._offset = 0
+
+
+class Channel:
+    """
+    FIFO of one channel: the head in memory (up to max_memory messages), the rest spilled to disk.
+    Once something is spilled, new messages go to the spill file too so the order is kept.
+    An optional source (e.g. a ReplayQueue) is consumed before anything pushed.
+    """
+
+    def __init__(self, name: str, max_memory: int, spill_path: Path, max_messages: Optional[int] = None):
+        self.name = name
+        self.max_memory = max_memory
+        self.max_messages = max_messages
+        self.source = None
+        self.memory: deque = deque()
+        self.spill = SpillFile(spill_path)
+        # leased messages, given back in front of the channel when their lease expires
+        self.leases: Dict[str, Tuple[float, List[Dict[str, Any]]]] = {}
+        self.redeliver: deque = deque()
+
+    def __len__(self) -> int:
+        return len(self.redeliver) + len(self.source or ()) + len(self.memory) + self.spill.count
+
+    def pending(self) -> int:
+        """Messages ready to be taken, expired leases included"""
+        self._expire_leases(time.monotonic())
+        return len(self)
+
+    def push(self, messages: List[Dict[str, Any]]):
+        if self.max_messages is not None and len(self) + len(messages) > self.max_messages:
+            raise ChannelFull(self.name)
+
+        rest = messages
+        if not self.spill.count:
+            room = max(self.max_memory - len(self.memory), 0)
+            self.memory.extend(messages[:room])
+            rest = messages[room:]
+        if rest:
+            self.spill.append(rest)
+
+    def _expire_leases(self, now: float):
+        expired = [lease_id for lease_id, (deadline, _) in self.leases.items() if deadline <= now]
+        for lease_id in expired:
+            self.redeliver.extend(self.leases.pop(lease_id)[1])
+
+    def take(self, limit: int) -> List[Dict[str, Any]]:
+        self._expire_leases(time.monotonic())
+        messages = []
+        while len(messages) < limit and self.redeliver:
+            messages.append(self.redeliver.popleft())
+        while len(messages) < limit and self.source:
+            messages.append(self.source.popleft())
+        while len(messages) < limit:
+            if not self.memory:
+                self.memory.extend(self.spill.read(self.max_memory))
+                if not self.memory:
+                    break
+            messages.append(self.memory.popleft())
+        return messages
+
+    def lease(self, limit: int, timeout: float) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        messages = self.take(limit)
+        if not messages:
+            return None, []
+        lease_id = uuid.uuid4().hex
+        self.leases[lease_id] = (time.monotonic() + timeout, messages)
+        return lease_id, messages
+
+    def ack(self, lease_id: str) -> bool:
+        self._expire_leases(time.monotonic())
+        return self.leases.pop(lease_id, None) is not None
+
+    def peek(self, limit: int) -> List[Dict[str, Any]]:
+        self._expire_leases(time.monotonic())
+        messages = list(islice(self.redeliver, limit))
+        if self.source:
+            messages += list(islice(self.source, limit - len(messages)))
+        messages += list(islice(self.memory, limit - len(messages)))
+        return messages + self.spill.peek(limit - len(messages))
+
+    def clear(self):
+        if self.source is not None:
+            self.source.clear()
+        self.memory.clear()
+        self.spill.clear()
+        self.leases.clear()
+        self.redeliver.clear()
+
+
+class LocalMessageQueue(MessageQueue):
+    """
+    Channels of this process. Nothing is evicted: above max_memory messages a channel spills to spill_dir,
+    and a push above max_messages (if set) raises ChannelFull.
+    """
+
+    def __init__(self, max_memory: int = 1000, spill_dir: str = '.cache/queue_spill',
+                 max_messages: Optional[int] = None):
+        self.max_memory = max_memory
+        self.max_messages = max_messages
+        self.spill_dir = Path(spill_dir)
+        # spill files of a previous process are not ours
+        self._prefix = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self._channels: Dict[str, Channel] = {}
+        # runners in the server process push from their own threads
+        self._lock = threading.RLock()
+
+    def channel(self, name: str) -> Channel:
+        with self._lock:
+            if name not in self._channels:
+                # channel names come from the clients, the file name is a hash of it
+                spill_name = f'{self._prefix}-{hashlib.sha256(name.encode()).hexdigest()[:16]}.jsonl'
+                self._channels[name] = Channel(name, self.max_memory, self.spill_dir / spill_name, self.max_messages)
+            return self._channels[name]
+
+    def replay(self, channel, source):
+        with self._lock:
+            self.channel(channel).source = source
+
+    def push(self, channel, messages):
+        with self._lock:
+            queue = self.channel(channel)
+            queue.push(messages)
+            return len(queue)
+
+    def take(self, channel, limit, lease=None):
+        with self._lock:
+            queue = self.channel(channel)
+            if lease:
+                return queue.lease(limit, lease)
+            return None, queue.take(limit)
+
+    def ack(self, channel, lease_id):
+        with self._lock:
+            return channel in self._channels and self._channels[channel].ack(lease_id)
+
+    def peek(self, channel, limit):
+        with self._lock:
+            return self.channel(channel).peek(limit) if channel in self._channels else []
+
+    def size(self, channel=None):
+        with self._lock:
+            if channel is not None:
+                return self._channels[channel].pending() if channel in self._channels else 0
+            return sum(queue.pending() for queue in self._channels.values())
+
+    def channels(self):
+        with self._lock:
+            return {name: queue.pending() for name, queue in self._channels.items()}
+
+    def clear(self, channel=None):
+        with self._lock:
+            for name in ([channel] if channel is not None else list(self._channels)):
+                if name in self._channels:
+                    self._channels.pop(name).clear()
+
+
+class SQLiteMessageQueue(MessageQueue):
+    """
+    Channels in one SQLite table (WAL mode), shared by the server processes which open the same file.
+    Takes and leases are a single DELETE / UPDATE ... RETURNING, so concurrent polls never get the same message.
+    A leased message keeps its row (and its place in the channel) until it is acked or its lease expires.
+    """
+
+    # leases expire on the wall clock, the processes don't share a monotonic one
+    _AVAILABLE = "(lease_until IS NULL OR lease_until <= ?)"
+
+    def __init__(self, path: str = 'queue.db', max_messages: Optional[int] = None):
+        self.path = path
+        self.max_messages = max_messages
+        self._lock = threading.RLock()
+        # a busy database (another process writing) is waited for up to 30s
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel TEXT NOT NULL,
+                lease_id TEXT,
+                lease_until REAL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS messages_channel ON messages (channel, id);
+        """)
+
+    def _execute(self, sql: str, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def push(self, channel, messages):
+        rows = [(channel, json.dumps(message, separators=(',', ':'))) for message in messages]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self.max_messages is not None and self.size(channel) + len(rows) > self.max_messages:
+                    raise ChannelFull(channel)
+                self._conn.executemany("INSERT INTO messages (channel, data) VALUES (?, ?)", rows)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return self.size(channel)
+
+    def take(self, channel, limit, lease=None):
+        if limit <= 0:
+            return None, []
+        now = time.time()
+        select = f"SELECT id FROM messages WHERE channel = ? AND {self._AVAILABLE} ORDER BY id LIMIT ?"
+        lease_id = uuid.uuid4().hex if lease else None
+        if lease:
+            rows = self._execute(
+                f"UPDATE messages SET lease_id = ?, lease_until = ? WHERE id IN ({select}) RETURNING id, data",
+                (lease_id, now + lease, channel, now, limit),
+            ).fetchall()
+        else:
+            rows = self._execute(f"DELETE FROM messages WHERE id IN ({select}) RETURNING id, data",
+                                 (channel, now, limit)).fetchall()
+        if not rows:
+            return None, []
+        # RETURNING doesn't keep the order of the select
+        return lease_id, [json.loads(data) for _, data in sorted(rows)]
+
+    def ack(self, channel, lease_id):
+        return self._execute("DELETE FROM messages WHERE channel = ? AND lease_id = ? AND lease_until > ?",
+                             (channel, lease_id, time.time())).rowcount > 0
+
+    def peek(self, channel, limit):
+        rows = self._execute(f"SELECT data FROM messages WHERE channel = ? AND {self._AVAILABLE} ORDER BY id LIMIT ?",
+                             (channel, time.time(), max(limit, 0))).fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def size(self, channel=None):
+        if channel is None:
+            row = self._execute(f"SELECT COUNT(*) FROM messages WHERE {self._AVAILABLE}", (time.time(),)).fetchone()
+        else:
+            row = self._execute(f"SELECT COUNT(*) FROM messages WHERE channel = ? AND {self._AVAILABLE}",
+                                (channel, time.time())).fetchone()
+        return row[0]
+
+    def channels(self):
+        rows = self._execute(f"SELECT channel, COUNT(*) FROM messages WHERE {self._AVAILABLE} GROUP BY channel",
+                             (time.time(),)).fetchall()
+        return dict(rows)
+
+    def clear(self, channel=None):
+        if channel is None:
+            self._execute("DELETE FROM messages")
+        else:
+            self._execute("DELETE FROM messages WHERE channel = ?", (channel,))
+
+
+def make_message_queue(backend: str = 'memory', max_memory: int = 1000, spill_dir: str = '.cache/queue_spill',
+                       max_messages: Optional[int] = None, path: str = 'queue.db',
+                       redis_url: str = 'redis://localhost:6379/0') -> MessageQueue:
+    if backend == 'memory':
+        return LocalMessageQueue(max_memory, spill_dir, max_messages)
+    if backend == 'sqlite':
+        return SQLiteMessageQueue(path, max_messages)
+    if backend == 'redis':
+        from server.redis_backend import RedisMessageQueue, redis_client
+        return RedisMessageQueue(redis_client(redis_url), max_messages=max_messages)
+    raise ValueError(f'Unknown message queue backend: {backend}')
@@ -0,0 +1,358 @@
+import json
+import time
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from server.jobs import JobStore, JobStatus, FINISHED_STATUSES
+from server.queues import MessageQueue, ChannelFull
+
+try:
+    from redis.exceptions import WatchError
+except ImportError:  # only raised by a redis client, which comes with the package
+    class WatchError(Exception):
+        pass
+
+# pending jobs are scored by -priority * PRIORITY_SCALE + creation timestamp, so any priority step
+# outweighs the creation time and jobs of a priority are claimed oldest first
+PRIORITY_SCALE = 1e10
+
+
+def redis_client(url: str):
+    """Client of a Redis server (or anything speaking its protocol), the redis package is optional"""
+    try:
+        import redis
+    except ImportError:
+        raise ImportError("The redis backend needs the redis package: pip install redis")
+    return redis.Redis.from_url(url, decode_responses=True)
+
+
+def _timestamp(iso: str) -> float:
+    return datetime.fromisoformat(iso).timestamp()
+
+
+class RedisJobStore(JobStore):
+    """
+    Jobs in Redis, shared by every server process pointing at it.
+    A job is a json string, every status has a sorted set of its job ids by creation time
+    and the pending ones also wait in a claim sorted set, the finished ones in a sorted set by completion time
+    which eviction reads from its start. Appended results are pushed to a list of the job,
+    read back with it, until an update sets the results.
+    Claims, updates and deletes read under WATCH and write in a MULTI, retried when something changed meanwhile:
+    an update racing a delete never brings the job back out of its indexes, and a claim takes the job out of
+    the claim set and moves it to processing at once, so a worker dying in between can't lose it.
+    A job whose worker dies while running it stays processing, delete it and send it again.
+    The client must decode the responses (decode_responses=True, see redis_client).
+    """
+
+    def __init__(self, client, prefix: str = 'figjam:'):
+        self.client = client
+        self.prefix = prefix
+
+    def _job_key(self, job_id: str) -> str:
+        return f'{self.prefix}job:{job_id}'
+
+    def _results_key(self, job_id: str) -> str:
+        return f'{self.prefix}job:{job_id}:results'
+
+    def _index_key(self, status=None) -> str:
+        return f'{self.prefix}jobs:{JobStatus(status).value if status else "all"}'
+
+    @property
+    def _claim_key(self) -> str:
+        return f'{self.prefix}jobs:claim'
+
+    @property
+    def _finished_key(self) -> str:
+        return f'{self.prefix}jobs:finished'
+
+    @staticmethod
+    def _finished_score(job) -> Optional[float]:
+        if JobStatus(job["status"]) in FINISHED_STATUSES and job.get("completed_at"):
+            return _timestamp(job["completed_at"])
+        return None
+
+    @staticmethod
+    def _claim_score(job) -> float:
+        return -job.get("priority", 0) * PRIORITY_SCALE + _timestamp(job["created_at"])
+
+    def create(self, job):
+        if job["job_id"] in self:
+            self.delete(job["job_id"])
+        created = _timestamp(job["created_at"])
+        pipe = self.client.pipeline(transaction=True)
+        pipe.set(self._job_key(job["job_id"]), json.dumps(job))
+        pipe.zadd(self._index_key(), {job["job_id"]: created})
+        pipe.zadd(self._index_key(job["status"]), {job["job_id"]: created})
+        if job["status"] == JobStatus.PENDING:
+            pipe.zadd(self._claim_key, {job["job_id"]: self._claim_score(job)})
+        if (finished := self._finished_score(job)) is not None:
+            pipe.zadd(self._finished_key, {job["job_id"]: finished})
+        pipe.execute()
+
+    def get(self, job_id):
+        jobs = self._jobs([job_id])
+        return jobs[0] if jobs else None
+
+    def _transaction(self, job_id, write):
+        """
+        Run write(pipe, job) in a MULTI with the job read under WATCH, again if the job changed before the EXEC.
+        Returns False (and writes nothing) when the job doesn't exist.
+        """
+        with self.client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    pipe.watch(self._job_key(job_id))
+                    data = pipe.get(self._job_key(job_id))
+                    if data is None:
+                        pipe.unwatch()
+                        return False
+                    pipe.multi()
+                    write(pipe, json.loads(data))
+                    pipe.execute()
+                    return True
+                except WatchError:
+                    continue
+
+    def update(self, job_id, **fields):
+        def write(pipe, job):
+            old_status = JobStatus(job["status"])
+            job.update(fields)
+            new_status = JobStatus(job["status"])
+
+            pipe.set(self._job_key(job_id), json.dumps(job))
+            if "results" in fields:
+                pipe.delete(self._results_key(job_id))
+            if new_status != old_status:
+                pipe.zrem(self._index_key(old_status), job_id)
+                pipe.zadd(self._index_key(new_status), {job_id: _timestamp(job["created_at"])})
+                if old_status == JobStatus.PENDING:
+                    pipe.zrem(self._claim_key, job_id)
+            if (finished := self._finished_score(job)) is not None:
+                pipe.zadd(self._finished_key, {job_id: finished})
+            else:
+                pipe.zrem(self._finished_key, job_id)
+
+        return self._transaction(job_id, write)
+
+    def append_results(self, job_id, messages):
+        def write(pipe, job):
+            if messages:
+                pipe.rpush(self._results_key(job_id), *(json.dumps(message) for message in messages))
+
+        return self._transaction(job_id, write)
+
+    def delete(self, job_id):
+        def write(pipe, job):
+            pipe.delete(self._job_key(job_id), self._results_key(job_id))
+            pipe.zrem(self._index_key(), job_id)
+            pipe.zrem(self._index_key(job["status"]), job_id)
+            pipe.zrem(self._claim_key, job_id)
+            pipe.zrem(self._finished_key, job_id)
+
+        return self._transaction(job_id, write)
+
+    def _jobs(self, job_ids):
+        """Jobs of the ids which still exist, with their appended results"""
+        if not job_ids:
+            return []
+        pipe = self.client.pipeline(transaction=False)
+        pipe.mget([self._job_key(job_id) for job_id in job_ids])
+        for job_id in job_ids:
+            pipe.lrange(self._results_key(job_id), 0, -1)
+        found, *appended = pipe.execute()
+
+        jobs = []
+        for data, results in zip(found, appended):
+            if data is None:
+                continue
+            job = json.loads(data)
+            if results:
+                job["results"] = (job.get("results") or []) + [json.loads(message) for message in results]
+            jobs.append(job)
+        return jobs
+
+    def list(self, status=None, limit=50):
+        if limit <= 0:
+            return []
+        return self._jobs(self.client.zrevrange(self._index_key(status), 0, limit - 1))
+
+    def count(self, status=None):
+        return self.client.zcard(self._index_key(status))
+
+    def clear(self, status=None):
+        job_ids = self.client.zrange(self._index_key(status), 0, -1)
+        return sum(self.delete(job_id) for job_id in job_ids)
+
+    def evict_expired(self, ttl):
+        expired = self.client.zrangebyscore(self._finished_key, '-inf', time.time() - ttl)
+        return sum(self.delete(job_id) for job_id in expired)
+
+    def claim(self, worker):
+        with self.client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    pipe.watch(self._claim_key)
+                    head = pipe.zrange(self._claim_key, 0, 0)
+                    if not head:
+                        pipe.unwatch()
+                        return None
+                    job_id = head[0]
+                    pipe.watch(self._job_key(job_id))
+                    data = pipe.get(self._job_key(job_id))
+                    pipe.multi()
+                    if data is None:
+                        # left behind by a delete, dropped and the next one is tried
+                        pipe.zrem(self._claim_key, job_id)
+                        pipe.execute()
+                        continue
+                    job = json.loads(data)
+                    old_status = JobStatus(job["status"])
+                    job.update(status=JobStatus.PROCESSING, worker=worker)
+                    pipe.set(self._job_key(job_id), json.dumps(job))
+                    pipe.zrem(self._claim_key, job_id)
+                    pipe.zrem(self._index_key(old_status), job_id)
+                    pipe.zadd(self._index_key(JobStatus.PROCESSING), {job_id: _timestamp(job["created_at"])})
+                    pipe.execute()
+                    return job
+                except WatchError:
+                    continue
+
+    def position(self, job_id):
+        rank = self.client.zrank(self._claim_key, job_id)
+        return None if rank is None else rank + 1
+
+
+class RedisMessageQueue(MessageQueue):
+    """
+    Channels in Redis lists, shared by every server process pointing at it.
+    Takes are one MULTI (LRANGE + LTRIM) so concurrent polls never get the same message.
+    Leased takes move the messages (LMOVE) to their own list and record the deadline of the lease in a sorted set
+    of the channel within the same MULTI, so a crash never loses messages which are neither queued nor leased.
+    An expired lease is given back (its messages in front of the channel) in one WATCHed MULTI, by one process only.
+    """
+
+    def __init__(self, client, prefix: str = 'figjam:', max_messages: Optional[int] = None):
+        self.client = client
+        self.prefix = prefix
+        self.max_messages = max_messages
+
+    def _queue_key(self, channel: str) -> str:
+        return f'{self.prefix}queue:{channel}'
+
+    def _leases_key(self, channel: str) -> str:
+        return f'{self.prefix}leases:{channel}'
+
+    def _lease_key(self, channel: str, lease_id: str) -> str:
+        return f'{self.prefix}lease:{channel}:{lease_id}'
+
+    @property
+    def _channels_key(self) -> str:
+        return f'{self.prefix}channels'
+
+    def _expire_leases(self, channel: str):
+        for lease_id in self.client.zrangebyscore(self._leases_key(channel), '-inf', time.time()):
+            self._redeliver(channel, lease_id)
+
+    def _redeliver(self, channel: str, lease_id: str):
+        lease_key = self._lease_key(channel, lease_id)
+        with self.client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    pipe.watch(self._leases_key(channel), lease_key)
+                    if pipe.zscore(self._leases_key(channel), lease_id) is None:
+                        pipe.unwatch()
+                        return  # acked or redelivered by another process
+                    messages = pipe.lrange(lease_key, 0, -1)
+                    pipe.multi()
+                    pipe.zrem(self._leases_key(channel), lease_id)
+                    if messages:
+                        pipe.lpush(self._queue_key(channel), *reversed(messages))
+                    pipe.delete(lease_key)
+                    pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+    def push(self, channel, messages):
+        if not messages:
+            return self.size(channel)
+        self._expire_leases(channel)
+        data = [json.dumps(m, separators=(',', ':')) for m in messages]
+        with self.client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    # with a limit the size is checked under WATCH, concurrent pushes can't go above it together
+                    if self.max_messages is not None:
+                        pipe.watch(self._queue_key(channel))
+                        if pipe.llen(self._queue_key(channel)) + len(data) > self.max_messages:
+                            pipe.unwatch()
+                            raise ChannelFull(channel)
+                        pipe.multi()
+                    pipe.sadd(self._channels_key, channel)
+                    pipe.rpush(self._queue_key(channel), *data)
+                    return pipe.execute()[-1]
+                except WatchError:
+                    continue
+
+    def take(self, channel, limit, lease=None):
+        self._expire_leases(channel)
+        if limit <= 0:
+            return None, []
+        if lease:
+            return self._lease(channel, limit, lease)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.lrange(self._queue_key(channel), 0, limit - 1)
+        pipe.ltrim(self._queue_key(channel), limit, -1)
+        raw = pipe.execute()[0]
+        return None, [json.loads(message) for message in raw]
+
+    def _lease(self, channel: str, limit: int, lease: float):
+        # no more moves than messages queued, a move past the end of the list is a no-op
+        count = min(limit, self.client.llen(self._queue_key(channel)))
+        if not count:
+            return None, []
+        lease_id = uuid.uuid4().hex
+        lease_key = self._lease_key(channel, lease_id)
+        pipe = self.client.pipeline(transaction=True)
+        for _ in range(count):
+            pipe.lmove(self._queue_key(channel), lease_key, 'LEFT', 'RIGHT')
+        pipe.zadd(self._leases_key(channel), {lease_id: time.time() + lease})
+        raw = [message for message in pipe.execute()[:count] if message is not None]
+        if not raw:
+            # emptied by another poll meanwhile, the lease holds nothing
+            self.client.zrem(self._leases_key(channel), lease_id)
+            return None, []
+        return lease_id, [json.loads(message) for message in raw]
+
+    def ack(self, channel, lease_id):
+        self._expire_leases(channel)
+        if not self.client.zrem(self._leases_key(channel), lease_id):
+            return False
+        self.client.delete(self._lease_key(channel, lease_id))
+        return True
+
+    def peek(self, channel, limit):
+        self._expire_leases(channel)
+        if limit <= 0:
+            return []
+        return [json.loads(message) for message in self.client.lrange(self._queue_key(channel), 0, limit - 1)]
+
+    def size(self, channel=None):
+        if channel is None:
+            return sum(self.size(name) for name in self.client.smembers(self._channels_key))
+        self._expire_leases(channel)
+        return self.client.llen(self._queue_key(channel))
+
+    def channels(self):
+        return {name: self.size(name) for name in self.client.smembers(self._channels_key)}
+
+    def clear(self, channel=None):
+        names = [channel] if channel is not None else list(self.client.smembers(self._channels_key))
+        for name in names:
+            lease_ids = self.client.zrange(self._leases_key(name), 0, -1)
+            pipe = self.client.pipeline(transaction=True)
+            pipe.delete(self._queue_key(name), self._leases_key(name),
+                        *(self._lease_key(name, lease_id) for lease_id in lease_ids))
+            pipe.srem(self._channels_key, name)
+            pipe.execute()
@@ -0,0 +1,180 @@
+import json
+import gzip
+from array import array
+from pathlib import Path
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from core.blobs import BlobStore
+from core.dumps import is_dump
+
+# dumps are scanned by blocks, a block only has to fit the largest message
+READ_SIZE = 1024 * 1024
+
+_WHITESPACE = ' \t\r\n'
+_SEPARATORS = _WHITESPACE + ','
+
+
+def _open(path: Path):
+    return gzip.open(path, 'rb') if path.name.endswith('.gz') else open(path, 'rb')
+
+
+def index_jsonl(path: Path) -> Iterator[Tuple[int, int]]:
+    """(start, end) offsets of the lines of a JSONL dump (offsets of the uncompressed stream for .gz), nothing is parsed"""
+    offset = 0
+    with _open(path) as f:
+        for line in f:
+            if line.strip():
+                yield offset, offset + len(line)
+            offset += len(line)
+
+
+def index_json_array(path: Path) -> Iterator[Tuple[int, int]]:
+    """
+    (start, end) offsets of the elements of a legacy JSON array dump (json.dump(..., indent=2)),
+    found with an incremental raw_decode so only about one element at a time is in memory.
+    """
+    decoder = json.JSONDecoder()
+    # latin-1 maps every byte to one character, so string indices are byte offsets
+    text, base, position, eof = '', 0, 0, False
+    opened = False
+
+    with open(path, 'rb') as f:
+
+        def fill():
+            nonlocal text, base, position, eof
+            chunk = f.read(READ_SIZE)
+            eof = not chunk
+            # the consumed part is dropped, text only holds the current element
+            text, base, position = text[position:] + chunk.decode('latin-1'), base + position, 0
+
+        while True:
+            separators = _SEPARATORS if opened else _WHITESPACE
+            while position < len(text) and text[position] in separators:
+                position += 1
+            if position == len(text):
+                if eof:
+                    if opened:
+                        raise ValueError(f'{path} ends before the JSON array')
+                    return
+                fill()
+                continue
+
+            if not opened:
+                if text[position] != '[':
+                    raise ValueError(f'{path} is not a JSON array')
+                opened = True
+                position += 1
+                continue
+
+            if text[position] == ']':
+                return
+
+            try:
+                _, end = decoder.raw_decode(text, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+
+            yield base + position, base + end
+            position = end
+
+
+def index_dump(path: Path) -> Iterator[Tuple[int, int]]:
+    if path.name.endswith('.json'):
+        return index_json_array(path)
+    return index_jsonl(path)
+
+
+def dump_paths(path: str) -> List[Path]:
+    """A dump or the dumps of a directory, oldest first"""
+    path = Path(path)
+    if path.is_file():
+        return [path]
+    paths = [p for p in path.iterdir() if is_dump(p) or (p.is_file() and p.name.endswith('.json'))]
+    return sorted(paths, key=lambda p: (p.stat().st_mtime, p.name))
+
+
+def dump_blob_store(path: str) -> BlobStore:
+    """Images offloaded by the DumpWriter which wrote the dumps"""
+    path = Path(path)
+    return BlobStore(str((path.parent if path.is_file() else path) / 'blobs'))
+
+
+class ReplayQueue:
+    """
+    Queue of messages replayed from dumps, a drop-in for the deque behind /poll and /peek.
+    Only the offsets of the messages are kept in memory, a message is read from disk (and passed through
+    transform) when it is polled or peeked. Messages pushed while replaying are queued after the dumps.
+    """
+
+    maxlen = None
+
+    def __init__(self, paths: Iterable[Path], transform: Optional[Callable[[Dict], Dict]] = None):
+        self.paths = list(paths)
+        self.transform = transform or (lambda message: message)
+
+        self._files = array('I')
+        self._starts = array('q')
+        self._ends = array('q')
+        for i, path in enumerate(self.paths):
+            for start, end in index_dump(path):
+                self._files.append(i)
+                self._starts.append(start)
+                self._ends.append(end)
+
+        self._cursor = 0
+        self._tail: deque = deque()
+        self._handle: Optional[Tuple[int, Any]] = None
+        # messages read by /peek ahead of the cursor, so polling them doesn't seek back (costly in gzip)
+        self._peeked: Dict[int, Dict] = {}
+
+    @classmethod
+    def open(cls, path: str, transform: Optional[Callable[[Dict], Dict]] = None) -> 'ReplayQueue':
+        return cls(dump_paths(path), transform)
+
+    def _read(self, i: int) -> Dict:
+        file = self._files[i]
+        if self._handle is None or self._handle[0] != file:
+            self.close()
+            self._handle = (file, _open(self.paths[file]))
+        f = self._handle[1]
+        # reads go forward most of the time, cheap for gzip too
+        f.seek(self._starts[i])
+        return self.transform(json.loads(f.read(self._ends[i] - self._starts[i])))
+
+    def close(self):
+        if self._handle is not None:
+            self._handle[1].close()
+            self._handle = None
+
+    def __len__(self) -> int:
+        return len(self._starts) - self._cursor + len(self._tail)
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(self._cursor, len(self._starts)):
+            if i not in self._peeked:
+                self._peeked[i] = self._read(i)
+            yield self._peeked[i]
+        yield from list(self._tail)
+
+    def popleft(self) -> Dict:
+        if self._cursor < len(self._starts):
+            self._cursor += 1
+            i = self._cursor - 1
+            return self._peeked.pop(i) if i in self._peeked else self._read(i)
+        return self._tail.popleft()
+
+    def append(self, message: Dict):
+        self._tail.append(message)
+
+    def extend(self, messages: Iterable[Dict]):
+        self._tail.extend(messages)
+
+    def clear(self):
+        self._cursor = len(self._starts)
+        self._tail.clear()
+        self._peeked.clear()
+        self.close()
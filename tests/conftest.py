@@ -1,12 +1,16 @@
 """Pytest configuration and fixtures for integration tests."""
 import os
+import copy
 import pytest
+import threading
 from pathlib import Path
 from langchain_openai import ChatOpenAI
 
+from benchmarks.fakes import FakeChatModel
 from core.loaders import get_pdf_plumber_message
 from runners.company_research.models import MarketResearch
 from runners.company_research import prompts
+from server.redis_backend import WatchError
 
 
 @pytest.fixture
@@ -65,3 +69,207 @@ def test_llm_model():
 def pdf_loader():
     """Return the PDF loader function."""
     return get_pdf_plumber_message
+
+
+@pytest.fixture
+def fake_model_factory():
+    """Return a builder of offline models: FakeChatModel(respond, latency=0) of the benchmarks."""
+    def factory(respond, latency=0.0):
+        return FakeChatModel(respond, latency=latency)
+    return factory
+
+
+class FakeRedis:
+    """
+    In-process stand-in for the Redis commands used by the redis backends (strings, lists, sets, sorted sets),
+    with decoded responses. A pipeline runs its commands at once under the lock, like a MULTI / EXEC;
+    after watch() its commands run immediately until multi(), and the EXEC fails if a watched key changed.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self._lock = threading.RLock()
+
+    class Pipeline:
+        def __init__(self, redis):
+            self.redis = redis
+            self.commands = []
+            self.watched = {}
+            self.immediate = False
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            self.reset()
+
+        def __getattr__(self, name):
+            if self.immediate:
+                return getattr(self.redis, name)
+
+            def queue(*args, **kwargs):
+                self.commands.append((name, args, kwargs))
+                return self
+            return queue
+
+        def watch(self, *keys):
+            with self.redis._lock:
+                self.watched.update({key: copy.deepcopy(self.redis.data.get(key)) for key in keys})
+            self.immediate = True
+
+        def unwatch(self):
+            self.watched = {}
+            self.immediate = False
+
+        def multi(self):
+            self.immediate = False
+
+        def reset(self):
+            self.commands = []
+            self.unwatch()
+
+        def execute(self):
+            try:
+                with self.redis._lock:
+                    if any(self.redis.data.get(key) != value for key, value in self.watched.items()):
+                        raise WatchError()
+                    return [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+            finally:
+                self.reset()
+
+    def pipeline(self, transaction=True):
+        return FakeRedis.Pipeline(self)
+
+    def race(self, action):
+        """Run action() in the next WATCHed transaction, between its reads and its MULTI"""
+        pipeline = self.pipeline
+
+        def racing_pipeline(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            multi = pipe.multi
+
+            def action_then_multi():
+                del self.pipeline, pipe.multi
+                action()
+                multi()
+            pipe.multi = action_then_multi
+            return pipe
+
+        self.pipeline = racing_pipeline
+
+    @staticmethod
+    def _slice(items, start, end):
+        end = len(items) + end if end < 0 else end
+        return items[start:end + 1]
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value):
+        self.data[key] = value
+        return True
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def rpush(self, key, *values):
+        with self._lock:
+            self.data.setdefault(key, []).extend(values)
+            return len(self.data[key])
+
+    def lpush(self, key, *values):
+        with self._lock:
+            self.data[key] = list(reversed(values)) + self.data.get(key, [])
+            return len(self.data[key])
+
+    def lrange(self, key, start, end):
+        return self._slice(self.data.get(key, []), start, end)
+
+    def ltrim(self, key, start, end):
+        with self._lock:
+            self.data[key] = self._slice(self.data.get(key, []), start, end)
+            if not self.data[key]:
+                del self.data[key]
+            return True
+
+    def lmove(self, source, destination, src, dest):
+        with self._lock:
+            items = self.data.get(source, [])
+            if not items:
+                return None
+            value = items.pop(0 if src == 'LEFT' else -1)
+            if not items:
+                del self.data[source]
+            target = self.data.setdefault(destination, [])
+            target.insert(0 if dest == 'LEFT' else len(target), value)
+            return value
+
+    def llen(self, key):
+        return len(self.data.get(key, []))
+
+    def sadd(self, key, *members):
+        with self._lock:
+            members = set(members) - self.data.setdefault(key, set())
+            self.data[key] |= members
+            return len(members)
+
+    def srem(self, key, *members):
+        with self._lock:
+            removed = set(members) & self.data.get(key, set())
+            self.data.get(key, set()).difference_update(removed)
+            return len(removed)
+
+    def smembers(self, key):
+        return set(self.data.get(key, set()))
+
+    def _zsorted(self, key):
+        return sorted(self.data.get(key, {}).items(), key=lambda item: (item[1], item[0]))
+
+    def zadd(self, key, mapping):
+        with self._lock:
+            zset = self.data.setdefault(key, {})
+            added = len(set(mapping) - set(zset))
+            zset.update(mapping)
+            return added
+
+    def zrem(self, key, *members):
+        with self._lock:
+            zset = self.data.get(key, {})
+            return sum(zset.pop(member, None) is not None for member in members)
+
+    def zscore(self, key, member):
+        return self.data.get(key, {}).get(member)
+
+    def zcard(self, key):
+        return len(self.data.get(key, {}))
+
+    def zrank(self, key, member):
+        members = [m for m, _ in self._zsorted(key)]
+        return members.index(member) if member in members else None
+
+    def zrange(self, key, start, end):
+        return [m for m, _ in self._slice(self._zsorted(key), start, end)]
+
+    def zrevrange(self, key, start, end):
+        return [m for m, _ in self._slice(self._zsorted(key)[::-1], start, end)]
+
+    def zrangebyscore(self, key, low, high):
+        low, high = float(low), float(high)
+        return [m for m, score in self._zsorted(key) if low <= score <= high]
+
+    def zpopmin(self, key, count=1):
+        with self._lock:
+            popped = self._zsorted(key)[:count]
+            for member, _ in popped:
+                del self.data[key][member]
+            return popped
+
+
+@pytest.fixture
+def fake_redis():
+    """Return an in-process stand-in for a Redis server."""
+    return FakeRedis()
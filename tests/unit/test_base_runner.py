@@ -0,0 +1,122 @@
+"""Offline tests for BaseRunner with a fake LLM."""
+import asyncio
+import pytest
+from langchain_core.messages import HumanMessage
+
+from core.base_runner import BaseRunner, structured_runnables
+from runners.company_research.models import MarketResearch
+
+
+def answer(schema, messages):
+    values = {"General": "mission", "Values": ["a", "b"], "Category": "B2B",
+              "Offers": ["offer"], "url_list": ["a.com"]}
+    return schema(**{name: value for name, value in values.items() if name in schema.model_fields})
+
+
+def make_runner(model, **kwargs):
+    return BaseRunner(
+        model=model,
+        response_schema=MarketResearch,
+        prompts={"system_prompt": "Research {company_name}", "no_pdf_system_prompt": "Research {company_name}"},
+        pdf_loader=lambda path: "",
+        pipeline_vars={"company_name": "BPH"},
+        dump_results=False,
+        **kwargs,
+    )
+
+
+def test_split_schema_groups():
+    parts = BaseRunner.split_schema(MarketResearch, 3)
+    assert [list(p.model_fields) for p in parts] == [
+        ["General", "Values", "Category", "User_profiles"],
+        ["Top_problems", "General_Problems", "Use_cases", "Traffic_Sources"],
+        ["Offers", "url_list"],
+    ]
+    # descriptions are kept, they are the prompt
+    assert parts[0].model_fields["General"].description == MarketResearch.model_fields["General"].description
+
+    parts = BaseRunner.split_schema(MarketResearch, [["url_list"], ["General", "Values"]])
+    assert [list(p.model_fields) for p in parts][:2] == [["url_list"], ["General", "Values"]]
+    assert len(parts[2].model_fields) == len(MarketResearch.model_fields) - 3
+
+    with pytest.raises(ValueError):
+        BaseRunner.split_schema(MarketResearch, [["Nope"]])
+
+
+def test_split_schema_parts_are_reused(fake_model_factory):
+    model = fake_model_factory(answer)
+    for _ in range(3):
+        make_runner(model, field_groups=3).run()
+
+    # the same three parts every run, so their runnables and cache keys are built once
+    assert len({schema for schema, _ in model.calls}) == 3
+    assert sum(key[0] == id(model) for key, _ in structured_runnables._data.items()) == 3
+    assert BaseRunner.split_schema(MarketResearch, [["General"]]) == BaseRunner.split_schema(MarketResearch, (["General"],))
+
+
+def test_field_groups_match_single_call(fake_model_factory):
+    single = make_runner(fake_model_factory(answer))
+    single_messages = single.run()
+
+    model = fake_model_factory(answer, latency=0.05)
+    grouped = make_runner(model, field_groups=3)
+    grouped_messages = grouped.run()
+
+    assert len(model.calls) == 3
+    assert model.max_in_flight == 3
+    assert grouped_messages == single_messages
+    # excluded from the board but still available to the hooks
+    assert grouped.llm_response.url_list == ["a.com"]
+    assert grouped.llm_response.model_fields_set == single.llm_response.model_fields_set
+
+
+def test_pdf_budget_stops_lazy_loader(fake_model_factory):
+    consumed = []
+
+    def lazy_loader(path):
+        for i in range(1000):
+            consumed.append(i)
+            yield f"paragraph {i}"
+
+    model = fake_model_factory(answer)
+    runner = make_runner(model, max_pdf_chars=40)
+    runner.pdf_loader = lazy_loader
+    runner.pdf_path = "deck.pdf"
+    runner.run()
+
+    prompt = model.calls[0][1][1].content
+    assert prompt.startswith("paragraph 0\n\nparagraph 1\n\nparagraph 2\n")
+    assert "paragraph 3" not in prompt
+    assert len(consumed) == 4
+
+
+def test_structured_runnable_is_reused(fake_model_factory):
+    model = fake_model_factory(answer)
+    built = []
+    with_structured_output = model.with_structured_output
+    model.with_structured_output = lambda schema: built.append(schema) or with_structured_output(schema)
+
+    make_runner(model).run()
+    make_runner(model).run()
+
+    assert built == [MarketResearch]
+    assert len(model.calls) == 2
+
+
+def test_arun_matches_run(fake_model_factory):
+    expected = make_runner(fake_model_factory(answer), field_groups=2).run()
+    model = fake_model_factory(answer)
+
+    assert asyncio.run(make_runner(model, field_groups=2).arun()) == expected
+    assert len(model.calls) == 2
+
+
+def test_astructured_batch_respects_concurrency(fake_model_factory):
+    model = fake_model_factory(answer, latency=0.05)
+    requests = [(MarketResearch, [HumanMessage(content=str(i))]) for i in range(10)]
+
+    responses = asyncio.run(make_runner(model, max_concurrency=3).astructured_batch(requests))
+
+    assert len(responses) == 10
+    assert model.max_in_flight == 3
+    assert [messages[0].content for _, messages in model.calls] == [str(i) for i in range(10)]
@@ -0,0 +1,50 @@
+"""Tests for the benchmark harness and its fakes."""
+import asyncio
+
+from benchmarks.fakes import FakeChatModel, FakeBrowserPool, fake_response
+from benchmarks.harness import bench, compare, percentile
+from benchmarks.scenarios import Options, SCENARIOS, select
+from core.images import screenshot_to_tiles
+from runners.company_research.models import MarketResearch
+
+
+def test_percentile_nearest_rank():
+    values = [0.5, 0.1, 0.4, 0.2, 0.3]
+    assert percentile(values, 50) == 0.3
+    assert percentile(values, 99) == 0.5
+    assert percentile(values, 0) == 0.1
+
+
+def test_fake_model_is_deterministic_and_concurrent():
+    model = FakeChatModel(latency=0.05, urls=["a.example", "b.example"])
+    runnable = model.with_structured_output(MarketResearch)
+
+    async def calls():
+        return await asyncio.gather(*(runnable.ainvoke([]) for _ in range(4)))
+
+    responses = asyncio.run(calls())
+    assert responses[0] == responses[3] == fake_response(MarketResearch, urls=["a.example", "b.example"])
+    assert responses[0].url_list == ["a.example", "b.example"] and len(responses[0].Values) == 3
+    assert len(model.calls) == 4 and model.max_in_flight == 4
+
+
+def test_fake_browser_screenshots_can_be_tiled():
+    screenshot = asyncio.run(FakeBrowserPool(latency=0).capture("a.example"))
+    assert len(screenshot_to_tiles(screenshot, tile_height=1000)) == 4
+
+
+def test_bench_and_compare():
+    result = bench("noop", lambda: None, iterations=10, concurrency=2)
+    summary = result.summary()
+    assert summary["ops"] == 10 and summary["p50_ms"] <= summary["p99_ms"] and summary["peak_mb"] is not None
+
+    baseline = [{"name": "noop", "p50_ms": 10.0, "throughput": 100.0, "peak_mb": 1.0}]
+    slower = [{"name": "noop", "p50_ms": 13.0, "throughput": 90.0, "peak_mb": 1.0}]
+    assert compare(slower, baseline) == ["noop: p50_ms 10.00 -> 13.00 (+30%)"]
+    assert compare(slower, baseline, tolerance=0.5) == []
+
+
+def test_fast_scenarios_run_offline():
+    options = Options(iterations=2, concurrency=2, latency=0, browser_latency=0, memory=False)
+    for name in select(["runner.run", "schema", "api.status", "api.push"]):
+        assert SCENARIOS[name](options).summary()["ops"] >= 2
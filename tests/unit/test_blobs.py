@@ -0,0 +1,28 @@
+"""Tests for the content-addressed blob store."""
+import threading
+
+from core.blobs import BlobStore
+
+
+def test_concurrent_puts_of_the_same_blob(tmp_path):
+    store = BlobStore(str(tmp_path))
+    data = b"\xff\xd8\xff" + b"tile" * 100_000
+    digests, errors = [], []
+    barrier = threading.Barrier(8)
+
+    def put():
+        barrier.wait()
+        try:
+            digests.append(store.put(data))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=put) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors and len(set(digests)) == 1
+    assert store.get(digests[0]) == data
+    assert [p.name for p in tmp_path.iterdir()] == [digests[0]]
@@ -0,0 +1,84 @@
+"""Tests for the shared LLM client pool."""
+import gc
+
+from core.base_runner import get_structured_runnable
+from core.clients import ClientPool, client_pool
+from runners.company_research.models import MarketResearch
+
+
+def test_models_are_shared_per_key():
+    pool = ClientPool()
+    model = pool.get_chat_model("gpt-4o-mini", "sk-1", "https://a.example/v1", 0.7)
+
+    assert pool.get_chat_model("gpt-4o-mini", "sk-1", "https://a.example/v1", 0.7) is model
+    other_key = pool.get_chat_model("gpt-4o-mini", "sk-2", "https://a.example/v1", 0.7)
+    other_url = pool.get_chat_model("gpt-4o-mini", "sk-1", "https://b.example/v1", 0.7)
+    assert other_key is not model and other_url is not model
+
+    # same provider url, same connections
+    assert other_key.http_client is model.http_client
+    assert other_url.http_client is not model.http_client
+
+    stats = pool.stats()
+    assert stats["models"] == 3 and stats["http_clients"] == 2
+    assert stats["created"] == 3 and stats["reused"] == 1
+    assert "sk-1" not in str(stats)
+    pool.close()
+
+
+def test_idle_models_are_evicted():
+    pool = ClientPool(idle_timeout=0)
+    model = pool.get_chat_model("gpt-4o-mini", "sk-1", "https://a.example/v1", 0.7)
+    http_client = model.http_client
+
+    pool.evict_idle()
+
+    # still referenced here: out of the pool, connections kept
+    assert pool.stats()["models"] == 0 and pool.stats()["http_clients"] == 1
+    assert not http_client.is_closed
+    assert pool.get_chat_model("gpt-4o-mini", "sk-1", "https://a.example/v1", 0.7) is not model
+    # the evicted model still gets runnables, not cached
+    assert pool.structured_runnable(model, MarketResearch) is not pool.structured_runnable(model, MarketResearch)
+
+    del model
+    gc.collect()
+    pool.close()
+    assert http_client.is_closed
+
+
+def test_unreferenced_models_close_their_clients():
+    pool = ClientPool(idle_timeout=0)
+    http_client = pool.get_chat_model("gpt-4o-mini", "sk-1", "https://a.example/v1", 0.7).http_client
+    gc.collect()
+
+    pool.evict_idle()
+
+    assert pool.stats()["http_clients"] == 0
+    assert http_client.is_closed
+
+
+def test_model_used_after_another_providers_get():
+    pool = ClientPool(idle_timeout=0)
+    model = pool.get_chat_model("gpt-4o-mini", "sk-1", "https://a.example/v1", 0.7)
+
+    # a job goes on with model a while another one gets a model of provider b
+    pool.get_chat_model("gpt-4o-mini", "sk-1", "https://b.example/v1", 0.7)
+
+    assert not model.http_client.is_closed
+    assert not model.root_async_client._client.is_closed
+    assert pool.stats()["live_models"] == 2
+    pool.close()
+
+
+def test_structured_runnables_go_away_with_their_model(monkeypatch):
+    monkeypatch.setattr(client_pool, "idle_timeout", 300)
+    model = client_pool.get_chat_model("gpt-4o-mini", "sk-1", "https://runnables.example/v1", 0.7)
+    http_client = model.http_client
+    assert get_structured_runnable(model, MarketResearch) is get_structured_runnable(model, MarketResearch)
+
+    del model
+    gc.collect()
+    monkeypatch.setattr(client_pool, "idle_timeout", 0)
+    client_pool.evict_idle()
+
+    assert http_client.is_closed
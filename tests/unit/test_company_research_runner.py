@@ -0,0 +1,110 @@
+"""Offline tests for CompanyResearchRunner helpers with a fake LLM."""
+import asyncio
+
+from runners.company_research.runner import CompanyResearchRunner
+from runners.company_research.models import MarketResearch
+
+
+URLS = ["bph.com", "barbri.com", "themisbar.com", "kaplan.com"]
+
+
+def url_from_messages(messages):
+    return next(url for url in URLS if url in messages[-1].content)
+
+
+def fill_schema(schema, messages):
+    url = url_from_messages(messages)
+    return schema(**{name: f"{name} of {url}" for name in schema.model_fields})
+
+
+def make_runner(model, **kwargs):
+    return CompanyResearchRunner(
+        model=model,
+        response_schema=MarketResearch,
+        prompts={"system_prompt": "", "no_pdf_system_prompt": ""},
+        pdf_loader=lambda path: "",
+        pipeline_vars={"company_name": "themisbar.com"},
+        dump_results=False,
+        **kwargs,
+    )
+
+
+def test_fill_tables_keeps_row_order(fake_model_factory):
+    # later urls answer first, rows must still follow url_list
+    model = fake_model_factory(fill_schema, latency=lambda schema, messages: 0.05 * (4 - URLS.index(url_from_messages(messages))))
+    tables = make_runner(model).fill_tables(URLS)
+
+    assert [t["topicTitle"] for t in tables] == ["Competitor Table", "Products Reviews"]
+    # the target company goes first, the rest keep their order
+    expected = ["themisbar.com", "bph.com", "barbri.com", "kaplan.com"]
+    assert [row["Competitor_table"] for row in tables[0]["content"]] == expected
+    assert [row["Products_reviews"] for row in tables[1]["content"]] == expected
+    assert tables[0]["content"][1]["USP"] == "USP of bph.com"
+
+
+def test_fill_tables_runs_concurrently(fake_model_factory):
+    model = fake_model_factory(fill_schema, latency=0.2)
+    make_runner(model, max_concurrency=8).fill_tables(URLS)
+
+    assert len(model.calls) == 8
+    # every call was waiting at the same time
+    assert model.max_in_flight == 8
+
+
+def test_concurrency_limit_is_respected(fake_model_factory):
+    model = fake_model_factory(fill_schema, latency=0.02)
+    make_runner(model, max_concurrency=3).fill_tables(URLS)
+    assert model.max_in_flight == 3
+
+    model = fake_model_factory(fill_schema)
+    make_runner(model, max_concurrency=1).fill_tables(URLS)
+    assert model.max_in_flight == 1
+
+
+def test_run_streams_messages(fake_model_factory, mocker):
+    def respond(schema, messages):
+        if schema is MarketResearch:
+            return MarketResearch(General="mission", Values=["a", "b"], url_list=URLS[:2])
+        return fill_schema(schema, messages)
+
+    def fake_sites(url_list, on_site=None, **kwargs):
+        message = {"type": "addImages", "topicTitle": "Competitor 1", "content": ["b64"]}
+        on_site(message)
+        return [message]
+
+    mocker.patch.object(CompanyResearchRunner, "get_competitors_sites", side_effect=fake_sites)
+    batches = []
+    runner = make_runner(fake_model_factory(respond), on_messages=batches.append)
+    messages = runner.run()
+
+    # the main stickers are delivered before any of the competitor work
+    assert [m["topicTitle"] for m in batches[0]] == ["General", "Values"]
+    assert {m["type"] for batch in batches[1:] for m in batch} == {"addTable", "addImages"}
+    assert messages == [m for batch in batches for m in batch]
+
+
+def test_arun_overlaps_tables_and_screenshots(fake_model_factory, mocker):
+    def respond(schema, messages):
+        if schema is MarketResearch:
+            return MarketResearch(General="mission", url_list=URLS)
+        return fill_schema(schema, messages)
+
+    async def until(condition):
+        while not condition():
+            await asyncio.sleep(0.01)
+
+    async def fake_sites(url_list, on_site=None, **kwargs):
+        # the browser waits until the tables are being filled, it never does if they run one after the other
+        await asyncio.wait_for(until(lambda: model.in_flight), timeout=5)
+        message = {"type": "addImages", "topicTitle": "Competitor 1", "content": ["b64"]}
+        on_site(message)
+        return [message]
+
+    mocker.patch.object(CompanyResearchRunner, "aget_competitors_sites", side_effect=fake_sites)
+    model = fake_model_factory(respond, latency=0.1)
+    messages = asyncio.run(make_runner(model).arun())
+
+    # tables and screenshots are emitted as they are ready, in any order
+    assert messages[0]["type"] == "addSticker"
+    assert sorted(m["type"] for m in messages[1:]) == ["addImages", "addTable", "addTable"]
+    assert model.max_in_flight == 8
@@ -0,0 +1,51 @@
+"""Tests for the background dump writer."""
+import os
+import time
+import base64
+
+from core.dumps import DumpWriter, iter_dump
+from tests.unit.test_base_runner import answer, make_runner
+
+IMAGE = base64.b64encode(b"\xff\xd8 tile").decode()
+
+
+def test_runner_dump_is_compact_and_named_after_the_run(fake_model_factory, tmp_path):
+    writer = DumpWriter(str(tmp_path))
+    runner = make_runner(fake_model_factory(answer), run_id="job-1", dump_writer=writer)
+    runner.dump_results = True
+    messages = runner.run()
+    writer.flush()
+
+    [path] = writer.dumps()
+    assert path.name.endswith("-job-1.jsonl.gz")
+    assert list(iter_dump(path)) == messages
+
+
+def test_images_go_to_sidecar_blobs(tmp_path):
+    writer = DumpWriter(str(tmp_path), compress=False)
+    message = {"type": "addImages", "topicTitle": "Competitor 1", "content": [IMAGE, IMAGE]}
+
+    path = writer.submit("run", [message]).result()
+
+    [dumped] = iter_dump(path)
+    assert dumped["encoding"] == "blob"
+    digest = dumped["content"][0].rsplit("/", 1)[1]
+    assert writer.blob_store.get(digest) == b"\xff\xd8 tile"
+    assert IMAGE not in path.read_text()
+
+
+def test_retention_removes_old_dumps_and_their_blobs(tmp_path):
+    writer = DumpWriter(str(tmp_path), max_files=2)
+    images = [{"type": "addImages", "topicTitle": "t", "content": [base64.b64encode(bytes([i])).decode()]}
+              for i in range(3)]
+    shared = {"type": "addImages", "topicTitle": "t", "content": [IMAGE]}
+
+    paths = []
+    for i in range(3):
+        paths.append(writer.submit(f"run-{i}", [images[i], shared]).result())
+        time.sleep(0.02)  # distinct mtimes on coarse clocks
+
+    assert writer.dumps() == paths[1:]
+    assert set(os.listdir(writer.blob_store.root)) == {
+        dumped["content"][0].rsplit("/", 1)[1] for path in paths[1:] for dumped in iter_dump(path)}
+    assert len(os.listdir(writer.blob_store.root)) == 3
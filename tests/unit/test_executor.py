@@ -0,0 +1,161 @@
+"""Tests for the job executor and the admission control of /send_job."""
+import asyncio
+import sqlite3
+import pytest
+
+from datetime import datetime
+
+from server.executor import JobExecutor, StoreJobExecutor, QueueFull
+from server.jobs import JobStatus, SQLiteJobStore
+
+
+async def wait_until(condition, timeout=5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_priority_order_and_positions():
+    started, release = [], asyncio.Event()
+
+    async def run(job_id):
+        started.append(job_id)
+        await release.wait()
+
+    executor = JobExecutor(run, workers=1, max_pending=10)
+    await executor.submit("blocker")
+    await wait_until(lambda: executor.running)
+
+    assert await executor.submit("low") == 1
+    assert await executor.submit("high", priority=5) == 1
+    assert await executor.submit("low-2") == 3
+    assert await executor.position("low") == 2
+    assert await executor.cancel("low-2")
+    assert await executor.position("low-2") is None
+
+    release.set()
+    await wait_until(lambda: not executor.pending and not executor.running)
+    await executor.stop()
+
+    assert started == ["blocker", "high", "low"]
+
+
+@pytest.mark.asyncio
+async def test_queue_full():
+    release = asyncio.Event()
+
+    async def run(job_id):
+        await release.wait()
+
+    executor = JobExecutor(run, workers=1, max_pending=2)
+    await executor.submit("running")
+    await wait_until(lambda: executor.running)
+    await executor.submit("a")
+    await executor.submit("b")
+
+    with pytest.raises(QueueFull) as e:
+        await executor.submit("c")
+    assert e.value.retry_after >= 1
+
+    release.set()
+    await executor.stop()
+
+
+@pytest.mark.asyncio
+async def test_jobs_share_the_loop():
+    # waiting jobs don't hold a worker thread each, all of them wait on the loop at once
+    in_flight, peak = 0, 0
+
+    async def run(job_id):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.1)
+        in_flight -= 1
+
+    executor = JobExecutor(run, workers=50, max_pending=100)
+    for i in range(50):
+        await executor.submit(f"job-{i}")
+
+    await wait_until(lambda: not executor.pending and not executor.running, timeout=2)
+    await executor.stop()
+    assert peak == 50
+
+
+def pending_job(job_id, priority=0):
+    return {"job_id": job_id, "status": JobStatus.PENDING, "priority": priority,
+            "created_at": datetime.now().isoformat(), "completed_at": None}
+
+
+@pytest.mark.asyncio
+async def test_processes_sharing_a_store_run_each_job_once(tmp_path):
+    # two server processes: an executor each, on its own connection to the same SQLite file
+    path = str(tmp_path / "jobs.db")
+    started = []
+
+    async def run(job_id):
+        started.append(job_id)
+        await asyncio.sleep(0.01)
+
+    executors = [StoreJobExecutor(run, SQLiteJobStore(path), workers=2, max_pending=50, poll_interval=0.05)
+                 for _ in range(2)]
+    store = executors[0].jobs
+    for i in range(20):
+        store.create(pending_job(f"job-{i}"))
+    store.create(pending_job("urgent", priority=5))
+    assert await executors[0].position("urgent") == 1
+
+    # only the first one receives submits, the other claims the jobs by polling the store
+    await executors[0].submit("urgent")
+    executors[1].start()
+    await wait_until(lambda: not store.count(JobStatus.PENDING) and len(started) == 21)
+    for executor in executors:
+        await executor.stop()
+
+    assert started[0] == "urgent"
+    assert sorted(started) == sorted(["urgent"] + [f"job-{i}" for i in range(20)])
+
+
+@pytest.mark.asyncio
+async def test_store_executor_queue_full(tmp_path):
+    async def run(job_id):
+        pass
+
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"))
+    executor = StoreJobExecutor(run, store, workers=0, max_pending=2)
+    for job_id in "abc":
+        store.create(pending_job(job_id))
+    with pytest.raises(QueueFull):
+        await executor.submit("c")
+    await executor.stop()
+
+
+@pytest.mark.asyncio
+async def test_store_executor_waits_for_a_locked_store_off_the_loop(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    started = []
+
+    async def run(job_id):
+        started.append(job_id)
+
+    store = SQLiteJobStore(path)
+    store.create(pending_job("a"))
+
+    # another process holds the write lock, the claim waits for it
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    executor = StoreJobExecutor(run, store, workers=1, poll_interval=0.05)
+    executor.start()
+
+    ticks = 0
+    for _ in range(10):
+        await asyncio.sleep(0.01)
+        ticks += 1
+    assert ticks == 10 and not started
+
+    other.execute("COMMIT")
+    await wait_until(lambda: started == ["a"])
+    await executor.stop()
+    other.close()
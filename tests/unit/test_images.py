@@ -0,0 +1,54 @@
+"""Tests for the in-memory screenshot tiling."""
+import cv2
+import base64
+import asyncio
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from core.images import decode_image, tile_image, screenshot_to_tiles, ascreenshot_to_tiles
+
+
+def make_png(height: int, width: int = 64) -> bytes:
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    image[:, :, 1] = (np.arange(height) % 256)[:, None]
+    ok, buffer = cv2.imencode('.png', image)
+    assert ok
+    return buffer.tobytes()
+
+
+def test_tiles_are_views():
+    image = decode_image(make_png(1500))
+    tiles = tile_image(image, 720)
+
+    assert [t.shape[0] for t in tiles] == [720, 720, 60]
+    assert all(np.shares_memory(t, image) for t in tiles)
+
+
+def test_exact_multiple_has_no_empty_tile():
+    assert len(tile_image(decode_image(make_png(1440)), 720)) == 2
+
+
+def test_screenshot_to_tiles_with_pool_matches_serial():
+    data = make_png(2000)
+    serial = screenshot_to_tiles(data, tile_height=500, jpeg_quality=80)
+    with ThreadPoolExecutor(4) as executor:
+        pooled = screenshot_to_tiles(data, tile_height=500, jpeg_quality=80, executor=executor)
+
+    assert serial == pooled
+    assert len(serial) == 4
+    first = decode_image(base64.b64decode(serial[0]))
+    assert first.shape == (500, 64, 3)
+
+
+def test_async_tiles_match_serial():
+    data = make_png(2000)
+    with ThreadPoolExecutor(1) as executor:
+        # a single worker would deadlock if a tile task waited for the others
+        tiles = asyncio.run(ascreenshot_to_tiles(data, tile_height=500, jpeg_quality=80, executor=executor))
+
+    assert tiles == screenshot_to_tiles(data, tile_height=500, jpeg_quality=80)
+
+
+def test_jpeg_quality_changes_size():
+    data = make_png(720, 256)
+    assert len(screenshot_to_tiles(data, jpeg_quality=30)[0]) < len(screenshot_to_tiles(data, jpeg_quality=100)[0])
@@ -0,0 +1,225 @@
+"""Tests for the job store backends."""
+import pytest
+import threading
+from datetime import datetime, timedelta
+
+from server.jobs import JobStatus, InMemoryJobStore, SQLiteJobStore
+from server.redis_backend import RedisJobStore
+
+
+def make_job(job_id, status=JobStatus.PENDING, created_at=None, completed_at=None, priority=0):
+    return {
+        "job_id": job_id,
+        "status": status,
+        "priority": priority,
+        "request": {"schema": {}},
+        "results": None,
+        "error": None,
+        "created_at": created_at or datetime.now().isoformat(),
+        "completed_at": completed_at,
+    }
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def store(request, tmp_path, fake_redis):
+    if request.param == "memory":
+        return InMemoryJobStore()
+    if request.param == "redis":
+        return RedisJobStore(fake_redis)
+    return SQLiteJobStore(str(tmp_path / "jobs.db"))
+
+
+def test_crud(store):
+    store.create(make_job("a"))
+
+    assert "a" in store and "b" not in store
+    assert store.update("a", status=JobStatus.COMPLETED, results=[{"type": "addSticker"}])
+    assert not store.update("b", status=JobStatus.COMPLETED)
+
+    job = store.get("a")
+    assert job["status"] == JobStatus.COMPLETED
+    assert job["results"] == [{"type": "addSticker"}]
+
+    assert store.delete("a")
+    assert not store.delete("a")
+    assert len(store) == 0
+
+
+def test_list_count_and_clear(store):
+    start = datetime(2025, 1, 1)
+    for i in range(6):
+        status = JobStatus.PENDING if i % 2 else JobStatus.COMPLETED
+        store.create(make_job(str(i), status, created_at=(start + timedelta(minutes=i)).isoformat()))
+
+    assert [j["job_id"] for j in store.list()] == ["5", "4", "3", "2", "1", "0"]
+    assert [j["job_id"] for j in store.list(JobStatus.PENDING, limit=2)] == ["5", "3"]
+    assert store.count(JobStatus.PENDING) == 3
+    assert store.count() == 6
+
+    assert store.clear(JobStatus.COMPLETED) == 3
+    assert store.count() == 3
+    assert store.clear() == 3
+    assert store.list() == []
+
+
+def test_evict_expired(store):
+    old = (datetime.now() - timedelta(hours=2)).isoformat()
+    store.create(make_job("old-done", JobStatus.COMPLETED, created_at=old, completed_at=old))
+    store.create(make_job("old-failed", JobStatus.FAILED, created_at=old, completed_at=old))
+    store.create(make_job("old-running", JobStatus.PROCESSING, created_at=old))
+    store.create(make_job("fresh", JobStatus.COMPLETED, completed_at=datetime.now().isoformat()))
+
+    assert store.evict_expired(ttl=3600) == 2
+    assert {j["job_id"] for j in store.list()} == {"old-running", "fresh"}
+
+
+def test_evict_expired_follows_completion(store):
+    old = (datetime.now() - timedelta(hours=2)).isoformat()
+    for job_id in "abcd":
+        store.create(make_job(job_id))
+
+    store.update("a", status=JobStatus.COMPLETED, completed_at=old)
+    store.update("b", status=JobStatus.FAILED, completed_at=old)
+    store.update("b", completed_at=datetime.now().isoformat())
+    store.update("c", status=JobStatus.COMPLETED, completed_at=old)
+    store.delete("c")
+
+    assert store.evict_expired(ttl=3600) == 1
+    assert store.evict_expired(ttl=3600) == 0
+    assert {j["job_id"] for j in store.list()} == {"b", "d"}
+    assert store.clear(JobStatus.FAILED) == 1
+    assert store.evict_expired(ttl=0) == 0
+
+
+def test_append_results(store):
+    store.create(make_job("a"))
+    store.create(make_job("b"))
+
+    assert store.append_results("a", [{"content": "1"}])
+    assert store.append_results("a", [{"content": "2"}, {"content": "3"}])
+    assert not store.append_results("missing", [{"content": "1"}])
+    assert [m["content"] for m in store.get("a")["results"]] == ["1", "2", "3"]
+    assert {j["job_id"]: j["results"] for j in store.list()}["b"] is None
+
+    # other updates keep the appended results, setting the results replaces them
+    store.update("a", status=JobStatus.FAILED)
+    assert len(store.list(JobStatus.FAILED)[0]["results"]) == 3
+    store.update("a", results=[{"content": "final"}])
+    assert store.get("a")["results"] == [{"content": "final"}]
+
+    store.append_results("b", [{"content": "1"}])
+    store.delete("b")
+    store.create(make_job("b"))
+    assert store.get("b")["results"] is None
+
+
+def test_sqlite_survives_restart(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    SQLiteJobStore(path).create(make_job("a"))
+    assert SQLiteJobStore(path).get("a")["job_id"] == "a"
+
+
+def test_counts_follow_transitions(store):
+    for job_id in "abc":
+        store.create(make_job(job_id))
+
+    store.update("a", status=JobStatus.PROCESSING)
+    store.update("b", status=JobStatus.PROCESSING)
+    store.update("a", status=JobStatus.COMPLETED, completed_at=datetime.now().isoformat())
+    store.delete("c")
+
+    assert store.count(JobStatus.PENDING) == 0
+    assert store.count(JobStatus.PROCESSING) == 1
+    assert store.count(JobStatus.COMPLETED) == 1
+    # listing by status keeps creation order, not transition order
+    store.update("b", status=JobStatus.COMPLETED, completed_at=datetime.now().isoformat())
+    assert [j["job_id"] for j in store.list(JobStatus.COMPLETED)] == ["b", "a"]
+
+
+def test_claim_by_priority_then_age(store):
+    start = datetime(2025, 1, 1)
+    for i, (job_id, priority) in enumerate([("old", 0), ("urgent", 5), ("new", 0), ("urgent-new", 5)]):
+        store.create(make_job(job_id, created_at=(start + timedelta(minutes=i)).isoformat(), priority=priority))
+
+    assert [store.position(job_id) for job_id in ("urgent", "urgent-new", "old", "new")] == [1, 2, 3, 4]
+
+    job = store.claim("worker-1")
+    assert job["job_id"] == "urgent" and job["status"] == JobStatus.PROCESSING and job["worker"] == "worker-1"
+    assert store.get("urgent")["status"] == JobStatus.PROCESSING
+    assert store.position("urgent") is None and store.position("old") == 2
+
+    store.delete("urgent-new")
+    assert [store.claim("worker-1")["job_id"] for _ in range(2)] == ["old", "new"]
+    assert store.claim("worker-1") is None
+    assert store.count(JobStatus.PROCESSING) == 3 and store.count(JobStatus.PENDING) == 0
+
+
+def test_sqlite_claims_are_exclusive_across_connections(tmp_path):
+    # one store per server process, all of them on the same file
+    path = str(tmp_path / "jobs.db")
+    stores = [SQLiteJobStore(path) for _ in range(4)]
+    for i in range(40):
+        stores[0].create(make_job(f"job-{i:02d}"))
+
+    claimed = []
+
+    def work(store):
+        while (job := store.claim(threading.current_thread().name)) is not None:
+            claimed.append(job["job_id"])
+
+    threads = [threading.Thread(target=work, args=(store,)) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == [f"job-{i:02d}" for i in range(40)]
+
+
+def test_redis_update_racing_a_delete_keeps_the_job_deleted(fake_redis):
+    store = RedisJobStore(fake_redis)
+    store.create(make_job("a"))
+
+    fake_redis.race(lambda: store.delete("a"))
+
+    assert not store.update("a", status=JobStatus.COMPLETED)
+    assert "a" not in store and store.count() == 0
+    assert not any(key.endswith("job:a") for key in fake_redis.data)
+
+
+def test_redis_claim_racing_a_delete_skips_the_job(fake_redis):
+    store = RedisJobStore(fake_redis)
+    store.create(make_job("a", created_at=datetime(2025, 1, 1).isoformat()))
+    store.create(make_job("b", created_at=datetime(2025, 1, 2).isoformat()))
+
+    fake_redis.race(lambda: store.delete("a"))
+
+    assert store.claim("worker-1")["job_id"] == "b"
+    assert "a" not in store and store.count() == 1
+    assert store.count(JobStatus.PROCESSING) == 1
+
+
+def test_redis_delete_racing_an_update_cleans_the_new_index(fake_redis):
+    store = RedisJobStore(fake_redis)
+    store.create(make_job("a"))
+
+    fake_redis.race(lambda: store.update("a", status=JobStatus.PROCESSING))
+
+    assert store.delete("a")
+    assert store.count() == 0 and store.count(JobStatus.PROCESSING) == 0
+
+
+def test_redis_claim_is_lost_with_its_worker_or_done(fake_redis):
+    store = RedisJobStore(fake_redis)
+    store.create(make_job("a"))
+
+    # the worker dies before its transaction goes through: the job still waits
+    def die():
+        raise ConnectionError("worker died")
+    fake_redis.race(die)
+    with pytest.raises(ConnectionError):
+        store.claim("worker-1")
+
+    assert store.position("a") == 1 and store.count(JobStatus.PENDING) == 1
+    assert store.claim("worker-2")["worker"] == "worker-2"
+    assert store.count(JobStatus.PENDING) == 0 and store.count(JobStatus.PROCESSING) == 1
@@ -0,0 +1,63 @@
+"""Tests for the structured LLM response cache."""
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from core.llm_cache import CacheMiss, ResponseCache
+from runners.company_research.models import MarketResearch
+from tests.unit.test_base_runner import answer, make_runner
+
+MESSAGES = [SystemMessage(content="Research BPH"), HumanMessage(content="General: mission")]
+
+
+def test_second_run_is_served_from_cache(fake_model_factory, tmp_path):
+    cache = ResponseCache(str(tmp_path / "llm.db"))
+    model = fake_model_factory(answer)
+
+    first = make_runner(model, response_cache=cache).run()
+    second = make_runner(model, response_cache=cache).run()
+
+    assert second == first
+    assert len(model.calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cached_response_keeps_excluded_and_unset_fields(fake_model_factory, tmp_path):
+    cache = ResponseCache(str(tmp_path / "llm.db"))
+    model = fake_model_factory(lambda schema, messages: schema(General="mission", url_list=["a.com"]))
+
+    def call():
+        return model.with_structured_output(MarketResearch).invoke(MESSAGES)
+
+    fresh = cache.invoke(model, MarketResearch, MESSAGES, call)
+    cached = cache.invoke(model, MarketResearch, MESSAGES, call)
+
+    assert cached.url_list == ["a.com"]
+    assert cached.model_fields_set == fresh.model_fields_set
+    assert len(model.calls) == 1
+
+
+def test_replay_mode_raises_on_miss(fake_model_factory, tmp_path):
+    path = str(tmp_path / "llm.db")
+    model = fake_model_factory(answer)
+    make_runner(model, response_cache=ResponseCache(path)).run()
+
+    replay = ResponseCache(path, mode="replay")
+    assert make_runner(model, response_cache=replay).run()
+    assert len(model.calls) == 1
+
+    with pytest.raises(CacheMiss):
+        replay.invoke(model, MarketResearch, MESSAGES[:1], lambda: pytest.fail("replay called the model"))
+
+
+def test_ttl_and_size_limit(tmp_path):
+    response = answer(MarketResearch, MESSAGES)
+
+    expired = ResponseCache(str(tmp_path / "ttl.db"), ttl=-1)
+    expired.put("key", response)
+    assert expired.get("key", MarketResearch) is None
+
+    small = ResponseCache(str(tmp_path / "small.db"), max_bytes=150)
+    for i in range(3):
+        small.put(f"key{i}", response)
+    assert len(small) == 1
+    assert small.get("key2", MarketResearch) == response
@@ -0,0 +1,133 @@
+"""Tests for the PDF loaders and the extracted text cache."""
+import re
+import os
+import pytest
+import random
+from pathlib import Path
+
+from core import loaders
+from core.loaders import (PdfTextCache, get_pdf_plumber_message, iter_pdf_paragraphs,
+                          normalize_paragraphs, take_chars)
+
+
+@pytest.fixture(scope="module")
+def serial_text():
+    return get_pdf_plumber_message(str(Path(__file__).parent.parent / "fixtures" / "sample.pdf"))
+
+
+def counting_loader(calls):
+    def loader(pdf_path):
+        calls.append(pdf_path)
+        with open(pdf_path, "rb") as f:
+            return f"text of {f.read().decode()}"
+    return loader
+
+
+def test_cache_skips_repeated_extraction(tmp_path):
+    pdf = tmp_path / "deck.pdf"
+    pdf.write_bytes(b"v1")
+    calls = []
+    loader = PdfTextCache(str(tmp_path / "cache")).cached(counting_loader(calls))
+
+    assert loader(str(pdf)) == "text of v1"
+    assert loader(str(pdf)) == "text of v1"
+    assert len(calls) == 1
+
+    # a copy with the same content hits the cache too
+    copy = tmp_path / "copy.pdf"
+    copy.write_bytes(b"v1")
+    assert loader(str(copy)) == "text of v1"
+    assert len(calls) == 1
+
+    pdf.write_bytes(b"v2-changed")
+    os.utime(pdf, ns=(1, 1))
+    assert loader(str(pdf)) == "text of v2-changed"
+    assert len(calls) == 2
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = PdfTextCache(str(tmp_path / "cache"), max_bytes=40)
+    loader = cache.cached(counting_loader([]))
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"{i}.pdf"
+        path.write_bytes(f"content-{i}".encode())
+        paths.append(str(path))
+
+    loader(paths[0])
+    loader(paths[1])
+    # the first text was read most recently, the second one goes first
+    os.utime(cache._entry_path(paths[1], "loader"), ns=(1, 1))
+    loader(paths[2])
+
+    assert sum(p.stat().st_size for p in cache.cache_dir.glob("*.txt")) <= 40
+    assert cache.get(paths[0], "loader") == "text of content-0"
+    assert cache.get(paths[1], "loader") is None
+    assert cache.get(paths[2], "loader") == "text of content-2"
+
+
+def test_parallel_extraction_matches_serial(test_pdf_path, serial_text, monkeypatch):
+    # the fixture is far below the real threshold
+    monkeypatch.setattr(loaders, "MIN_PAGES_PER_WORKER", 4)
+    assert get_pdf_plumber_message(test_pdf_path, workers=3) == serial_text
+
+
+def test_small_documents_are_extracted_serially(test_pdf_path, mocker):
+    parallel = mocker.patch.object(loaders, "_iter_pages_parallel")
+    loaders.iter_pdf_pages(test_pdf_path, workers=None)
+    parallel.assert_not_called()
+
+
+def normalize_whole_document(paragraphs):
+    """The whole document normalization the streaming one must match"""
+    text = "\n\n".join(paragraphs)
+    text = re.sub(r"[ \t]+", " ", text)
+    text = re.sub(r"([a-z])-\s+([a-z])", r"\1\2", text)
+    text = re.sub(r"[•●○◦]", "•", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
+
+
+@pytest.mark.parametrize("paragraphs", [
+    ["infor-", "mation here", "next"],
+    ["x-", "y-", "z"],
+    ["a- b- c", "d"],
+    ["end a-", "b- c", "Upper"],
+    ["a-", "b"],
+    ["tail-", "Capital"],
+    ["● bullet\tand  tabs", "-", "q"],
+])
+def test_normalize_paragraphs_edge_cases(paragraphs):
+    assert "\n\n".join(normalize_paragraphs(paragraphs)) == normalize_whole_document(paragraphs)
+
+
+def test_normalize_paragraphs_random():
+    rng = random.Random(0)
+    alphabet = ["a", "b", "Z", "-", " ", "\t", "•", "○", "-"]
+    for _ in range(2000):
+        paragraphs = []
+        for _ in range(rng.randint(1, 6)):
+            text = "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 8))).strip()
+            if text:
+                paragraphs.append(text)
+        assert "\n\n".join(normalize_paragraphs(paragraphs)) == normalize_whole_document(paragraphs), paragraphs
+
+
+def test_take_chars_stops_early():
+    consumed = []
+
+    def paragraphs():
+        for i in range(100):
+            consumed.append(i)
+            yield f"paragraph {i}"
+
+    text = take_chars(paragraphs(), max_chars=30)
+    assert text == "paragraph 0\n\nparagraph 1"
+    assert len(consumed) == 3
+    assert take_chars("abcdef", 3) == "abc"
+    assert take_chars(iter(["a" * 10]), 4) == "aaaa"
+
+
+def test_streaming_loader_matches(test_pdf_path, serial_text):
+    assert take_chars(iter_pdf_paragraphs(test_pdf_path)) == serial_text
+    assert serial_text.startswith(take_chars(iter_pdf_paragraphs(test_pdf_path), 500))
@@ -0,0 +1,139 @@
+"""Tests for the message channels behind /push and /poll."""
+import time
+import pytest
+import threading
+
+from server.queues import ChannelFull, LocalMessageQueue, SQLiteMessageQueue
+from server.redis_backend import RedisMessageQueue
+
+
+def sticker(i):
+    return {"type": "addSticker", "topicTitle": "General", "content": i}
+
+
+@pytest.fixture
+def queues(tmp_path):
+    return LocalMessageQueue(max_memory=3, spill_dir=str(tmp_path))
+
+
+def contents(messages):
+    return [m["content"] for m in messages]
+
+
+def test_overflow_spills_to_disk_in_order(queues, tmp_path):
+    queues.push("board", [sticker(i) for i in range(5)])
+    queues.push("board", [sticker(i) for i in range(5, 8)])
+
+    assert queues.size("board") == 8
+    assert len(list(tmp_path.iterdir())) == 1
+    assert contents(queues.peek("board", 5)) == [0, 1, 2, 3, 4]
+
+    assert contents(queues.take("board", 4)[1]) == [0, 1, 2, 3]
+    queues.push("board", [sticker(8)])
+    assert contents(queues.take("board", 10)[1]) == [4, 5, 6, 7, 8]
+    # the spill file is gone once read back
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_channels_are_independent(queues):
+    queues.push("images", [sticker(i) for i in range(10)])
+    queues.push("stickers", [sticker("a")])
+
+    assert contents(queues.take("stickers", 50)[1]) == ["a"]
+    assert queues.channels() == {"images": 10, "stickers": 0}
+    queues.clear("images")
+    assert queues.size() == 0
+
+
+def test_expired_leases_are_redelivered_first(queues):
+    queues.push("board", [sticker(i) for i in range(4)])
+
+    lease_id, messages = queues.take("board", 2, lease=0.05)
+    assert contents(messages) == [0, 1] and queues.size("board") == 2
+    acked_id, _ = queues.take("board", 1, lease=10)
+    assert queues.ack("board", acked_id)
+    assert not queues.ack("board", acked_id)
+
+    time.sleep(0.06)
+    assert not queues.ack("board", lease_id)
+    assert contents(queues.take("board", 10)[1]) == [0, 1, 3]
+
+
+def test_bounded_channel_rejects_pushes(tmp_path):
+    queues = LocalMessageQueue(max_memory=2, spill_dir=str(tmp_path), max_messages=3)
+    queues.push("board", [sticker(i) for i in range(3)])
+    with pytest.raises(ChannelFull):
+        queues.push("board", [sticker(3)])
+    assert queues.size("board") == 3
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def shared_queues(request, tmp_path, fake_redis):
+    if request.param == "redis":
+        return RedisMessageQueue(fake_redis, max_messages=5)
+    return SQLiteMessageQueue(str(tmp_path / "queue.db"), max_messages=5)
+
+
+def test_shared_backends_keep_order_leases_and_limits(shared_queues):
+    shared_queues.push("board", [sticker(i) for i in range(4)])
+    shared_queues.push("other", [sticker("a")])
+    assert shared_queues.channels() == {"board": 4, "other": 1}
+    assert contents(shared_queues.peek("board", 2)) == [0, 1]
+
+    lease_id, messages = shared_queues.take("board", 2, lease=0.05)
+    assert contents(messages) == [0, 1] and shared_queues.size("board") == 2
+    acked_id, _ = shared_queues.take("board", 1, lease=10)
+    assert shared_queues.ack("board", acked_id) and not shared_queues.ack("board", acked_id)
+
+    time.sleep(0.06)
+    assert not shared_queues.ack("board", lease_id)
+    assert contents(shared_queues.take("board", 10)[1]) == [0, 1, 3]
+
+    shared_queues.push("board", [sticker(i) for i in range(5)])
+    with pytest.raises(ChannelFull):
+        shared_queues.push("board", [sticker(5)])
+    shared_queues.clear()
+    assert shared_queues.size() == 0
+
+
+def test_sqlite_takes_are_exclusive_across_connections(tmp_path):
+    path = str(tmp_path / "queue.db")
+    SQLiteMessageQueue(path).push("board", [sticker(i) for i in range(200)])
+    taken = []
+
+    def poll(queues):
+        while messages := queues.take("board", 7)[1]:
+            taken.extend(contents(messages))
+
+    threads = [threading.Thread(target=poll, args=(SQLiteMessageQueue(path),)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(taken) == list(range(200))
+
+
+def test_redis_leased_messages_survive_a_crashed_poller(fake_redis):
+    RedisMessageQueue(fake_redis).push("board", [sticker(i) for i in range(3)])
+
+    # the poller takes under a lease and dies before acking
+    lease_id, messages = RedisMessageQueue(fake_redis).take("board", 2, lease=0.05)
+    assert contents(messages) == [0, 1]
+    assert fake_redis.lrange(f"figjam:lease:board:{lease_id}", 0, -1) and fake_redis.zscore("figjam:leases:board", lease_id)
+
+    time.sleep(0.06)
+    queues = RedisMessageQueue(fake_redis)
+    assert contents(queues.take("board", 10)[1]) == [0, 1, 2]
+    assert not any(key.startswith("figjam:lease") for key in fake_redis.data if fake_redis.data[key])
+
+
+def test_redis_concurrent_pushes_keep_the_limit(fake_redis):
+    queues = RedisMessageQueue(fake_redis, max_messages=3)
+    queues.push("board", [sticker(0), sticker(1)])
+
+    # another process fills the channel between the size check and the push
+    fake_redis.race(lambda: RedisMessageQueue(fake_redis).push("board", [sticker(2)]))
+    with pytest.raises(ChannelFull):
+        queues.push("board", [sticker(3)])
+    assert queues.size("board") == 3
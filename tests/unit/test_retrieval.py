@@ -0,0 +1,51 @@
+"""Tests for the offline BM25 context selection."""
+from core.retrieval import BM25Index, chunk_text, tokenize
+from core.base_runner import BaseRunner
+from runners.company_research.models import MarketResearch
+
+
+DOCUMENT = "\n\n".join([
+    "Our mission is to help law students pass the bar exam on the first attempt.",
+    "Pricing: the course costs 1500 dollars, discounts for early registration.",
+    "Competitors include Barbri and Themis, both offer bar review courses.",
+    "Our values are honesty, accessibility and student success.",
+])
+
+
+def test_tokenize_drops_stopwords():
+    assert tokenize("The mission of BPH is") == ["mission", "bph"]
+
+
+def test_chunk_text_groups_paragraphs():
+    chunks = chunk_text(DOCUMENT, max_chars=160)
+    assert "\n\n".join(chunks) == DOCUMENT
+    assert len(chunks) == 2
+
+
+def test_bm25_ranks_relevant_chunk_first():
+    index = BM25Index(chunk_text(DOCUMENT, max_chars=10))
+    assert index.top_k("What are the company values", 1) == [3]
+    assert index.top_k("competitors bar review", 2)[0] == 2
+    assert index.top_k("zebra", 3) == []
+
+
+def test_select_keeps_document_order():
+    index = BM25Index(chunk_text(DOCUMENT, max_chars=10))
+    selected = index.select(["values", "mission"], 1)
+    assert selected.split("\n\n") == [DOCUMENT.split("\n\n")[0], DOCUMENT.split("\n\n")[3]]
+
+
+def test_runner_prompt_holds_only_relevant_chunks(fake_model_factory):
+    # one chunk per paragraph
+    long_document = "\n\n".join(p + " lorem" * 150 for p in DOCUMENT.split("\n\n"))
+    model = fake_model_factory(lambda schema, messages: schema(General="mission"))
+    runner = BaseRunner(model, MarketResearch, {"system_prompt": "Research {company_name}"},
+                        pdf_loader=lambda path: long_document, pipeline_vars={"company_name": "BPH"},
+                        pdf_path="deck.pdf", dump_results=False, retrieval_top_k=1,
+                        field_groups=[["General"], ["Values"]])
+    runner.run()
+
+    prompts = {list(schema.model_fields)[0]: messages[1].content for schema, messages in model.calls}
+    assert "mission is to help" in prompts["General"]
+    assert "Pricing" not in prompts["General"]
+    assert "values are honesty" in prompts["Values"]
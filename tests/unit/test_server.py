@@ -0,0 +1,318 @@
+"""Tests for the FastAPI server endpoints, no LLM calls involved."""
+import json
+import time
+import asyncio
+import base64
+import sqlite3
+import pytest
+import threading
+from fastapi.testclient import TestClient
+
+import server.main as server
+from core.blobs import BlobStore
+from core.dumps import DumpWriter
+from server.queues import LocalMessageQueue, SQLiteMessageQueue
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "blob_store", BlobStore(str(tmp_path / "blobs")))
+    monkeypatch.setattr(server, "queues", LocalMessageQueue(spill_dir=str(tmp_path / "spill")))
+    server.jobs.clear()
+    with TestClient(server.app) as client:
+        yield client
+    server.jobs.clear()
+
+
+def test_push_and_poll(client):
+    client.post("/push", json={"type": "addSticker", "topicTitle": "General", "content": "hi"})
+    messages = client.get("/poll").json()
+
+    assert [m["content"] for m in messages] == ["hi"]
+    assert client.get("/poll").json() == []
+
+
+def test_images_are_served_from_blob_store(client, monkeypatch):
+    monkeypatch.setattr(server.settings, "image_transport", "blob")
+    tile = b"\xff\xd8\xff fake jpeg"
+    client.post("/push", json={"type": "addImages", "topicTitle": "Competitor 1",
+                               "content": [base64.b64encode(tile).decode()]})
+
+    message = client.get("/poll").json()[0]
+    assert message["encoding"] == "blob"
+    ref = message["content"][0]
+    assert ref.startswith("/blobs/")
+
+    response = client.get(ref)
+    assert response.status_code == 200
+    assert response.content == tile
+    assert response.headers["content-type"] == "image/jpeg"
+    assert "immutable" in response.headers["cache-control"]
+
+    cached = client.get(ref, headers={"If-None-Match": response.headers["etag"]})
+    assert cached.status_code == 304
+
+    assert client.get("/blobs/" + "0" * 64).status_code == 404
+    assert client.get("/blobs/not-a-digest").status_code == 404
+
+
+def test_base64_transport_is_default(client):
+    content = [base64.b64encode(b"img").decode()]
+    client.post("/push", json={"type": "addImages", "topicTitle": "Competitor 1", "content": content})
+    assert client.get("/poll").json()[0]["content"] == content
+
+
+def test_long_poll_returns_on_push(client):
+    def push_later():
+        time.sleep(0.2)
+        client.post("/push", json={"type": "addSticker", "topicTitle": "General", "content": "late"})
+
+    pusher = threading.Thread(target=push_later)
+    pusher.start()
+    start = time.perf_counter()
+    messages = client.get("/poll", params={"wait": 10}).json()
+    pusher.join()
+
+    assert [m["content"] for m in messages] == ["late"]
+    assert time.perf_counter() - start < 5
+
+
+def test_long_poll_sees_pushes_of_other_processes(client, tmp_path, monkeypatch):
+    # the push goes straight to the shared file, as another server process would, so no event reaches /poll
+    path = str(tmp_path / "queue.db")
+    monkeypatch.setattr(server, "queues", SQLiteMessageQueue(path))
+    monkeypatch.setattr(server, "shared_state", True)
+    monkeypatch.setattr(server.settings, "state_poll_interval", 0.05)
+
+    def push_later():
+        time.sleep(0.2)
+        SQLiteMessageQueue(path).push("board", [{"type": "addSticker", "topicTitle": "General", "content": "other"}])
+
+    pusher = threading.Thread(target=push_later)
+    pusher.start()
+    messages = client.get("/poll", params={"wait": 10, "channel": "board"}).json()
+    pusher.join()
+
+    assert [m["content"] for m in messages] == ["other"]
+
+
+def test_locked_queue_does_not_stall_the_server(client, tmp_path, monkeypatch):
+    path = str(tmp_path / "queue.db")
+    monkeypatch.setattr(server, "queues", SQLiteMessageQueue(path))
+    monkeypatch.setattr(server.settings, "queue_backend", "sqlite")
+
+    # another process holds the write lock, the push waits for it
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    responses = []
+    pusher = threading.Thread(target=lambda: responses.append(client.post(
+        "/push", json={"type": "addSticker", "topicTitle": "General", "content": "hi"})))
+    pusher.start()
+
+    # meanwhile the loop serves the other requests
+    assert client.get("/get_results/missing").status_code == 404
+    assert pusher.is_alive()
+
+    other.execute("COMMIT")
+    pusher.join()
+    other.close()
+    assert responses[0].json() == {"status": "ok", "queue_size": 1}
+
+
+def test_long_poll_times_out_empty(client):
+    start = time.perf_counter()
+    assert client.get("/poll", params={"wait": 0.3}).json() == []
+    assert time.perf_counter() - start >= 0.3
+
+
+def test_job_events_stream_ends_with_results(client):
+    server.jobs.create({
+        "job_id": "done", "status": server.JobStatus.COMPLETED, "request": {},
+        "results": [{"type": "addSticker", "topicTitle": "General", "content": "hi"}],
+        "error": None, "created_at": "2025-01-01T00:00:00", "completed_at": "2025-01-01T00:01:00",
+    })
+
+    with client.stream("GET", "/jobs/done/events") as response:
+        assert response.headers["content-type"].startswith("text/event-stream")
+        body = "".join(response.iter_text())
+
+    assert body.startswith("event: status\ndata: ")
+    payload = json.loads(body.split("data: ", 1)[1])
+    assert payload["status"] == "completed"
+    assert payload["results"][0]["content"] == "hi"
+
+    assert client.get("/jobs/missing/events").status_code == 404
+
+
+def test_stream_sends_messages_pushed_while_connected(client):
+    async def follow():
+        stream = (await server.stream_messages("board")).body_iterator
+        first = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.1)
+        assert not first.done()
+
+        await asyncio.to_thread(client.post, "/push", params={"channel": "board"},
+                                json={"type": "addSticker", "topicTitle": "General", "content": "live"})
+        try:
+            return await asyncio.wait_for(first, 5)
+        finally:
+            await stream.aclose()
+
+    event = asyncio.run(follow())
+    assert event.startswith("event: message\ndata: ")
+    assert json.loads(event.split("data: ", 1)[1])["content"] == "live"
+    assert client.get("/poll", params={"channel": "board"}).json() == []
+
+
+def test_job_events_only_reach_the_job_subscribers():
+    broker = server.EventBroker()
+
+    async def receive():
+        with broker.subscribe() as everything, broker.subscribe("a") as job_a, broker.subscribe("b") as job_b:
+            broker.publish({"type": "messages", "job_id": "a"}, job_id="a")
+            broker.publish({"type": "status", "job_id": "b"})
+            await asyncio.sleep(0)
+            return [[queue.get_nowait()["type"] for _ in range(queue.qsize())] for queue in (everything, job_a, job_b)]
+
+    assert asyncio.run(receive()) == [["status"], ["messages", "status"], ["status"]]
+
+
+def test_restore_pydantic_schema_is_memoized():
+    schema = {
+        "Values": {"type": "Sticker", "description": "Find values"},
+        "General": {"type": "Table", "reference_field": "Company", "reference_items": ["xAI", "OpenAI"],
+                    "columns": {"USP": "Find USP", "Revenue": "Find Revenue"}},
+    }
+    reordered = {"General": schema["General"], "Values": schema["Values"]}
+
+    model = server.restore_pydantic_schema(schema)
+    assert server.restore_pydantic_schema(reordered) is model
+    assert server.restore_pydantic_schema(schema, model_name="Other") is not model
+    assert server.restore_pydantic_schema({"Values": schema["Values"]}) is not model
+    assert set(model.model_fields) == {"Values", "General"}
+
+
+JOB_REQUEST = {
+    "schema": {"Values": {"type": "Sticker", "description": "Find values of xAI"}},
+    "runner": "company_research", "prompt": "Research", "pipeline_vars": {"company_name": "xAI"},
+    "llm_config": {"model_name": "m", "api_key": "k", "model_provider_url": "u", "temperature": "0"},
+}
+
+
+@pytest.fixture
+def fake_jobs(monkeypatch, fake_model_factory, mocker, tmp_path):
+    """Jobs answered by a fake model, without browser, return the model"""
+    from runners.company_research.runner import CompanyResearchRunner
+
+    monkeypatch.setattr(server, "dump_writer", DumpWriter(str(tmp_path)))
+
+    def respond(schema, messages):
+        return schema(Values="values of xAI")
+
+    model = fake_model_factory(respond, latency=0.2)
+    monkeypatch.setattr(server.client_pool, "get_chat_model", lambda *args: model)
+    mocker.patch.object(CompanyResearchRunner, "aget_competitors_sites", return_value=[])
+    return model
+
+
+def wait_for_jobs(client, job_ids, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        results = [client.get(f"/get_results/{job_id}").json() for job_id in job_ids]
+        if all(r["status"] in ("completed", "failed") for r in results):
+            break
+        time.sleep(0.05)
+    return results
+
+
+def test_jobs_run_on_the_server_loop(client, fake_jobs):
+    job_ids = [client.post("/send_job", json=JOB_REQUEST).json()["job_id"] for _ in range(4)]
+    results = wait_for_jobs(client, job_ids)
+
+    assert [r["status"] for r in results] == ["completed"] * 4, results[0]["error"]
+    assert results[0]["results"][0]["content"] == "values of xAI"
+    assert fake_jobs.max_in_flight == 4
+
+
+def test_job_events_follow_a_running_job(client, fake_jobs):
+    job_id = client.post("/send_job", json=JOB_REQUEST).json()["job_id"]
+
+    with client.stream("GET", f"/jobs/{job_id}/events") as response:
+        body = "".join(response.iter_text())
+    events = [(event.split("\n")[0][len("event: "):], json.loads(event.split("data: ", 1)[1]))
+              for event in body.strip().split("\n\n") if event.startswith("event: ")]
+
+    names = [name for name, _ in events]
+    assert names[0] == "status" and events[0][1]["status"] in ("pending", "processing")
+    assert "messages" in names
+    assert names.index("messages") > names.index("status")
+    name, final = events[-1]
+    assert name == "status" and final["status"] == "completed"
+    messages = [message for name, data in events if name == "messages" for message in data]
+    assert messages == final["results"]
+    assert final["results"][0]["content"] == "values of xAI"
+
+
+def test_job_completes_when_its_channel_is_full(client, fake_jobs, monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "queues", LocalMessageQueue(spill_dir=str(tmp_path / "spill"), max_messages=1))
+    client.post("/push", params={"channel": "board"}, json={"type": "addSticker", "topicTitle": "General",
+                                                           "content": "waiting"})
+
+    job_id = client.post("/send_job", json={**JOB_REQUEST, "channel": "board"}).json()["job_id"]
+    result, = wait_for_jobs(client, [job_id])
+
+    assert result["status"] == "completed", result["error"]
+    assert result["results"][0]["content"] == "values of xAI"
+    assert server.jobs.get(job_id)["dropped_messages"] == len(result["results"])
+    assert [m["content"] for m in client.get("/poll", params={"channel": "board"}).json()] == ["waiting"]
+
+
+def test_sinks_fill_the_queue(client):
+    from core.sinks import HttpSink, QueueSink
+
+    messages = [{"type": "addSticker", "topicTitle": "General", "content": str(i)} for i in range(5)]
+    posts = []
+    post = client.post
+    client.post = lambda *args, **kwargs: posts.append(args) or post(*args, **kwargs)
+
+    HttpSink("http://testserver/", max_batch_size=2, session=client)(messages[:3])
+    QueueSink()(messages[3:])
+
+    assert posts == [("http://testserver/push_batch",)] * 2
+    assert [m["content"] for m in client.get("/poll").json()] == ["0", "1", "2", "3", "4"]
+
+
+def test_push_batch_and_bulk_poll(client):
+    batch = [{"type": "addSticker", "topicTitle": "General", "content": str(i)} for i in range(120)]
+
+    response = client.post("/push_batch", content=json.dumps(batch), headers={"content-type": "application/json"})
+    assert response.json() == {"status": "ok", "count": 120, "queue_size": 120}
+
+    assert [m["content"] for m in client.get("/peek", params={"limit": 2}).json()] == ["0", "1"]
+    first = client.get("/poll", params={"limit": 100})
+    assert first.headers["content-type"] == "application/json"
+    assert [m["content"] for m in first.json()] == [str(i) for i in range(100)]
+    assert first.json()[0]["color"] is None
+    assert len(client.get("/poll", params={"limit": 100}).json()) == 20
+
+
+def test_push_batch_rejects_invalid_messages(client):
+    response = client.post("/push_batch", json=[{"type": "addSticker", "topicTitle": "ok"}, {"type": "addSticker"}])
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == [1, "topicTitle"]
+    assert client.get("/poll").json() == []
+
+
+def test_poll_lease_and_ack(client):
+    client.post("/push_batch", params={"channel": "board-1"},
+                json=[{"type": "addSticker", "topicTitle": "General", "content": str(i)} for i in range(3)])
+    client.post("/push", json={"type": "addSticker", "topicTitle": "General", "content": "other"})
+
+    response = client.get("/poll", params={"channel": "board-1", "lease": 30})
+    assert [m["content"] for m in response.json()] == ["0", "1", "2"]
+    assert client.get("/poll", params={"channel": "board-1"}).json() == []
+
+    lease_id = response.headers["X-Lease-Id"]
+    assert client.post("/ack", params={"channel": "board-1", "lease_id": lease_id}).json() == {"status": "ok"}
+    assert client.post("/ack", params={"channel": "board-1", "lease_id": lease_id}).status_code == 404
+    assert [m["content"] for m in client.get("/poll").json()] == ["other"]